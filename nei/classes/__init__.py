@@ -3,3 +3,13 @@ from .eigenclass import *
 
 from .nei import *
 from .eigenvaluetable import *
+from .eigencache import *
+from .eigenregistry import *
+from .ratedata import *
+from .eigenshare import *
+from .propagator import *
+from .packed import *
+from .ensemble import *
+from .runner import *
+from .stream import *
+from .h5output import *
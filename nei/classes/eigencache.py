@@ -0,0 +1,167 @@
+"""
+A versioned on-disk cache for the tables computed by
+`~nei.classes.eigenvaluetable.EigenData2`.
+
+Each cache file holds the temperature grid, the ionization and
+recombination rates, the equilibrium charge states, and the
+eigenvalues, eigenvectors, and eigenvector inverses for one element.
+Files are keyed by the cache format version, the atomic number, the
+eigensolver, and a SHA-256 hash of the ionization and recombination
+rate file, so that changing the rate file automatically invalidates the
+cached tables and the tables of different solvers are kept apart.
+"""
+
+import glob
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+__all__ = [
+    'default_cache_dir',
+    'rate_file_hash',
+    'cache_filename',
+    'load_eigen_tables',
+    'save_eigen_tables',
+    'clear_eigen_cache',
+]
+
+# Increment this whenever the contents or the meaning of the cached
+# arrays change so that stale files are ignored.
+_CACHE_VERSION = 2
+
+_TABLE_NAMES = (
+    'temperature_grid',
+    'ionization_rate',
+    'recombination_rate',
+    'equilibrium_states',
+    'eigenvalues',
+    'eigenvectors',
+    'eigenvector_inverses',
+)
+
+# Hashes of rate files keyed by (path, size, modification time) so that
+# each file is only read and hashed once per process.
+_rate_file_hashes = {}
+
+
+def default_cache_dir() -> str:
+    """
+    Return the directory used for cached eigenvalue tables.
+
+    This is the value of the ``NEI_CACHE_DIR`` environment variable if
+    it is set, and ``~/.nei/cache`` otherwise.
+    """
+    cache_dir = os.environ.get('NEI_CACHE_DIR')
+    if not cache_dir:
+        cache_dir = os.path.join('~', '.nei', 'cache')
+    return os.path.expanduser(cache_dir)
+
+
+def rate_file_hash(filename: str) -> str:
+    """Return the SHA-256 hex digest of the rate file ``filename``."""
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    key = (filename, stat.st_size, stat.st_mtime_ns)
+
+    if key not in _rate_file_hashes:
+        sha = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        _rate_file_hashes[key] = sha.hexdigest()
+
+    return _rate_file_hashes[key]
+
+
+def cache_filename(rate_file: str, atomic_number: int, cache_dir=None,
+                   solver='eig') -> str:
+    """
+    Return the path of the cache file for the element with atomic
+    number ``atomic_number`` computed from ``rate_file`` by ``solver``.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    digest = rate_file_hash(rate_file)
+    basename = (f"eigen_v{_CACHE_VERSION}_Z{atomic_number:02d}_"
+                f"{solver}_{digest[:16]}.npz")
+    return os.path.join(cache_dir, basename)
+
+
+def load_eigen_tables(rate_file: str, atomic_number: int, cache_dir=None,
+                      solver='eig'):
+    """
+    Load cached eigenvalue tables.
+
+    Returns
+    -------
+    tables: dict or None
+        A dictionary of arrays keyed by table name, or `None` if no
+        valid cache file exists.  Cache files that are unreadable,
+        were written by a different cache version, or were computed
+        from a different rate file or by a different solver are ignored.
+    """
+    path = cache_filename(rate_file, atomic_number, cache_dir, solver)
+    if not os.path.isfile(path):
+        return None
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['cache_version']) != _CACHE_VERSION \
+                    or str(data['rate_hash']) != rate_file_hash(rate_file) \
+                    or int(data['atomic_number']) != atomic_number \
+                    or str(data['solver']) != solver:
+                return None
+            return {name: data[name] for name in _TABLE_NAMES}
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def save_eigen_tables(tables: dict, rate_file: str, atomic_number: int,
+                      cache_dir=None, solver='eig') -> str:
+    """
+    Atomically write eigenvalue tables to the cache and return the path
+    of the cache file.
+
+    The tables are written to a temporary file in the cache directory
+    which is then renamed over the final path, so concurrent readers
+    never see a partially written file.
+    """
+    path = cache_filename(rate_file, atomic_number, cache_dir, solver)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(
+                f,
+                cache_version=_CACHE_VERSION,
+                rate_hash=rate_file_hash(rate_file),
+                atomic_number=atomic_number,
+                solver=solver,
+                **{name: tables[name] for name in _TABLE_NAMES},
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return path
+
+
+def clear_eigen_cache(cache_dir=None) -> int:
+    """
+    Remove all cached eigenvalue tables from ``cache_dir`` and return
+    the number of files removed.
+    """
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    removed = 0
+    for path in glob.glob(os.path.join(cache_dir, 'eigen_v*_Z*_*.npz')):
+        os.remove(path)
+        removed += 1
+    return removed
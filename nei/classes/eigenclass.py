@@ -1,8 +1,137 @@
-from scipy.io import FortranFile
+import os
+
 import numpy as np
 import astropy.units as u
+from plasmapy import atomic
 from .. import __path__
 
+# The contents of the unformatted Fortran eigenvalue tables, in order,
+# after the record containing the number of temperatures and the atomic
+# number.
+_EIGEN_DAT_RECORDS = (
+    'temperature_grid',
+    'equilibrium_states',
+    'eigenvalues',
+    'eigenvectors',
+    'eigenvector_inverses',
+    'ionization_rate',
+    'recombination_rate',
+)
+
+# Tables whose file names do not follow the <symbol>eigen.dat pattern
+_EIGEN_DAT_FILENAMES = {'Cl': 'Cieigen.dat'}
+
+
+def eigen_dat_filename(element) -> str:
+    """Return the path of the Chianti 8 eigenvalue table distributed
+    with this package for ``element``."""
+    symbol = atomic.atomic_symbol(element)
+    basename = _EIGEN_DAT_FILENAMES.get(symbol, symbol.lower() + 'eigen.dat')
+    return os.path.join(__path__[0], 'data', 'eigenvaluetables', 'chianti8',
+                        basename)
+
+
+def _fortran_records(filename):
+    """
+    Return the byte order of the sequential unformatted Fortran file
+    ``filename`` and the ``(offset, nbytes)`` of the payload of each of
+    its records, checking that the leading and trailing record markers
+    agree.
+    """
+    size = os.path.getsize(filename)
+    with open(filename, 'rb') as f:
+        # The first record holds two 4-byte integers
+        first = f.read(4)
+        for byteorder in '<>':
+            if np.frombuffer(first, dtype=byteorder + 'i4')[0] == 8:
+                break
+        else:
+            raise ValueError(f"{filename} is not a Fortran eigenvalue table.")
+        marker = np.dtype(byteorder + 'i4')
+
+        records = []
+        position = 0
+        while position < size:
+            f.seek(position)
+            nbytes = int(np.frombuffer(f.read(4), dtype=marker)[0])
+            f.seek(position + 4 + nbytes)
+            trailer = f.read(4)
+            if len(trailer) != 4 \
+                    or int(np.frombuffer(trailer, dtype=marker)[0]) != nbytes:
+                raise ValueError(
+                    f"Inconsistent record markers in {filename} at byte "
+                    f"{position}.")
+            records.append((position + 4, nbytes))
+            position += nbytes + 8
+
+    return byteorder, records
+
+
+def read_eigen_dat(filename, mmap=True) -> dict:
+    """
+    Read a Chianti 8 eigenvalue table written by the Fortran version of
+    the code.
+
+    The record markers are parsed once, and each block of the file is
+    then exposed as a read-only `~numpy.memmap`, so no data are read
+    until they are used.
+
+    Parameters
+    ----------
+    filename : `str`
+        The name of the ``*eigen.dat`` file.
+
+    mmap : `bool`, optional
+        If `True` (the default), return memory-mapped arrays.  If
+        `False`, read the arrays into memory.
+
+    Returns
+    -------
+    tables : `dict`
+        The ``ntemp`` and ``atomic_numb`` integers and the arrays named
+        in ``_EIGEN_DAT_RECORDS``, with the shapes used by
+        `~nei.classes.eigenclass.EigenData`.  The eigenvector arrays
+        are in the order of the Fortran version, which is the transpose
+        of the order used by
+        `~nei.classes.eigenvaluetable.EigenData2`.
+    """
+    byteorder, records = _fortran_records(filename)
+    if len(records) != len(_EIGEN_DAT_RECORDS) + 1:
+        raise ValueError(f"Unexpected number of records in {filename}.")
+
+    header_offset, _ = records[0]
+    with open(filename, 'rb') as f:
+        f.seek(header_offset)
+        ntemp, atomic_numb = (int(i) for i in
+                              np.frombuffer(f.read(8), dtype=byteorder + 'i4'))
+    nstates = atomic_numb + 1
+
+    shapes = {
+        'temperature_grid': (ntemp,),
+        'equilibrium_states': (ntemp, nstates),
+        'eigenvalues': (ntemp, nstates),
+        'eigenvectors': (ntemp, nstates, nstates),
+        'eigenvector_inverses': (ntemp, nstates, nstates),
+        'ionization_rate': (ntemp, nstates),
+        'recombination_rate': (ntemp, nstates),
+    }
+
+    dtype = np.dtype(byteorder + 'f8')
+    tables = {'ntemp': ntemp, 'atomic_numb': atomic_numb}
+    for name, (offset, nbytes) in zip(_EIGEN_DAT_RECORDS, records[1:]):
+        shape = shapes[name]
+        if nbytes != dtype.itemsize * np.prod(shape):
+            raise ValueError(f"Unexpected size of {name} in {filename}.")
+        if mmap:
+            tables[name] = np.memmap(filename, dtype=dtype, mode='r',
+                                     offset=offset, shape=shape)
+        else:
+            tables[name] = np.fromfile(filename, dtype=dtype,
+                                       count=int(np.prod(shape)),
+                                       offset=offset).reshape(shape)
+
+    return tables
+
 
 class EigenData:
     """A class to contain eigenvalue and eigenvector information on the
@@ -14,39 +143,26 @@ class EigenData:
         self._element = element
         self._temperature = temperature
 
-        if self._temperature:
-            self._index = self._get_temperature_index(temperature)
-
-        data_dir = __path__[0] + '/data/eigenvaluetables/chianti8/'
-        filename = data_dir + element.lower() + 'eigen.dat'
-        eigenfile = FortranFile(filename, 'r')
+        tables = read_eigen_dat(eigen_dat_filename(element))
 
-        ntemp, atomic_numb = eigenfile.read_ints(np.int32)
+        ntemp = tables['ntemp']
+        atomic_numb = tables['atomic_numb']
         nstates = atomic_numb + 1
 
         self._ntemp = ntemp
         self._atomic_numb = atomic_numb
         self._nstates = nstates
 
-        self._temperature_grid = eigenfile.read_reals(np.float64)
+        self._temperature_grid = tables['temperature_grid']
+        self._equilibrium_states = tables['equilibrium_states']
+        self._eigenvalues = tables['eigenvalues']
+        self._eigenvectors = tables['eigenvectors']
+        self._eigenvector_inverses = tables['eigenvector_inverses']
+        self._ionization_rate = tables['ionization_rate']
+        self._recombination_rate = tables['recombination_rate']
 
-        self._equilibrium_states = \
-            eigenfile.read_reals(np.float64).reshape((ntemp, nstates))
-
-        self._eigenvalues = \
-            eigenfile.read_reals(np.float64).reshape((ntemp, nstates))
-
-        self._eigenvectors = \
-            eigenfile.read_reals(np.float64).reshape(ntemp, nstates, nstates)
-
-        self._eigenvector_inverses = \
-            eigenfile.read_reals(np.float64).reshape(ntemp, nstates, nstates)
-
-        self._ionization_rate = \
-            eigenfile.read_reals(np.float64).reshape((ntemp, nstates))
-
-        self._recombination_rate = \
-            eigenfile.read_reals(np.float64).reshape((ntemp, nstates))
+        if self._temperature:
+            self._index = self._get_temperature_index(temperature)
 
     def _get_temperature_index(self, T_e):
         """Returns the temperature index closest to a particular
@@ -104,7 +220,7 @@ class EigenData:
         """Returns the inverses of the eigenvectors for the ionization and
         recombination rates for the temperature specified in the class."""
         if self.temperature:
-            return self.eigenvector_inverses[self._index, :, :]
+            return self._eigenvector_inverses[self._index, :, :]
         else:
             raise AttributeError("The temperature has not been set.")
 
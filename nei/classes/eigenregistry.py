@@ -0,0 +1,212 @@
+"""
+A process-wide registry of shared `~nei.classes.eigenvaluetable.EigenData2`
+instances.
+"""
+
+import collections
+import os
+import threading
+
+from plasmapy import atomic
+
+from .eigenvaluetable import EigenData2
+from .ratedata import default_rate_file, read_rates_for_elements
+
+__all__ = ['EigenDataRegistry', 'eigen_registry', 'get_eigendata']
+
+
+class EigenDataRegistry:
+    """
+    A registry that shares one read-only
+    `~nei.classes.eigenvaluetable.EigenData2` instance per element and
+    rate file.
+
+    Tables are built on first request and kept until the total memory
+    used by the registry exceeds `max_bytes`, at which point the least
+    recently used tables are evicted.  Tables registered with `add` are
+    pinned by default: they are backed by shared memory or
+    memory-mapped files, which evicting them would not free, so they
+    are never evicted and do not count toward `max_bytes`.
+
+    Parameters
+    ----------
+    max_bytes : `int`, optional
+        The memory budget of the registry in bytes, or `None` for no
+        limit.  Defaults to 512 MiB.
+
+    cache : `bool`, optional
+        Whether tables are loaded from and saved to the on-disk cache
+        when they are built.  Defaults to `False`.
+
+    cache_dir : `str`, optional
+        The directory of the on-disk cache.
+
+    Examples
+    --------
+    >>> registry = EigenDataRegistry(max_bytes=64 * 2 ** 20)
+    >>> registry.preload(['H', 'He', 'O'])
+    >>> registry.get('He') is registry.get(2)
+    True
+    >>> registry.clear()
+
+    Notes
+    -----
+    The arrays of shared tables are read-only.  Because the same
+    instance is returned to every caller, the ``temperature`` attribute
+    of a shared table should not be set; pass ``T_e`` or ``T_e_index``
+    to its methods instead.
+    """
+
+    def __init__(self, max_bytes=512 * 2 ** 20, cache=False, cache_dir=None):
+        self._tables = collections.OrderedDict()
+        self._pinned = set()
+        self._lock = threading.RLock()
+        self.max_bytes = max_bytes
+        self.cache = cache
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def _key(element, rate_file):
+        if rate_file is None:
+            rate_file = default_rate_file()
+        return atomic.atomic_number(element), os.path.abspath(rate_file)
+
+    @property
+    def max_bytes(self):
+        """The memory budget of the registry in bytes, or `None`."""
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, value):
+        if value is not None and value < 0:
+            raise ValueError("max_bytes must be non-negative or None.")
+        with self._lock:
+            self._max_bytes = value
+            self._evict()
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the tables in the registry that
+        count toward `max_bytes`, which excludes the pinned tables."""
+        with self._lock:
+            return sum(table.nbytes for key, table in self._tables.items()
+                       if key not in self._pinned)
+
+    def get(self, element, rate_file=None, rates=None) -> EigenData2:
+        """
+        Return the shared table for ``element`` computed from
+        ``rate_file``, building it if it is not in the registry.
+        ``rates`` may supply the rates of ``element`` that have already
+        been read from ``rate_file``.
+        """
+        key = self._key(element, rate_file)
+        with self._lock:
+            if key in self._tables:
+                self._tables.move_to_end(key)
+                return self._tables[key]
+
+            table = EigenData2(
+                element=atomic.atomic_symbol(key[0]),
+                cache=self.cache,
+                cache_dir=self.cache_dir,
+                rate_file=key[1],
+                rates=rates,
+            )
+            table.set_read_only()
+            self._tables[key] = table
+            self._pinned.discard(key)
+            self._evict(keep=key)
+            return table
+
+    def add(self, table: EigenData2, rate_file=None, pinned=True):
+        """
+        Add an existing table, such as one backed by shared memory, to
+        the registry.  The arrays of the table are made read-only.
+
+        The table is registered for the rate file it was computed from
+        unless another ``rate_file`` is given, in which case it is
+        returned in place of the tables computed from ``rate_file``.
+        Unless ``pinned`` is `False`, the table is never evicted and
+        does not count toward `max_bytes`.
+        """
+        if rate_file is None:
+            rate_file = table.rate_file
+        key = self._key(table._atomic_numb, rate_file)
+        table.set_read_only()
+        with self._lock:
+            self._tables[key] = table
+            self._tables.move_to_end(key)
+            if pinned:
+                self._pinned.add(key)
+            else:
+                self._pinned.discard(key)
+            self._evict(keep=key)
+
+    def preload(self, elements, rate_file=None):
+        """
+        Build the tables for each of ``elements`` ahead of time.  The
+        rates of all elements that are not yet in the registry are read
+        while opening the rate file once.
+        """
+        missing = [element for element in elements
+                   if self._key(element, rate_file) not in self._tables]
+        if missing and not self.cache:
+            rates = read_rates_for_elements(missing, rate_file)
+        else:
+            rates = {}
+        for element in elements:
+            self.get(element, rate_file=rate_file, rates=rates.get(element))
+
+    def preload_eigen_dat(self, elements, rate_file=None):
+        """
+        Register the precomputed Chianti 8 tables of the Fortran version
+        for each of ``elements``, in place of the tables computed from
+        ``rate_file``, so that no eigenvalues need to be computed.
+
+        The precomputed tables are memory-mapped and use their own
+        temperature grid.  See
+        `~nei.classes.eigenvaluetable.EigenData2.from_eigen_dat`.
+        """
+        if rate_file is None:
+            rate_file = default_rate_file()
+        for element in elements:
+            self.add(EigenData2.from_eigen_dat(element), rate_file=rate_file)
+
+    def clear(self):
+        """Remove all tables from the registry."""
+        with self._lock:
+            self._tables.clear()
+            self._pinned.clear()
+
+    def _evict(self, keep=None):
+        """Evict the least recently used tables until the registry is
+        within its memory budget, never evicting ``keep`` or the pinned
+        tables."""
+        if self._max_bytes is None:
+            return
+        total = self.nbytes
+        for key in list(self._tables):
+            if total <= self._max_bytes:
+                break
+            if key == keep or key in self._pinned:
+                continue
+            total -= self._tables.pop(key).nbytes
+
+    def __contains__(self, element):
+        key = self._key(element, None)
+        with self._lock:
+            return key in self._tables
+
+    def __len__(self):
+        return len(self._tables)
+
+
+eigen_registry = EigenDataRegistry()
+
+
+def get_eigendata(element, rate_file=None) -> EigenData2:
+    """
+    Return the shared `~nei.classes.eigenvaluetable.EigenData2`
+    instance for ``element`` from the process-wide registry.
+    """
+    return eigen_registry.get(element, rate_file=rate_file)
@@ -0,0 +1,235 @@
+"""
+Share `~nei.classes.eigenvaluetable.EigenData2` tables between processes
+without copying them.
+
+Tables may either be exported once to a directory of ``.npy`` files
+that every process memory-maps, or published in a single block of
+`multiprocessing.shared_memory`.  In both cases the operating system
+keeps one physical copy of the arrays per node, and each process only
+creates read-only views.
+"""
+
+import json
+import os
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+from plasmapy import atomic
+
+from .eigencache import _TABLE_NAMES
+from .eigenregistry import eigen_registry
+from .eigenvaluetable import EigenData2
+
+__all__ = [
+    'export_eigen_tables',
+    'open_exported_tables',
+    'SharedEigenTables',
+]
+
+_MANIFEST = 'manifest.json'
+
+
+def _get_tables(elements, rate_file=None):
+    """Return the registry's tables for ``elements`` keyed by symbol."""
+    eigen_registry.preload(elements, rate_file=rate_file)
+    return {
+        atomic.atomic_symbol(element):
+            eigen_registry.get(element, rate_file=rate_file)
+        for element in elements
+    }
+
+
+def export_eigen_tables(directory, elements, rate_file=None):
+    """
+    Export the tables of ``elements`` to ``directory`` in a format that
+    can be memory-mapped by `open_exported_tables`.
+
+    Each array is written to its own uncompressed ``.npy`` file, and a
+    ``manifest.json`` file records the elements and the rate file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    tables = _get_tables(elements, rate_file)
+
+    for symbol, table in tables.items():
+        for name, array in table._tables().items():
+            np.save(os.path.join(directory, f"{symbol}_{name}.npy"), array)
+
+    manifest = {
+        'elements': list(tables),
+        'rate_file': next(iter(tables.values())).rate_file,
+    }
+    tmp_path = os.path.join(directory, _MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, os.path.join(directory, _MANIFEST))
+
+
+def open_exported_tables(directory, register=True) -> dict:
+    """
+    Memory-map tables exported by `export_eigen_tables`.
+
+    Parameters
+    ----------
+    directory : `str`
+        The directory containing the exported tables.
+
+    register : `bool`, optional
+        If `True` (the default), add the tables to the process-wide
+        registry so that `~nei.classes.nei.NEI` instances use them.
+
+    Returns
+    -------
+    tables : `dict`
+        Read-only `~nei.classes.eigenvaluetable.EigenData2` instances
+        keyed by element symbol.
+    """
+    with open(os.path.join(directory, _MANIFEST)) as f:
+        manifest = json.load(f)
+
+    tables = {}
+    for symbol in manifest['elements']:
+        arrays = {
+            name: np.load(os.path.join(directory, f"{symbol}_{name}.npy"),
+                          mmap_mode='r')
+            for name in _TABLE_NAMES
+        }
+        tables[symbol] = EigenData2.from_tables(
+            symbol, arrays, rate_file=manifest['rate_file'])
+        if register:
+            eigen_registry.add(tables[symbol])
+
+    return tables
+
+
+def _attach_shared_memory(name):
+    """
+    Attach to an existing shared memory block without letting this
+    process's resource tracker unlink it when the process exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always registers the block with the tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedEigenTables:
+    """
+    Publish the tables of several elements in one block of shared memory.
+
+    The publishing process creates the block and passes the picklable
+    `descriptor` to its workers, for example through the initializer of
+    a `multiprocessing.Pool`.  Each worker then calls `attach` to create
+    read-only `~nei.classes.eigenvaluetable.EigenData2` views of the
+    block.
+
+    Parameters
+    ----------
+    elements : `list`
+        The element symbols or atomic numbers to publish.
+
+    rate_file : `str`, optional
+        The rate file from which the tables are computed.
+
+    Examples
+    --------
+    >>> from multiprocessing import Pool
+    >>> shared = SharedEigenTables(['H', 'He', 'O'])
+    >>> with Pool(4, initializer=SharedEigenTables.attach,
+    ...           initargs=(shared.descriptor,)) as pool:
+    ...     pass  # run NEI simulations
+    >>> shared.unlink()
+
+    Notes
+    -----
+    The publisher owns the shared memory block and must call `unlink`
+    once all workers are done, or use the instance as a context manager.
+    """
+
+    def __init__(self, elements, rate_file=None):
+        tables = _get_tables(elements, rate_file)
+
+        layout = []
+        offset = 0
+        for symbol, table in tables.items():
+            for name, array in table._tables().items():
+                # Align every array to 64 bytes
+                offset = -(-offset // 64) * 64
+                layout.append(
+                    (symbol, name, array.dtype.str, array.shape, offset))
+                offset += array.nbytes
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for symbol, name, dtype, shape, offset in layout:
+            view = np.ndarray(shape, dtype=dtype, buffer=self._shm.buf,
+                              offset=offset)
+            view[...] = tables[symbol]._tables()[name]
+
+        self._descriptor = {
+            'name': self._shm.name,
+            'rate_file': next(iter(tables.values())).rate_file,
+            'layout': layout,
+        }
+
+    @property
+    def descriptor(self) -> dict:
+        """A picklable description of the shared memory block."""
+        return self._descriptor
+
+    @staticmethod
+    def attach(descriptor, register=True) -> dict:
+        """
+        Create read-only views of published tables.
+
+        Parameters
+        ----------
+        descriptor : `dict`
+            The `descriptor` of a `SharedEigenTables` instance.
+
+        register : `bool`, optional
+            If `True` (the default), add the tables to the process-wide
+            registry so that `~nei.classes.nei.NEI` instances use them.
+
+        Returns
+        -------
+        tables : `dict`
+            `~nei.classes.eigenvaluetable.EigenData2` instances keyed by
+            element symbol.
+        """
+        shm = _attach_shared_memory(descriptor['name'])
+
+        arrays = {}
+        for symbol, name, dtype, shape, offset in descriptor['layout']:
+            view = np.ndarray(tuple(shape), dtype=dtype, buffer=shm.buf,
+                              offset=offset)
+            view.flags.writeable = False
+            arrays.setdefault(symbol, {})[name] = view
+
+        tables = {}
+        for symbol, table_arrays in arrays.items():
+            table = EigenData2.from_tables(
+                symbol, table_arrays, rate_file=descriptor['rate_file'])
+            # The views are only valid while the block stays mapped
+            table._shared_memory = shm
+            tables[symbol] = table
+            if register:
+                eigen_registry.add(table)
+
+        return tables
+
+    def close(self):
+        """Close the publisher's mapping of the shared memory block."""
+        self._shm.close()
+
+    def unlink(self):
+        """Close and destroy the shared memory block."""
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unlink()
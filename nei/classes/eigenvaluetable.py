@@ -2,12 +2,14 @@
 # -*- coding: utf-8 -*-
 """The EigenData2 class."""
 
+import math
 import warnings
 import numpy as np
 from numpy import linalg as LA
 from plasmapy import atomic
-from .. import __path__
-import h5py
+from .eigencache import load_eigen_tables, save_eigen_tables
+from .ratedata import default_rate_file, read_rates
+from .eigenclass import eigen_dat_filename, read_eigen_dat
 
 
 class EigenData2:
@@ -21,6 +23,43 @@ class EigenData2:
         A string representing a element symbol. The defaut value
         is for Hydrogen.
 
+    cache : `bool`, optional
+        If `True`, load the tables from the on-disk cache when a valid
+        cache file exists, and compute and save them to the cache
+        otherwise.  Cache files are keyed by a hash of the ionization
+        and recombination rate file, so they are invalidated
+        automatically when the rates change.  Defaults to `False`.
+
+    cache_dir : `str`, optional
+        The directory containing cached tables.  Defaults to the
+        ``NEI_CACHE_DIR`` environment variable if set, and to
+        ``~/.nei/cache`` otherwise.
+
+    rate_file : `str`, optional
+        The HDF5 file containing the ionization and recombination
+        rates.  Defaults to the Chianti 8.07 rates distributed with
+        this package.
+
+    rates : `tuple`, optional
+        The ``(temperature_grid, ionization_rate, recombination_rate)``
+        of this element already read from ``rate_file`` by
+        `~nei.classes.ratedata.read_rates_for_elements`, in which case
+        the rate file is not opened again.
+
+    lazy : `bool`, optional
+        If `True`, the eigenvalues, eigenvectors, and eigenvector
+        inverses at each temperature are computed and memoized the
+        first time they are accessed, instead of for the whole grid up
+        front.  Tables computed lazily are not saved to the on-disk
+        cache.  Defaults to `False`.
+
+    temperature_window : `tuple`, optional
+        The ``(T_min, T_max)`` range of temperatures in kelvin to be
+        covered.  The table is restricted to the grid temperatures
+        spanning this range, so the work and memory of the table are
+        bounded up front.  Temperatures outside of the window are
+        treated like temperatures outside of the full grid.
+
     Raises:
     ----------
 
@@ -54,38 +93,204 @@ class EigenData2:
 
     """
 
-    def __init__(self, element='H'):
+    def __init__(self, element='H', cache=False, cache_dir=None,
+                 rate_file=None, rates=None, lazy=False,
+                 temperature_window=None, solver='eig'):
         """Read in the """
 
+        if solver not in _SOLVERS:
+            raise ValueError(
+                f"solver must be one of {sorted(_SOLVERS)}, not {solver!r}.")
+
         self._element = element
         self._temperature = None
+        self._computed = None
+        self._solver = solver
+        self._out_of_range_counts = {'below': 0, 'above': 0}
+
+        filename = rate_file if rate_file is not None else default_rate_file()
+        self._rate_file = filename
+
+        atomic_numb = atomic.atomic_number(element)
 
         #
-        # 1. Read ionization and recombination rates
+        # A warm start only has to load the arrays from the cache
         #
-        data_dir = __path__[0] + '/data/ionizrecombrates/chianti_8.07/'
-        filename = data_dir + 'ionrecomb_rate.h5'
-        f = h5py.File(filename, 'r')
+        tables = None
+        if cache:
+            tables = load_eigen_tables(filename, atomic_numb, cache_dir, solver)
+
+        if tables is None:
+            self._compute_tables(filename, atomic_numb, rates,
+                                 lazy=lazy,
+                                 temperature_window=temperature_window)
+            if cache and not lazy and temperature_window is None:
+                try:
+                    save_eigen_tables(
+                        self._tables(), filename, atomic_numb, cache_dir, solver)
+                except OSError as exc:
+                    warnings.warn(
+                        f"Unable to write eigenvalue table cache for "
+                        f"{element}: {exc}", UserWarning)
+        else:
+            if temperature_window is not None:
+                window = _window_slice(tables['temperature_grid'],
+                                       temperature_window)
+                tables = {name: array[window]
+                          for name, array in tables.items()}
+            self._set_tables(tables)
+
+    @classmethod
+    def from_tables(cls, element, tables, rate_file=None):
+        """
+        Create an instance from precomputed arrays without reading the
+        rate file or computing any eigenvalues.
+
+        Parameters
+        ----------
+        element : `str` or `int`
+            The element symbol or atomic number.
+
+        tables : `dict`
+            The ``temperature_grid``, ``ionization_rate``,
+            ``recombination_rate``, ``equilibrium_states``,
+            ``eigenvalues``, ``eigenvectors``, and
+            ``eigenvector_inverses`` arrays.  The arrays are used
+            without copying, so they may be memory-mapped or live in
+            shared memory.
+
+        rate_file : `str`, optional
+            The rate file from which the arrays were computed.
+        """
+        table = cls.__new__(cls)
+        table._element = element
+        table._temperature = None
+        table._solver = 'eig'
+        table._out_of_range_counts = {'below': 0, 'above': 0}
+        table._rate_file = rate_file if rate_file is not None \
+            else default_rate_file()
+        table._set_tables(tables)
+        return table
+
+    @classmethod
+    def from_eigen_dat(cls, element, filename=None):
+        """
+        Create an instance backed by a precomputed Chianti 8 eigenvalue
+        table from the Fortran version of the code.
+
+        The blocks of the file are memory-mapped, so no eigenvalues are
+        computed and only the temperatures that are used are read.  The
+        tables use the temperature grid stored in the file.
+
+        Parameters
+        ----------
+        element : `str` or `int`
+            The element symbol or atomic number.
+
+        filename : `str`, optional
+            The ``*eigen.dat`` file.  Defaults to the table for
+            ``element`` distributed with this package.
+
+        Examples
+        --------
+        >>> table = EigenData2.from_eigen_dat('O')
+        >>> table.equilibrium_state(T_e=1e6).shape
+        (9,)
+        """
+        if filename is None:
+            filename = eigen_dat_filename(element)
+        dat = read_eigen_dat(filename)
+        if dat['atomic_numb'] != atomic.atomic_number(element):
+            raise ValueError(f"{filename} does not contain the table "
+                             f"for {element}.")
+
+        # The Fortran version stores the eigenvectors transposed
+        tables = {name: dat[name] for name in (
+            'temperature_grid', 'ionization_rate', 'recombination_rate',
+            'equilibrium_states', 'eigenvalues')}
+        tables['eigenvectors'] = dat['eigenvectors'].transpose(0, 2, 1)
+        tables['eigenvector_inverses'] = \
+            dat['eigenvector_inverses'].transpose(0, 2, 1)
+
+        return cls.from_tables(element, tables, rate_file=filename)
 
-        atomic_numb = atomic.atomic_number(element)
-        nstates = atomic_numb + 1
+    @property
+    def rate_file(self):
+        """The file containing the ionization and recombination rates."""
+        return self._rate_file
 
-        self._temperature_grid = f['te_gird'][:]
-        ntemp = len(self._temperature_grid)
-        c_ori = f['ioniz_rate'][:]
-        r_ori = f['recomb_rate'][:]
-        f.close()
+    @property
+    def nbytes(self):
+        """The number of bytes used by the arrays of this table."""
+        arrays = (
+            self._temperature_grid, self._ionization_rate,
+            self._recombination_rate, self._equilibrium_states,
+            self._eigenvalues, self._eigenvectors, self._eigenvector_inverses,
+        )
+        return sum(array.nbytes for array in arrays)
+
+    def set_read_only(self):
+        """Make the arrays of this table read-only so that the table
+        can be safely shared."""
+        for array in self._tables().values():
+            array.flags.writeable = False
+
+    def _tables(self):
+        """Return the arrays that define this table, keyed by name.  Any
+        lazily computed temperatures that are missing are computed."""
+        if self._computed is not None:
+            self._decompose(np.arange(self._ntemp))
+        return {
+            'temperature_grid': self._temperature_grid,
+            'ionization_rate': self._ionization_rate,
+            'recombination_rate': self._recombination_rate,
+            'equilibrium_states': self._equilibrium_states,
+            'eigenvalues': self._eigenvalues,
+            'eigenvectors': self._eigenvectors,
+            'eigenvector_inverses': self._eigenvector_inverses,
+        }
+
+    def _set_tables(self, tables):
+        """Set the arrays that define this table from a dictionary."""
+        self._temperature_grid = tables['temperature_grid']
+        self._ionization_rate = tables['ionization_rate']
+        self._recombination_rate = tables['recombination_rate']
+        self._equilibrium_states = tables['equilibrium_states']
+        self._eigenvalues = tables['eigenvalues']
+        self._eigenvectors = tables['eigenvectors']
+        self._eigenvector_inverses = tables['eigenvector_inverses']
+
+        self._ntemp, self._nstates = self._eigenvalues.shape
+        self._atomic_numb = self._nstates - 1
+        self._log_grid = _log_uniform_grid(self._temperature_grid)
+        self._computed = None
+        self._condition_number = None
+
+    def _compute_tables(self, filename, atomic_numb, rates=None, lazy=False,
+                        temperature_window=None):
+        """Compute the eigenvalue tables from the ionization and
+        recombination rates stored in ``filename``, or from ``rates``
+        if they have already been read."""
 
         #
-        # Ionization and recombination rate for the current element
+        # 1. Read ionization and recombination rates for the current
+        # element only
         #
-        c_rate = np.zeros((ntemp, nstates))
-        r_rate = np.zeros((ntemp, nstates))
-        for ite in range(ntemp):
-            for i in range(nstates-1):
-                c_rate[ite, i] = c_ori[i, atomic_numb-1, ite]
-            for i in range(1, nstates):
-                r_rate[ite, i] = r_ori[i-1, atomic_numb-1, ite]
+        if rates is None:
+            rates = read_rates(atomic_numb, filename)
+        temperature_grid, c_rate, r_rate = rates
+
+        if temperature_window is not None:
+            window = _window_slice(temperature_grid, temperature_window)
+            temperature_grid = temperature_grid[window]
+            c_rate = c_rate[window]
+            r_rate = r_rate[window]
+
+        self._temperature_grid = temperature_grid
+        self._log_grid = _log_uniform_grid(temperature_grid)
+        self._condition_number = None
+        nstates = atomic_numb + 1
+        ntemp = len(self._temperature_grid)
 
         #
         # 2. Definet the grid size
@@ -94,28 +299,6 @@ class EigenData2:
         self._atomic_numb = atomic_numb
         self._nstates = nstates
 
-        #
-        # Compute eigenvalues and eigenvectors
-        #
-        self._ionization_rate = np.ndarray(shape=(ntemp, nstates),
-                                           dtype=np.float64)
-
-        self._recombination_rate = np.ndarray(shape=(ntemp, nstates),
-                                              dtype=np.float64)
-
-        self._equilibrium_states = np.ndarray(shape=(ntemp, nstates),
-                                              dtype=np.float64)
-
-        self._eigenvalues = np.ndarray(shape=(ntemp, nstates),
-                                       dtype=np.float64)
-
-        self._eigenvectors = np.ndarray(shape=(ntemp, nstates, nstates),
-                                        dtype=np.float64)
-
-        self._eigenvector_inverses = np.ndarray(
-            shape=(ntemp, nstates, nstates),
-            dtype=np.float64)
-
         #
         # Save ionization and recombination rates
         #
@@ -123,99 +306,133 @@ class EigenData2:
         self._recombination_rate = r_rate
 
         #
-        # Define the coefficients matrix A. The first dimension is
-        # for elements, and the second number of equations.
+        # Equilibrium charge states over the temperature grid
         #
-        neqs = nstates
-        A = np.ndarray(shape=(nstates, neqs), dtype=np.float64)
+        self._equilibrium_states = equilibrium_charge_states(c_rate, r_rate)
 
         #
-        # Enter temperature loop over the whole temperature grid
+        # Compute eigenvalues and eigenvectors for the whole temperature
+        # grid at once, or allocate the arrays and leave the work until
+        # each temperature is first accessed.
         #
-        for ite in range(ntemp):
-            # Ionization and recombination rate at Te(ite)
-            carr = c_rate[ite, :]
-            rarr = r_rate[ite, :]
-
-            # Equilibirum
-            eqi = self._function_eqi(carr, rarr, atomic_numb)
-
-            # Initialize A to zero
-            for ion in range(nstates):
-                for jon in range(nstates):
-                    A[ion, jon] = 0.0
-
-            # Give coefficients
-            for ion in range(1, nstates-1):
-                A[ion, ion-1] = carr[ion-1]
-                A[ion, ion] = -(carr[ion]+rarr[ion])
-                A[ion, ion+1] = rarr[ion+1]
-
-            # The first row
-            A[0, 0] = -carr[0]
-            A[0, 1] = rarr[1]
-
-            # The last row
-            A[nstates-1, nstates-2] = carr[nstates-2]
-            A[nstates-1, nstates-1] = -rarr[nstates-1]
-
-            # Compute eigenvalues and eigenvectors using Scipy
-            la, v = LA.eig(A)
-
-            # Rerange the eigenvalues. Try a simple way in here.
-            idx = np.argsort(la)
-            la = la[idx]
-            v = v[:, idx]
-
-            # Compute inverse of eigenvectors
-            v_inverse = LA.inv(v)
-
-            # transpose the order to as same as the Fortran Version
-            v = v.transpose()
-            v_inverse = v_inverse.transpose()
-
-            # Save eigenvalues and eigenvectors into arrays
-            for j in range(nstates):
-                self._eigenvalues[ite, j] = la[j]
-                self._equilibrium_states[ite, j] = eqi[j]
-                for i in range(nstates):
-                    self._eigenvectors[ite, i, j] = v[i, j]
-                    self._eigenvector_inverses[ite, i, j] = v_inverse[i, j]
+        if lazy:
+            self._eigenvalues = np.empty((ntemp, nstates))
+            self._eigenvectors = np.empty((ntemp, nstates, nstates))
+            self._eigenvector_inverses = np.empty((ntemp, nstates, nstates))
+            self._computed = np.zeros(ntemp, dtype=bool)
+        else:
+            (self._eigenvalues,
+             self._eigenvectors,
+             self._eigenvector_inverses) = _SOLVERS[self._solver](c_rate, r_rate)
+
+    def _decompose(self, indices):
+        """Compute and memoize the eigensystems at the temperature
+        indices that have not been computed yet in lazy mode."""
+        if self._computed is None:
+            return
+        indices = np.unique(np.atleast_1d(indices))
+        indices = indices[~self._computed[indices]]
+        if indices.size:
+            (self._eigenvalues[indices],
+             self._eigenvectors[indices],
+             self._eigenvector_inverses[indices]) = _SOLVERS[self._solver](
+                self._ionization_rate[indices],
+                self._recombination_rate[indices])
+            self._computed[indices] = True
+            if self._computed.all():
+                self._computed = None
+
+    def _resolve_index(self, T_e, T_e_index):
+        """Return the temperature index from the arguments of the
+        accessor methods, or from the temperature set in the class."""
+        if T_e_index is not None:
+            return T_e_index
+        elif T_e is not None:
+            return self._get_temperature_index(T_e)
+        elif self._temperature is not None:
+            return self._te_index
+        else:
+            raise AttributeError("The temperature has not been set.")
 
     #
     #   The following Functions is used to obtain the eigen values and relative
     #   def properties.
     #
     def _get_temperature_index(self, T_e):
-        """Returns the temperature index closest to a particular
-        temperature."""
-        T_e_array = self._temperature_grid
+        """
+        Returns the temperature index closest to a particular
+        temperature, or an array of indices for an array of
+        temperatures.
+
+        The bracketing grid points are found directly when the grid is
+        uniform in log space, and by a binary search otherwise.
+        Temperatures outside of the grid are clamped to its boundaries
+        and counted in `out_of_range_counts`.
+        """
+        if np.ndim(T_e) == 0:
+            return self._get_scalar_temperature_index(float(T_e))
 
-        # Check the temperature range
-        T_e_grid_max = np.amax(T_e_array)
-        T_e_grid_min = np.amin(T_e_array)
-
-        if (T_e >= T_e_grid_max):
-            warnings.warn("Temperature reaches/exceeds the Temperature grid \
-                          Boundary: Temperature index will be reset \
-                          to {:}".format(self._ntemp-1), UserWarning)
-            return self._ntemp-1
-        if (T_e <= T_e_grid_min):
-            warnings.warn("Temperature reaches/exceeds the Temperature grid \
-                          Boundary: Temperature index will be reset to \
-                          {:}".format(0), UserWarning)
+        T_e_array = self._temperature_grid
+        T_e = np.asarray(T_e, dtype=float)
+
+        # Index of the grid point below each temperature
+        if self._log_grid is not None:
+            log_T_min, inverse_spacing = self._log_grid
+            with np.errstate(divide='ignore', invalid='ignore'):
+                position = (np.log(T_e) - log_T_min) * inverse_spacing
+            lower = np.floor(np.nan_to_num(
+                position, nan=-1, posinf=self._ntemp, neginf=-1))
+        else:
+            lower = np.searchsorted(T_e_array, T_e, side='left') - 1
+        lower = np.clip(lower, 0, self._ntemp - 2).astype(int)
+
+        # Pick the closer of the two neighbors, preferring the lower one
+        dte_l = np.abs(T_e - T_e_array[lower])
+        dte_r = np.abs(T_e - T_e_array[lower + 1])
+        index = np.where(dte_l <= dte_r, lower, lower + 1)
+
+        # Clamp to the boundaries of the grid
+        below = T_e <= T_e_array[0]
+        above = T_e >= T_e_array[-1]
+        self._out_of_range_counts['below'] += int(np.count_nonzero(below))
+        self._out_of_range_counts['above'] += int(np.count_nonzero(above))
+        return np.where(below, 0, np.where(above, self._ntemp - 1, index))
+
+    def _get_scalar_temperature_index(self, T_e):
+        """`_get_temperature_index` for a single temperature, avoiding
+        the overhead of array operations."""
+        T_e_array = self._temperature_grid
+        if T_e <= T_e_array[0]:
+            self._out_of_range_counts['below'] += 1
             return 0
+        if T_e >= T_e_array[-1]:
+            self._out_of_range_counts['above'] += 1
+            return self._ntemp - 1
+
+        if self._log_grid is not None:
+            log_T_min, inverse_spacing = self._log_grid
+            lower = int((math.log(T_e) - log_T_min) * inverse_spacing)
+            lower = min(max(lower, 0), self._ntemp - 2)
+        else:
+            lower = int(np.searchsorted(T_e_array, T_e, side='left')) - 1
 
-        # TODO: Add a test to check that the temperature grid is monotonic
+        if abs(T_e - T_e_array[lower]) <= abs(T_e - T_e_array[lower + 1]):
+            return lower
+        return lower + 1
 
-        res = np.where(T_e_array >= T_e)
-        res_ind = res[0]
-        index = res_ind[0]
-        dte_l = abs(T_e - T_e_array[index - 1])  # re-check the neighbor point
-        dte_r = abs(T_e - T_e_array[index])
-        if (dte_l <= dte_r):
-            index = index - 1
-        return index
+    @property
+    def out_of_range_counts(self) -> dict:
+        """
+        The number of temperatures looked up that were at or below
+        (``'below'``) or at or above (``'above'``) the boundaries of the
+        temperature grid, and were clamped to the boundary.  The counts
+        may be reset with `reset_out_of_range_counts`.
+        """
+        return dict(self._out_of_range_counts)
+
+    def reset_out_of_range_counts(self):
+        """Reset `out_of_range_counts` to zero."""
+        self._out_of_range_counts = {'below': 0, 'above': 0}
 
     @property
     def temperature(self):
@@ -239,102 +456,276 @@ class EigenData2:
     def eigenvalues(self, T_e=None, T_e_index=None):
         """Returns the eigenvalues for the ionization and recombination
         rates for the temperature specified in the class."""
-        if T_e_index:
-            return self._eigenvalues[T_e_index, :]
-        elif T_e:
-            T_e_index = self._get_temperature_index(T_e)
-            return self._eigenvalues[T_e_index, :]
-        elif self.temperature:
-            return self._eigenvalues[self._te_index, :]
-        else:
-            raise AttributeError("The temperature has not been set.")
+        T_e_index = self._resolve_index(T_e, T_e_index)
+        self._decompose(T_e_index)
+        return self._eigenvalues[T_e_index, :]
 
     def eigenvectors(self, T_e=None, T_e_index=None):
         """Returns the eigenvectors for the ionization and recombination
         rates for the temperature specified in the class."""
-        if T_e_index:
-            return self._eigenvectors[T_e_index, :, :]
-        elif T_e:
-            T_e_index = self._get_temperature_index(T_e)
-            return self._eigenvectors[T_e_index, :, :]
-        elif self.temperature:
-            return self._eigenvectors[self._te_index, :, :]
-        else:
-            raise AttributeError("The temperature has not been set.")
+        T_e_index = self._resolve_index(T_e, T_e_index)
+        self._decompose(T_e_index)
+        return self._eigenvectors[T_e_index, :, :]
 
     def eigenvector_inverses(self, T_e=None, T_e_index=None):
         """Returns the inverses of the eigenvectors for the ionization and
         recombination rates for the temperature specified in the class."""
-        if T_e_index:
-            return self._eigenvector_inverses[T_e_index, :, :]
-        elif T_e:
-            T_e_index = self._get_temperature_index(T_e)
-            return self._eigenvector_inverses[T_e_index, :, :]
-        elif self.temperature:
-            return self._eigenvector_inverses[self._te_index, :, :]
-        else:
-            raise AttributeError("The temperature has not been set.")
-
+        T_e_index = self._resolve_index(T_e, T_e_index)
+        self._decompose(T_e_index)
+        return self._eigenvector_inverses[T_e_index, :, :]
+
+    def max_condition_number(self) -> float:
+        """
+        Returns the largest condition number of the eigenvectors over the
+        temperature grid, which is computed when first requested and
+        then kept with the table.
+        """
+        if self._condition_number is None:
+            self._condition_number = float(np.linalg.cond(
+                self.eigenvectors(T_e_index=np.arange(self._ntemp))).max())
+        return self._condition_number
 
     def equilibrium_state(self, T_e=None, T_e_index=None):
         """Returns the equilibrium charge state distribution for the
         temperature specified in the class."""
-        if T_e_index:
-            return self._equilibrium_states[T_e_index, :]
-        elif T_e:
-            T_e_index = self._get_temperature_index(T_e)
-            return self._equilibrium_states[T_e_index, :]
-        elif self.temperature:
-            return self._equilibrium_states[self._te_index, :]
-        else:
-            raise AttributeError("The temperature has not been set.")
+        T_e_index = self._resolve_index(T_e, T_e_index)
+        return self._equilibrium_states[T_e_index, :]
 
-    def _function_eqi(self, ioniz_rate, recomb_rate, natom):
-        """Compute the equilibrium charge state distribution for the
-        temperature specified using ionization and recombinaiton rates."""
-        nstates = natom + 1
-        conce = np.zeros(nstates)
-        f = np.zeros(nstates + 1)
-        c = np.zeros(nstates + 1)
-        r = np.zeros(nstates + 1)
-
-        # The start index is 1.
-        for i in range(nstates):
-            c[i+1] = ioniz_rate[i]
-            r[i+1] = recomb_rate[i]
-
-        # Set f1
-        f[1] = 1.0
-        # f2 = c1*f1/r2
-        f[2] = c[1]*f[1]/r[2]
-        #
-        # For Hydrogen, the following loop is not necessary.
-        #
-        if (natom <= 1):
-            f[1] = 1.0/(1.0 + c[1]/r[2])
-            f[2] = c[1]*f[1]/r[2]
-            conce[0:2] = f[1:3]
-            return conce
 
-        #
-        # For other elements with atomic number >= 2:
-        #
-        # f(i+1) = -(c(i-1)*f(i-1) - (c(i)+r(i)*f(i)))/r(i+1)
-        for k in range(2, natom):
-            f[k+1] = (-c[k-1]*f[k-1] + (c[k]+r[k])*f[k])/r[k+1]
-
-        # f(natom+1) = c(natom)*f(natom)/r(natom+1)
-        f[natom+1] = c[natom]*f[natom]/r[natom+1]
-        # f1 = 1/sum(f(*))
-        f[1] = 1.0/np.sum(f)
-        # f2 = c1*f1/r2
-        f[2] = c[1]*f[1]/r[2]
-        # f(i+1) = -(c(i-1)*f(i-1) - (c(i)+r(i)*f(i)))/r(i+1)
-        for k in range(2, natom):
-            f[k+1] = (-c[k-1]*f[k-1] + (c[k]+r[k])*f[k])/r[k+1]
-
-        # f(natom+1) = c(natom)*f(natom)/r(natom+1)
-        f[natom+1] = c[natom]*f[natom]/r[natom+1]
-        #
-        conce[0:nstates] = f[1:nstates+1]
-        return conce
+def equilibrium_charge_states(ionization_rate, recombination_rate):
+    """
+    Compute equilibrium charge state distributions from ionization and
+    recombination rates.
+
+    In equilibrium the ionization of each charge state balances the
+    recombination of the next one, ``c[i] * f[i] = r[i+1] * f[i+1]``.
+    The ratios are accumulated in log space and normalized with the
+    log-sum-exp trick, so the result neither overflows nor underflows
+    for heavy elements at extreme temperatures.
+
+    Parameters
+    ----------
+    ionization_rate, recombination_rate : `~numpy.ndarray`
+        The rates with shape ``(..., nstates)``, for example
+        ``(ntemp, nstates)`` for a whole temperature grid.  The
+        ionization rate of the highest charge state and the
+        recombination rate of the neutral state are ignored.
+
+    Returns
+    -------
+    equilibrium_states : `~numpy.ndarray`
+        The equilibrium ionic fractions with shape ``(..., nstates)``.
+        If a rate vanishes, the charge states that cannot be reached
+        from the neutral state have zero fractions.
+
+    Examples
+    --------
+    >>> equilibrium_charge_states(np.array([[2.0, 0.0]]), np.array([[0.0, 1.0]]))
+    array([[0.33333333, 0.66666667]])
+    """
+    ionization_rate = np.asarray(ionization_rate, dtype=np.float64)
+    recombination_rate = np.asarray(recombination_rate, dtype=np.float64)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_ratio = np.log(ionization_rate[..., :-1]) \
+            - np.log(recombination_rate[..., 1:])
+
+    # Vanishing rates give infinite or undefined ratios.  Replace them
+    # with ratios large or small enough that exp() underflows to zero
+    # after normalization, while keeping the cumulative sums finite.
+    log_ratio = np.nan_to_num(
+        log_ratio, nan=-_LOG_RATIO_LIMIT,
+        posinf=_LOG_RATIO_LIMIT, neginf=-_LOG_RATIO_LIMIT)
+    np.clip(log_ratio, -_LOG_RATIO_LIMIT, _LOG_RATIO_LIMIT, out=log_ratio)
+
+    log_f = np.zeros(ionization_rate.shape)
+    np.cumsum(log_ratio, axis=-1, out=log_f[..., 1:])
+    log_f -= log_f.max(axis=-1, keepdims=True)
+
+    f = np.exp(log_f)
+    f /= f.sum(axis=-1, keepdims=True)
+    return f
+
+
+# The largest magnitude of a log ratio of ionic fractions
+_LOG_RATIO_LIMIT = 1.0e4
+
+
+def _log_uniform_grid(temperature_grid):
+    """
+    Return the logarithm of the first temperature and the inverse
+    spacing of the logarithm of ``temperature_grid`` if the grid is
+    uniform in log space, or `None` otherwise.
+    """
+    log_grid = np.log(np.asarray(temperature_grid, dtype=float))
+    spacing = np.diff(log_grid)
+    if spacing.size and np.all(spacing > 0) and \
+            np.allclose(spacing, spacing.mean(), rtol=1e-6, atol=0):
+        return log_grid[0], 1 / spacing.mean()
+    return None
+
+
+def _window_slice(temperature_grid, temperature_window):
+    """
+    Return the slice of ``temperature_grid`` that spans the
+    ``(T_min, T_max)`` temperature window, including the nearest grid
+    temperatures on either side of the window.
+    """
+    T_min, T_max = temperature_window
+    if not T_min < T_max:
+        raise ValueError("temperature_window must be (T_min, T_max) "
+                         "with T_min < T_max.")
+    start = max(np.searchsorted(temperature_grid, T_min, side='right') - 1, 0)
+    stop = min(np.searchsorted(temperature_grid, T_max, side='left') + 1,
+               len(temperature_grid))
+    if stop - start < 2:
+        raise ValueError("temperature_window does not overlap the "
+                         "temperature grid.")
+    return slice(start, stop)
+
+
+def _rate_matrices(ionization_rate, recombination_rate):
+    """
+    Return the stacked coefficient matrices ``A`` of the rate equations
+    ``df/dt = n_e * A @ f`` for ionization and recombination rates with
+    shape ``(ntemp, nstates)``.  The result has shape
+    ``(ntemp, nstates, nstates)``.
+
+    The matrices are tridiagonal.  The ionization rate of the highest
+    charge state and the recombination rate of the neutral state are
+    ignored.
+    """
+    ntemp, nstates = ionization_rate.shape
+    carr = ionization_rate.copy()
+    rarr = recombination_rate.copy()
+    carr[:, nstates-1] = 0.0
+    rarr[:, 0] = 0.0
+
+    A = np.zeros((ntemp, nstates, nstates), dtype=np.float64)
+    ion = np.arange(nstates)
+    A[:, ion, ion] = -(carr + rarr)
+    A[:, ion[1:], ion[:-1]] = carr[:, :-1]
+    A[:, ion[:-1], ion[1:]] = rarr[:, 1:]
+    return A
+
+
+def _eigen_decompose(A):
+    """
+    Return the eigenvalues, eigenvectors, and eigenvector inverses of
+    the stacked matrices ``A`` with shape ``(ntemp, nstates, nstates)``.
+
+    The eigenvalues are sorted in ascending order.  The eigenvectors
+    and their inverses are transposed to match the order of the Fortran
+    version, so that ``eigenvectors[ite, j, :]`` is the eigenvector
+    corresponding to ``eigenvalues[ite, j]``.
+    """
+    la, v = LA.eig(A)
+
+    # The rate matrices are similar to symmetric matrices so the
+    # eigenvalues are real apart from round-off.
+    la = la.real
+    v = v.real
+
+    # Rerange the eigenvalues.
+    idx = np.argsort(la, axis=-1)
+    la = np.take_along_axis(la, idx, axis=-1)
+    v = np.take_along_axis(v, idx[:, np.newaxis, :], axis=-1)
+
+    # Compute inverse of eigenvectors
+    v_inverse = LA.inv(v)
+
+    # transpose the order to as same as the Fortran Version
+    eigenvectors = np.ascontiguousarray(v.transpose(0, 2, 1))
+    eigenvector_inverses = np.ascontiguousarray(v_inverse.transpose(0, 2, 1))
+
+    return la, eigenvectors, eigenvector_inverses
+
+
+def _eigen_decompose_general(ionization_rate, recombination_rate):
+    """Decompose the rate matrices with the general eigensolver."""
+    return _eigen_decompose(
+        _rate_matrices(ionization_rate, recombination_rate))
+
+
+def _eigen_decompose_tridiagonal(ionization_rate, recombination_rate):
+    """
+    Decompose the rate matrices with a symmetric eigensolver.
+
+    The rate matrix ``A`` has the sub-diagonal ``a[i] = c[i]`` and the
+    super-diagonal ``b[i] = r[i+1]``, which are positive where the rates
+    do not vanish.  With ``D = diag(d)`` and
+    ``d[i+1] / d[i] = sqrt(a[i] / b[i])``, the matrix
+    ``S = D^-1 @ A @ D`` is symmetric and tridiagonal with the
+    off-diagonal ``sqrt(a[i] * b[i])``.  If ``S = Q @ diag(la) @ Q.T``,
+    then the eigenvectors of ``A`` are ``V = D @ Q`` and their inverse is
+    ``Q.T @ D^-1``, so no explicit inversion is needed.  The
+    eigenvectors are normalized like those from `numpy.linalg.eig`.
+
+    Since ``d[i] ** 2`` is proportional to the equilibrium fraction of
+    charge state ``i``, the transform amplifies round-off errors by up
+    to ``max(d) / min(d)``.  The symmetric solver is therefore only used
+    at temperatures where this ratio is at most
+    ``_TRIDIAGONAL_MAX_SCALE``.  This holds over most of the grid for H
+    and He and over little of it for heavier elements, where the charge
+    state distribution spans many orders of magnitude.  All other
+    temperatures, including those with a vanishing rate, are decomposed
+    with the general solver.
+
+    The returned arrays follow the conventions of `_eigen_decompose`.
+    """
+    ntemp, nstates = ionization_rate.shape
+    a = ionization_rate[:, :-1]
+    b = recombination_rate[:, 1:]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_d = np.zeros((ntemp, nstates))
+        log_d[:, 1:] = np.cumsum(0.5 * (np.log(a) - np.log(b)), axis=1)
+        scale = log_d.max(axis=1) - log_d.min(axis=1)
+        symmetric = np.all((a > 0) & (b > 0), axis=1) \
+            & (scale <= np.log(_TRIDIAGONAL_MAX_SCALE))
+
+    eigenvalues = np.empty((ntemp, nstates))
+    eigenvectors = np.empty((ntemp, nstates, nstates))
+    eigenvector_inverses = np.empty((ntemp, nstates, nstates))
+
+    if symmetric.any():
+        S = _rate_matrices(ionization_rate[symmetric],
+                           recombination_rate[symmetric])
+        ion = np.arange(nstates)
+        off_diagonal = np.sqrt(a[symmetric] * b[symmetric])
+        S[:, ion[1:], ion[:-1]] = off_diagonal
+        S[:, ion[:-1], ion[1:]] = off_diagonal
+
+        # Ascending eigenvalues of all symmetric matrices in one call
+        la, q = LA.eigh(S)
+
+        d = np.exp(log_d[symmetric])[:, :, np.newaxis]
+        v = d * q
+        norms = np.sqrt(np.sum(v * v, axis=1, keepdims=True))
+        v /= norms
+        v_inverse = q.transpose(0, 2, 1) / d.transpose(0, 2, 1) \
+            * norms.transpose(0, 2, 1)
+
+        eigenvalues[symmetric] = la
+        eigenvectors[symmetric] = v.transpose(0, 2, 1)
+        eigenvector_inverses[symmetric] = v_inverse.transpose(0, 2, 1)
+
+    general = ~symmetric
+    if general.any():
+        (eigenvalues[general],
+         eigenvectors[general],
+         eigenvector_inverses[general]) = _eigen_decompose_general(
+            ionization_rate[general], recombination_rate[general])
+
+    return eigenvalues, eigenvectors, eigenvector_inverses
+
+
+# The largest ratio max(d) / min(d) of the symmetrizing transform for
+# which the symmetric solver is used
+_TRIDIAGONAL_MAX_SCALE = 1e6
+
+
+_SOLVERS = {
+    'eig': _eigen_decompose_general,
+    'tridiagonal': _eigen_decompose_tridiagonal,
+}
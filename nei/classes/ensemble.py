@@ -0,0 +1,336 @@
+"""
+Advance the charge states of many plasma parcels at once.
+
+Each parcel follows its own electron temperature and hydrogen number
+density over a common set of times.  The packed ionic fractions of all
+parcels are stored in one array with shape
+``(n_parcels, len(elements), max_nstates)``, and at every step the
+eigensystem of each parcel is gathered from the stacked tables of
+`~nei.classes.packed.PackedEigenTables` at its own temperature index so
+that all parcels are advanced by one batched product.
+"""
+
+from typing import Dict, Union
+
+import astropy.units as u
+import numpy as np
+from plasmapy import atomic
+
+from .eigenregistry import get_eigendata
+from .nei import NEIError
+from .packed import PackedEigenTables
+
+__all__ = ['NEIEnsemble']
+
+# The default size in bytes of the eigenvectors gathered for a chunk of
+# parcels, which are gathered twice per step.
+_GATHER_BYTES = 32 * 2 ** 20
+
+
+class NEIEnsemble:
+    """
+    Perform a non-equilibrium ionization simulation for an ensemble of
+    plasma parcels.
+
+    The temperature and density of each parcel are interpolated linearly
+    between the input times.  The interval between two input times is
+    taken in one step, or split evenly into steps no longer than ``dt``,
+    and each step uses the temperature and density at its midpoint.  The
+    ionic fractions are returned at the input times.
+
+    Parameters
+    ----------
+    inputs : `list` or `dict`
+        The elements, in which case every parcel starts in ionization
+        equilibrium at its initial temperature, or a `dict` with the
+        initial ionic fractions of each element with shape ``(nstates,)``
+        for all parcels or ``(n_parcels, nstates)``.
+
+    abundances : `dict`
+        The abundance of each element relative to hydrogen.
+
+    time : `~astropy.units.Quantity`
+        The increasing input times with shape ``(n_times,)``.
+
+    T_e : `~astropy.units.Quantity`
+        The electron temperature of each parcel at the input times, with
+        shape ``(n_parcels, n_times)``.
+
+    n : `~astropy.units.Quantity`
+        The hydrogen number density of each parcel at the input times,
+        with shape ``(n_parcels, n_times)``.
+
+    dt : `~astropy.units.Quantity`, optional
+        The longest time step.  Defaults to one step per interval
+        between input times.
+
+    chunk_size : `int`, optional
+        The number of parcels advanced together.  Each step gathers the
+        eigenvectors and their inverses of every parcel of a chunk, with
+        ``chunk_size * len(elements) * max_nstates**2`` entries each.
+        Larger chunks take fewer and longer batched products, but the
+        gain levels off once a chunk holds a few hundred parcels.
+        Defaults to the number of parcels whose gathered eigenvectors
+        take about 32 MiB, which is about 17000 parcels for H, He, and O
+        and 170 parcels for the 28 elements up to nickel.
+
+    dtype : optional
+        The floating point type of the ionic fractions and of the
+        eigenvalue tables, either `numpy.float64` (the default) or
+        `numpy.float32`, which halves the memory and bandwidth they use.
+        The electron density and the renormalization of every step are
+        computed in double precision.  See the ``dtype`` option of
+        `~nei.classes.nei.NEI` for the accuracy of single precision.
+
+    rate_file : `str`, optional
+        The rate file from which the eigenvalue tables are computed.
+        Defaults to the rate file distributed with this package.
+
+    Raises
+    ------
+    NEIError
+        If the inputs are invalid or the tables of the elements do not
+        share a temperature grid.
+
+    Examples
+    --------
+    >>> time = np.linspace(0, 1000, 11) * u.s
+    >>> T_e = np.geomspace([1e5, 2e5], [1e6, 4e6], 11, axis=1) * u.K
+    >>> n = np.full((2, 11), 1e9) * u.cm ** -3
+    >>> ensemble = NEIEnsemble(['H', 'He', 'O'], {'H': 1, 'He': 0.1, 'O': 1e-3},
+    ...                        time=time, T_e=T_e, n=n, dt=10 * u.s)
+    >>> ionic_fractions = ensemble.simulate()
+    >>> ionic_fractions['O'].shape
+    (2, 11, 9)
+    """
+
+    def __init__(
+            self,
+            inputs: Union[list, Dict],
+            abundances: Dict,
+            time: u.Quantity,
+            T_e: u.Quantity,
+            n: u.Quantity,
+            dt: u.Quantity = None,
+            chunk_size: int = None,
+            dtype=np.float64,
+            rate_file: str = None,
+    ):
+        try:
+            self._time = np.asarray(time.to_value(u.s), dtype=np.float64)
+            self._T_e = np.asarray(T_e.to_value(u.K), dtype=np.float64)
+            self._n = np.asarray(n.to_value(u.cm ** -3), dtype=np.float64)
+            self._dt = dt.to_value(u.s) if dt is not None else None
+        except (AttributeError, u.UnitConversionError):
+            raise NEIError("Invalid units of time, T_e, n, or dt.") from None
+
+        if self._time.ndim != 1 or not np.all(np.diff(self._time) > 0):
+            raise NEIError("time must be a one-dimensional increasing array.")
+        if self._T_e.ndim != 2 or self._T_e.shape[1] != self._time.size:
+            raise NEIError("T_e must have shape (n_parcels, n_times).")
+        if self._n.shape != self._T_e.shape:
+            raise NEIError("n must have the same shape as T_e.")
+        for values in (self._T_e, self._n):
+            if not np.all((0 <= values) & (values < np.inf)):
+                raise NEIError("Invalid temperature or density.")
+        if self._dt is not None and not self._dt > 0:
+            raise NEIError("dt must be positive.")
+        if chunk_size is not None and chunk_size < 1:
+            raise NEIError("chunk_size must be a positive integer.")
+
+        elements = [atomic.atomic_symbol(elem) for elem in inputs]
+        if 'H' not in elements:
+            raise NEIError("Must have H in elements")
+        self._abundances = {
+            atomic.atomic_symbol(elem): abundance
+            for elem, abundance in abundances.items()
+        }
+        missing = set(elements) - set(self._abundances)
+        if missing:
+            raise NEIError(f"Missing abundances for {sorted(missing)}.")
+
+        eigendata = {elem: get_eigendata(elem, rate_file=rate_file) for elem in elements}
+        try:
+            self._packed_tables = PackedEigenTables(eigendata, dtype=dtype)
+        except ValueError as exc:
+            raise NEIError("Unable to pack the eigenvalue tables.") from exc
+        packed = self._packed_tables
+
+        if chunk_size is None:
+            gathered = packed.dtype.itemsize * len(elements) * packed.max_nstates ** 2
+            chunk_size = max(_GATHER_BYTES // gathered, 1)
+        self._chunk_size = chunk_size
+
+        # The initial packed ionic fractions of each parcel
+        n_parcels = self._T_e.shape[0]
+        self._initial = np.zeros((n_parcels, len(elements), packed.max_nstates),
+                                 dtype=packed.dtype)
+        if isinstance(inputs, dict):
+            initial = {atomic.atomic_symbol(elem): value
+                       for elem, value in inputs.items()}
+        else:
+            initial = {
+                elem: eigendata[elem].equilibrium_state(T_e=self._T_e[:, 0])
+                for elem in elements
+            }
+        for row, elem in enumerate(elements):
+            try:
+                self._initial[:, row, :packed.nstates[row]] = initial[elem]
+            except ValueError:
+                raise NEIError(f"Invalid initial ionic fractions of {elem}.") from None
+
+        self._ionic_fractions = None
+        self._n_e = None
+
+    @property
+    def elements(self) -> list:
+        """The elements of the simulation."""
+        return self._packed_tables.elements
+
+    @property
+    def abundances(self) -> dict:
+        """The abundance of each element relative to hydrogen."""
+        return self._abundances
+
+    @property
+    def n_parcels(self) -> int:
+        """The number of parcels."""
+        return self._T_e.shape[0]
+
+    @property
+    def time(self) -> u.Quantity:
+        """The input times, at which the results are given."""
+        return u.Quantity(self._time, u.s, copy=False)
+
+    @property
+    def T_e(self) -> u.Quantity:
+        """The electron temperature of each parcel at the input times."""
+        return u.Quantity(self._T_e, u.K, copy=False)
+
+    @property
+    def n(self) -> u.Quantity:
+        """The hydrogen number density of each parcel at the input
+        times."""
+        return u.Quantity(self._n, u.cm ** -3, copy=False)
+
+    @property
+    def ionic_fractions(self) -> dict:
+        """
+        The ionic fractions of each element with shape
+        ``(n_parcels, n_times, nstates)``.
+        """
+        if self._ionic_fractions is None:
+            raise NEIError("The simulation has not yet been performed.")
+        return self._packed_tables.unpack(self._ionic_fractions)
+
+    @property
+    def n_e(self) -> u.Quantity:
+        """The electron density of each parcel at the input times."""
+        if self._n_e is None:
+            raise NEIError("The simulation has not yet been performed.")
+        return u.Quantity(self._n_e, u.cm ** -3, copy=False)
+
+    def _steps(self):
+        """
+        Return the index of the input interval, the start time, and the
+        length of every step.
+        """
+        intervals = np.diff(self._time)
+        if self._dt is None:
+            pieces = np.ones(intervals.size, dtype=int)
+        else:
+            pieces = np.maximum(np.ceil(intervals / self._dt), 1).astype(int)
+        interval = np.repeat(np.arange(intervals.size), pieces)
+        first = np.cumsum(pieces) - pieces
+        fraction = (np.arange(interval.size) - first[interval]) / pieces[interval]
+        dt = intervals[interval] / pieces[interval]
+        start = self._time[interval] + fraction * intervals[interval]
+        return interval, start, dt
+
+    def _gather_range(self):
+        """
+        Return the stacked eigenvalue tables over the range of
+        temperature indices reached by any parcel, and the first index
+        of the range, so that the tables of each parcel are gathered by
+        indexing instead of being stacked at every step.
+        """
+        indices = self._packed_tables.temperature_index(self._T_e)
+        first, last = int(indices.min()), int(indices.max())
+        return self._packed_tables.stack(np.arange(first, last + 1)), first
+
+    def simulate(self) -> dict:
+        """
+        Advance every parcel from the first input time to the last.
+
+        Returns
+        -------
+        ionic_fractions : `dict`
+            The ionic fractions of each element at the input times, with
+            shape ``(n_parcels, n_times, nstates)``.
+        """
+        interval, start, dt = self._steps()
+        midpoint = start + dt / 2
+
+        # The weight of the later of the bracketing input times of each
+        # step midpoint, for interpolating the inputs of the parcels
+        weight = (midpoint - self._time[interval]) / np.diff(self._time)[interval]
+
+        packed = self._packed_tables
+        tables, first = self._gather_range()
+
+        # The steps that end on each input time
+        ends = np.flatnonzero(np.append(interval[1:] != interval[:-1], True))
+        charge_weights = packed.charge_weights(self._abundances)
+
+        history = np.empty((self.n_parcels, self._time.size) + self._initial.shape[1:],
+                           dtype=packed.dtype)
+        history[:, 0] = self._initial
+        n_e = np.empty((self.n_parcels, self._time.size))
+
+        # The inputs at the steps are only interpolated for one chunk of
+        # parcels at a time, so that memory use is bounded by the chunk.
+        for begin in range(0, self.n_parcels, self._chunk_size):
+            parcels = slice(begin, begin + self._chunk_size)
+            T_e = self._T_e[parcels]
+            n_H = self._n[parcels]
+            T_e_steps = T_e[:, interval] * (1 - weight) + T_e[:, interval + 1] * weight
+            n_H_steps = n_H[:, interval] * (1 - weight) + n_H[:, interval + 1] * weight
+            table_index = packed.temperature_index(T_e_steps) - first
+
+            f = self._initial[parcels].copy()
+            output = 1
+            for step in range(dt.size):
+                f = self._advance(
+                    f, tables, table_index[:, step],
+                    n_H_steps[:, step] * dt[step], charge_weights)
+                if output < self._time.size and step == ends[output - 1]:
+                    history[parcels, output] = f
+                    output += 1
+
+            n_e[parcels] = n_H * np.sum(charge_weights * history[parcels],
+                                        axis=(2, 3), dtype=np.float64)
+
+        self._ionic_fractions = history
+        self._n_e = n_e
+        return self.ionic_fractions
+
+    @staticmethod
+    def _advance(f, tables, table_index, n_H_dt, charge_weights):
+        """
+        Return the packed ionic fractions ``f`` of several parcels
+        advanced over one step, with the eigensystem of each parcel
+        gathered from ``tables`` at its entry of ``table_index``.
+        """
+        evals, evect, evect_inverse = tables
+        n_e_dt = np.sum(charge_weights * f, axis=(1, 2), dtype=np.float64) * n_H_dt
+        coefficients = np.matmul(f[:, :, np.newaxis, :], evect_inverse[table_index])
+        coefficients *= np.exp(
+            evals[table_index] * n_e_dt[:, np.newaxis, np.newaxis])[:, :, np.newaxis, :]
+        ft = np.matmul(coefficients, evect[table_index])[:, :, 0, :]
+
+        # Set the slightly negative ionic fractions left by truncation
+        # errors to zero and renormalize in double precision, as in
+        # NEI.time_advance.
+        np.clip(ft, 0.0, None, out=ft)
+        return (ft / np.sum(ft, axis=2, keepdims=True, dtype=np.float64)
+                ).astype(f.dtype, copy=False)
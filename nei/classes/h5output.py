@@ -0,0 +1,192 @@
+"""
+Write the history of a simulation to an HDF5 file while it runs.
+
+`~nei.classes.nei.Simulation` keeps its history in a small buffer when
+it is given a writer, and hands each full block of the buffer to the
+writer.  The writer appends the blocks to chunked, compressed datasets
+from a background thread, so stepping continues while the data are
+compressed and written.
+"""
+
+import queue
+import threading
+
+import h5py
+import numpy as np
+
+__all__ = ['HDF5HistoryWriter']
+
+
+class HDF5HistoryWriter:
+    """
+    Append blocks of a simulation history to an HDF5 file from a
+    background thread.
+
+    The file contains the one-dimensional datasets ``time`` in seconds,
+    ``T_e`` in kelvin, and ``n_e`` and ``n_H`` in cm**-3, and one
+    dataset per element in the group ``ionic_fractions`` with one row
+    per time.
+
+    Parameters
+    ----------
+    filename : `str`
+        The HDF5 file to create.  An existing file is overwritten.
+
+    nstates : `dict`
+        The number of charge states of each element.
+
+    block_size : `int`, optional
+        The number of rows of the blocks written at once, which is also
+        the chunk size of the datasets.  Must be at least 2.  Defaults
+        to 4096.
+
+    compression : `str`, optional
+        The compression filter of the datasets, or `None`.  Defaults to
+        ``'gzip'``.
+
+    compression_opts : optional
+        The options of the compression filter.  Defaults to 4.
+
+    max_pending : `int`, optional
+        The number of blocks that may wait for the writer thread before
+        `write` blocks.  Defaults to 2.
+
+    dtype : optional
+        The type of the ionic fraction datasets.  The other datasets are
+        always `numpy.float64`.  Defaults to `numpy.float64`.
+
+    Examples
+    --------
+    >>> import os, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> filename = os.path.join(directory, 'history.h5')
+    >>> writer = HDF5HistoryWriter(filename, {'H': 2, 'He': 3})
+    >>> writer.write({
+    ...     'time': np.arange(3.0), 'T_e': np.full(3, 1e6),
+    ...     'n_e': np.full(3, 1.2e9), 'n_H': np.full(3, 1e9),
+    ...     'ionic_fractions': {'H': np.tile([0, 1.0], (3, 1)),
+    ...                         'He': np.tile([0, 0, 1.0], (3, 1))},
+    ... })
+    >>> writer.close()
+    >>> writer.nrows
+    3
+    >>> os.remove(filename)
+    >>> os.rmdir(directory)
+    """
+
+    _SCALARS = ('time', 'T_e', 'n_e', 'n_H')
+
+    def __init__(self, filename, nstates, block_size=4096,
+                 compression='gzip', compression_opts=4, max_pending=2,
+                 dtype=np.float64):
+        if block_size < 2:
+            raise ValueError("block_size must be at least 2.")
+        if max_pending < 1:
+            raise ValueError("max_pending must be a positive integer.")
+
+        self._filename = filename
+        self._block_size = block_size
+        self._nrows = 0
+        self._error = None
+
+        if compression is None:
+            compression_opts = None
+        self._file = h5py.File(filename, 'w')
+        for name in self._SCALARS:
+            self._file.create_dataset(
+                name, shape=(0,), maxshape=(None,), dtype=np.float64,
+                chunks=(block_size,), compression=compression,
+                compression_opts=compression_opts)
+        group = self._file.create_group('ionic_fractions')
+        for elem, n in nstates.items():
+            group.create_dataset(
+                elem, shape=(0, n), maxshape=(None, n), dtype=dtype,
+                chunks=(block_size, n), compression=compression,
+                compression_opts=compression_opts)
+
+        self._queue = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def filename(self) -> str:
+        """The name of the HDF5 file."""
+        return self._filename
+
+    @property
+    def block_size(self) -> int:
+        """The number of rows of the blocks written at once."""
+        return self._block_size
+
+    @property
+    def nrows(self) -> int:
+        """The number of rows handed to the writer so far."""
+        return self._nrows
+
+    def _append(self, block):
+        """Append a block to the datasets.  Runs in the writer thread."""
+        datasets = [(self._file[name], block[name]) for name in self._SCALARS]
+        datasets += [(self._file['ionic_fractions'][elem], values)
+                     for elem, values in block['ionic_fractions'].items()]
+        for dataset, values in datasets:
+            start = dataset.shape[0]
+            dataset.resize(start + len(values), axis=0)
+            dataset[start:] = values
+
+    def _run(self):
+        while True:
+            block = self._queue.get()
+            if block is None:
+                break
+            if self._error is None:
+                try:
+                    self._append(block)
+                except Exception as exc:
+                    self._error = exc
+
+    def _check(self):
+        if self._error is not None:
+            raise IOError(f"Unable to write to {self._filename}.") from self._error
+
+    def write(self, block):
+        """
+        Queue a block of rows for writing.
+
+        Parameters
+        ----------
+        block : `dict`
+            Arrays with one entry per row for ``time``, ``T_e``, ``n_e``,
+            and ``n_H``, and a `dict` ``ionic_fractions`` with an array of
+            shape ``(rows, nstates)`` per element.  The arrays must not
+            be modified after they are queued.
+
+        Raises
+        ------
+        IOError
+            If a previous block could not be written.
+        """
+        self._check()
+        self._queue.put(block)
+        self._nrows += len(block['time'])
+
+    def close(self):
+        """
+        Wait for the queued blocks to be written and close the file.
+
+        Raises
+        ------
+        IOError
+            If a block could not be written.
+        """
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self._file:
+            self._file.close()
+        self._check()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
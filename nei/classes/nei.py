@@ -4,8 +4,14 @@ from typing import Union, Optional, List, Dict, Callable
 import astropy.units as u
 import plasmapy as pl
 import collections
+import os
+import h5py
 from scipy import interpolate
-from .eigenvaluetable import EigenData2
+from .eigenregistry import get_eigendata
+from .propagator import PropagatorCache, advance
+from .packed import PackedEigenTables
+from .h5output import HDF5HistoryWriter
+from ..time_advance import run_schedule
 from .ionization_states import IonizationStates
 import warnings
 
@@ -17,114 +23,256 @@ import warnings
 # TODO: Expand Simulation docstring
 
 
+# The largest difference in an ionic fraction between one step and two
+# half steps that is accepted when the time step is adapted, before
+# scaling by the square of the safety factor.
+_ADAPTIVE_TOLERANCE = 1e-4
+
+# The largest relative change of the electron temperature or hydrogen
+# number density over an adapted step, before scaling by the safety
+# factor.
+_ADAPTIVE_MAX_INPUT_CHANGE = 0.1
+_ADAPTIVE_MAX_INPUT_ITERATIONS = 20
+
+# The bounds on the factor by which an adapted time step may change from
+# one attempt to the next, and the shortest adapted time step relative to
+# the first one.
+_ADAPTIVE_MIN_STEP_CHANGE = 0.2
+_ADAPTIVE_MAX_STEP_CHANGE = 5.0
+_ADAPTIVE_MIN_STEP_FRACTION = 1e-8
+
+
 class NEIError(Exception):
     pass
 
 
+def _temperature_boundaries(eigendata) -> np.ndarray:
+    """
+    Return the sorted temperatures in kelvin at which the nearest point
+    of the temperature grid of any of the ``eigendata`` tables changes,
+    which are the midpoints between neighboring grid temperatures.
+    """
+    return np.unique(np.concatenate([
+        (table.temperature_grid[1:] + table.temperature_grid[:-1]) / 2
+        for table in eigendata
+    ]))
+
+
+def _grid_crossings(t0, t1, T0, T1, boundaries) -> np.ndarray:
+    """
+    Return the times between ``t0`` and ``t1`` at which a temperature
+    that changes linearly from ``T0`` to ``T1`` crosses one of the
+    ``boundaries`` from `_temperature_boundaries`.
+    """
+    if T0 == T1:
+        return np.empty(0)
+    crossed = boundaries[(boundaries > min(T0, T1)) & (boundaries < max(T0, T1))]
+    return t0 + (crossed - T0) / (T1 - T0) * (t1 - t0)
+
+
+def _check_rounding_error(packed_tables):
+    """Warn about the elements whose tables are too poorly conditioned
+    for the single precision of ``packed_tables``."""
+    errors = packed_tables.rounding_error()
+    inaccurate = [elem for elem, error in errors.items() if error > 0.1]
+    if inaccurate:
+        estimates = ', '.join(f"{elem}: {errors[elem]:.2g}" for elem in inaccurate)
+        warnings.warn(
+            f"The ionic fractions may be inaccurate in single "
+            f"precision, with estimated errors of {estimates}.")
+
+
 class Simulation:
     """
     Store results from a non-equilibrium ionization simulation.
+
+    The results are stored internally as arrays of floats in seconds,
+    kelvin, and cm**-3, and units are attached when they are accessed.
+    Only the ionic fractions and the hydrogen number density are stored
+    for each element; the number densities of the elements and of their
+    ions are derived from them when first accessed and then cached.
+
+    If a `~nei.classes.h5output.HDF5HistoryWriter` is given, the arrays
+    only hold one block of the history.  Each full block is handed to
+    the writer, and the results are read back from its file once the
+    simulation is complete.
+
+    The ionic fractions are stored as ``dtype``, either `numpy.float64`
+    (the default) or `numpy.float32`, and all other quantities as
+    `numpy.float64`.
     """
-    def __init__(self, initial, n_init, T_e_init, max_steps, time_start):
+    def __init__(self, initial, n_init, T_e_init, max_steps, time_start,
+                 writer=None, dtype=np.float64):
 
         self._elements = initial.elements
         self._abundances = initial.abundances
         self._max_steps = max_steps
+        self._writer = writer
+        self._output_file = writer.filename if writer is not None else None
 
         self._nstates = {elem: pl.atomic.atomic_number(elem) + 1
                          for elem in self.elements}
 
-        self._ionic_fractions = {
-            elem: np.full((max_steps + 1, self.nstates[elem]), np.nan,
-                          dtype=np.float64)
+        rows = max_steps + 1
+        if writer is not None:
+            rows = min(rows, writer.block_size)
+
+        # The ionic fractions of all elements are stored side by side in
+        # one row per time, and the columns of each element are given
+        # by its offset slice.
+        self._offsets = {}
+        stop = 0
+        for elem in self.elements:
+            self._offsets[elem] = slice(stop, stop + self.nstates[elem])
+            stop += self.nstates[elem]
+        self._history = np.full((rows, stop), np.nan, dtype=dtype)
+
+        # The electron density is n_H times the ionic fractions of a row
+        # weighted by abundance times charge.
+        self._charge_weights = np.concatenate([
+            self.abundances[elem] * np.arange(self.nstates[elem], dtype=np.float64)
             for elem in self.elements
-        }
+        ])
 
-        self._number_densities = {
-            elem: np.full((max_steps + 1, self.nstates[elem]), np.nan,
-                          dtype=np.float64) * u.cm ** -3
-            for elem in self.elements
-        }
-
-        self._n_elem = {
-            elem: np.full(max_steps + 1, np.nan) * u.cm ** -3
-            for elem in self.elements
-        }
+        self._n_H = np.full(rows, np.nan)
+        self._derived = {}
 
-        self._n_e = np.full(max_steps + 1, np.nan) * u.cm ** -3
-        self._T_e = np.full(max_steps + 1, np.nan) * u.K
-        self._time = np.full(max_steps + 1, np.nan) * u.s
+        self._n_e = np.full(rows, np.nan)
+        self._T_e = np.full(rows, np.nan)
+        self._time = np.full(rows, np.nan)
 
         self._index = 0
 
         self._assign(
-            new_time=time_start,
+            new_time=time_start.to_value(u.s),
             new_ionfracs=initial.ionic_fractions,
-            new_n = n_init,
-            new_T_e = T_e_init,
+            new_n=n_init.to_value(u.cm ** -3),
+            new_T_e=T_e_init.to_value(u.K),
         )
 
-    def _assign(self, new_time, new_ionfracs, new_n, new_T_e):
-
+    def _flatten(self, ionfracs):
+        """
+        Return ionic fractions given as a `dict` keyed by element as an
+        array with the columns of the history.  Arrays that already have
+        these columns are returned as they are.
+        """
+        if isinstance(ionfracs, np.ndarray):
+            return ionfracs
         try:
-            index = self._index
-            elements = self.elements
-            self._time[index] = new_time
-            self._T_e[index] = new_T_e
-
-            for elem in elements:
-                self._ionic_fractions[elem][index, :] = new_ionfracs[elem][:]
-
-            # Calculate elemental and ionic number densities
-            n_elem = {elem: new_n * self.abundances[elem] for elem in elements}
-            number_densities = {
-                elem: n_elem[elem] * new_ionfracs[elem]
-                for elem in elements
-            }
+            return np.concatenate(
+                [np.asarray(ionfracs[elem], dtype=np.float64) for elem in self.elements],
+                axis=-1)
+        except (KeyError, ValueError) as exc:
+            raise NEIError(f"Invalid ionic fractions: {ionfracs}.") from exc
 
-            # Calculate the electron number density
-            n_e = 0.0 * u.cm ** -3
-            for elem in elements:
-                integer_charges = np.linspace(
-                    0, self.nstates[elem]-1, self.nstates[elem])
-                n_e += np.sum(number_densities[elem] * integer_charges)
+    def _assign(self, new_time, new_ionfracs, new_n, new_T_e):
+        """
+        Store the results of a time step.  The time, the hydrogen number
+        density, and the electron temperature are floats in seconds,
+        cm**-3, and kelvin.  The ionic fractions are a `dict` keyed by
+        element or an array with the columns of the history, in which
+        the elements follow each other in the order of `elements`.
+        """
 
-            # Assign densities
-            self._n_e[index] = n_e
-            for elem in elements:
-                self._n_elem[elem][index] = n_elem[elem]
-                self._number_densities[elem][index, :] = number_densities[elem]
+        if self._writer is not None and self._index == len(self._time):
+            self._flush()
+        if self._index == len(self._time):
+            raise NEIError("The results exceed max_steps.")
+        self._derived.clear()
+
+        index = self._index
+        row = self._history[index]
+        row[:] = self._flatten(new_ionfracs)
+        self._time[index] = new_time
+        self._T_e[index] = new_T_e
+        self._n_H[index] = new_n
+        self._n_e[index] = new_n * (row @ self._charge_weights)
+        self._index += 1
+
+    def _assign_history(self, new_times, new_ionfracs, new_n, new_T_e):
+        """
+        Store the results of several consecutive time steps at once.
+        The arguments are arrays with one entry (or row, for the ionic
+        fractions) per step, as for `_assign`.
+        """
+        self._derived.clear()
+        new_ionfracs = self._flatten(new_ionfracs)
+        start = 0
+        while start < len(new_times):
+            if self._writer is not None and self._index == len(self._time):
+                self._flush()
 
-        except Exception as exc:
-            raise NEIError(
-                f"Unable to assign parameters to Simulation instance "
-                f"for index {index} at time = {new_time}.  The "
-                f"parameters are new_n = {new_n}, new_T_e = {new_T_e}, "
-                f"and new_ionic_fractions = {new_ionfracs}."
-            ) from exc
-        finally:
-            self._index += 1
+            index = self._index
+            stop = min(len(new_times), start + len(self._time) - index)
+            if stop == start:
+                raise NEIError("The results exceed max_steps.")
+            new = slice(start, stop)
+            steps = slice(index, index + stop - start)
+
+            self._history[steps] = new_ionfracs[new]
+            self._time[steps] = new_times[new]
+            self._T_e[steps] = new_T_e[new]
+            self._n_H[steps] = new_n[new]
+            self._n_e[steps] = new_n[new] * (self._history[steps] @ self._charge_weights)
+            self._index += stop - start
+            start = stop
+
+    def _close_output(self):
+        """Close the writer of an incomplete simulation, if any."""
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except IOError:
+                pass
+            self._writer = None
+
+    def _flush(self, final=False):
+        """
+        Hand the buffered rows to the writer.  Unless ``final`` is
+        `True`, the latest row is kept as the first row of the buffer,
+        because the next step starts from it, and written with the next
+        block.
+        """
+        rows = self._index if final else self._index - 1
+        self._writer.write({
+            'time': self._time[:rows].copy(),
+            'T_e': self._T_e[:rows].copy(),
+            'n_e': self._n_e[:rows].copy(),
+            'n_H': self._n_H[:rows].copy(),
+            'ionic_fractions': {
+                elem: self._history[:rows, offset].copy()
+                for elem, offset in self._offsets.items()
+            },
+        })
+        if final:
+            return
+
+        for array in (self._history, self._time, self._T_e, self._n_e, self._n_H):
+            array[0] = array[rows]
+        self._index = 1
 
     def _cleanup(self):
-        # time
-        # temperature
-        # number density
-        # number densities
-        # n_e
         nsteps = self._index
+        self._derived.clear()
+
+        if self._writer is not None:
+            # Only the final state is kept in memory
+            self._flush(final=True)
+            self._writer.close()
+            self._writer = None
+            kept = slice(nsteps - 1, nsteps)
+        else:
+            kept = slice(0, nsteps)
 
-        self._n_e = self._n_e[0:nsteps]
-        self._T_e = self._T_e[0:nsteps]
-        self._time = self._time[0:nsteps]
-
-        for element in self.elements:
-            self._ionic_fractions[element] = self._ionic_fractions[element][0:nsteps, :]
-            self._number_densities[element] = self._number_densities[element][0:nsteps, :]
-
+        self._history = self._history[kept]
+        self._n_e = self._n_e[kept]
+        self._T_e = self._T_e[kept]
+        self._time = self._time[kept]
+        self._n_H = self._n_H[kept]
         self._index = None
 
         # temporary check
-        assert not np.isnan(self._n_e[-1].value)
+        assert not np.isnan(self._n_e[-1])
 
     @property
     def max_steps(self):
@@ -142,29 +290,77 @@ class Simulation:
     def abundances(self):
         return self._abundances
 
+    @property
+    def output_file(self) -> Optional[str]:
+        """
+        The HDF5 file to which the history is written, or `None` if it
+        is kept in memory.  Once the simulation is complete, each of the
+        results is read from this file when it is accessed.
+        """
+        return self._output_file
+
+    def _stored(self, name):
+        """Return a dataset of the output file if the history has been
+        written to it, or `None`."""
+        if self._output_file is None or self._index is not None:
+            return None
+        with h5py.File(self._output_file, 'r') as f:
+            return f[name][()]
+
     @property
     def ionic_fractions(self):
-        return self._ionic_fractions
+        if self._output_file is not None and self._index is None:
+            return {elem: self._stored(f'ionic_fractions/{elem}')
+                    for elem in self.elements}
+        return {elem: self._history[:, offset]
+                for elem, offset in self._offsets.items()}
 
     @property
     def number_densities(self):
-        return self._number_densities
+        """
+        The number density of each ion, derived from the ionic fractions
+        and the number density of each element when first accessed.
+        """
+        if 'number_densities' not in self._derived:
+            ionic_fractions = self.ionic_fractions
+            self._derived['number_densities'] = {
+                elem: u.Quantity(
+                    ionic_fractions[elem] * n_elem.value[:, np.newaxis],
+                    u.cm ** -3, copy=False)
+                for elem, n_elem in self.n_elem.items()
+            }
+        return dict(self._derived['number_densities'])
 
     @property
     def n_elem(self):
-        return self._n_elem
+        """
+        The number density of each element, derived from the hydrogen
+        number density and the abundances when first accessed.
+        """
+        if 'n_elem' not in self._derived:
+            n_H = self._stored('n_H')
+            if n_H is None:
+                n_H = self._n_H
+            self._derived['n_elem'] = {
+                elem: u.Quantity(n_H * self.abundances[elem], u.cm ** -3, copy=False)
+                for elem in self.elements
+            }
+        return dict(self._derived['n_elem'])
 
     @property
     def n_e(self):
-        return self._n_e
+        n_e = self._stored('n_e')
+        return u.Quantity(self._n_e if n_e is None else n_e, u.cm ** -3, copy=False)
 
     @property
     def T_e(self):
-        return self._T_e
+        T_e = self._stored('T_e')
+        return u.Quantity(self._T_e if T_e is None else T_e, u.K, copy=False)
 
     @property
     def time(self):
-        return self._time
+        time = self._stored('time')
+        return u.Quantity(self._time if time is None else time, u.s, copy=False)
 
 
 class NEI:
@@ -215,13 +411,16 @@ class NEI:
 
     adapt_dt: `bool`
         If `True`, change the time step based on the characteristic
-        ionization and recombination time scales and change in
-        temperature.  Not yet implemented.
+        ionization and recombination time scales, the change in
+        temperature and density, and an estimate of the error of each
+        step from comparing it with two half steps.  Steps with too
+        large an error are repeated with a shorter time step.
 
     safety_factor: `float` or `int`
         A multiplicative factor to multiply by the time step when
         `adapt_dt` is `True`.  Lower values improve accuracy, whereas
-        higher values reduce computational time.  Not yet implemented.
+        higher values reduce computational time.  The tolerance on the
+        error of each step scales with the square of `safety_factor`.
 
     tol: float
         The absolute tolerance to be used in comparing ionic fractions.
@@ -231,6 +430,71 @@ class NEI:
         time step. Setting `verbose` to `True` is useful for testing.
         Defaults to `False`.
 
+    propagator_cache: `bool` or `int`, optional
+        If `True`, or the maximum number of propagators to keep per
+        element, reuse the propagators of repeated steps with the same
+        temperature index and ``n_e * dt`` through a
+        `~nei.classes.propagator.PropagatorCache` for each element.
+        This pays off when `dt` is fixed and the conditions vary slowly.
+        Defaults to `False`.
+
+    segment_steps: `bool`, optional
+        If `True`, take one step per segment between the times in
+        `time_input`, split wherever the linearly interpolated
+        temperature crosses from one point of the temperature grid of
+        the eigenvalue tables to the next, so that every step lands on
+        the `time_input` nodes and uses a single table.  The temperature
+        and density of each step are taken at its midpoint.  If `dt` is
+        given, no step is longer than `dt`.  Requires `T_e` and `n` to
+        be constants or arrays, and takes precedence over `adapt_dt`.
+        Defaults to `False`.
+
+    output_file: `str`, optional
+        If given, the history of the simulation is written to this HDF5
+        file in compressed blocks by a
+        `~nei.classes.h5output.HDF5HistoryWriter` while the simulation
+        runs, and only one block is kept in memory.  The results are
+        read back from the file when they are accessed.  Defaults to
+        `None`, which keeps the whole history in memory.
+
+    output_block_size: `int`, optional
+        The number of time steps per block written to `output_file`.
+        Defaults to 4096.
+
+    output_times: `~astropy.units.Quantity`, optional
+        Increasing times at which to store the results.  The steps are
+        shortened to land exactly on these times.  If given, only the
+        initial state, the states at these times, the states selected by
+        `save_every`, and the final state are stored.
+
+    save_every: `int`, optional
+        Store the state after every `save_every` steps, as well as the
+        initial and final states.  Defaults to 1, which stores every
+        step unless `output_times` is given.
+
+    dtype: optional
+        The floating point type of the stored ionic fractions, of the
+        eigenvalue tables of the packed elements, and of the stepping
+        kernel, either `numpy.float64` (the default) or `numpy.float32`.
+        Single precision halves the memory and bandwidth used by the
+        history and the tables.  The electron density and the
+        renormalization of every step are still computed in double
+        precision.  The error of each step is estimated by
+        `~nei.classes.packed.PackedEigenTables.rounding_error`, and the
+        errors of successive steps decay over the ionization relaxation
+        time instead of accumulating.  For the elements up to neon, the
+        ionic fractions differ from those in double precision by less
+        than ``1e-3``.  A warning is issued if the estimated error of an
+        element exceeds 0.1, as for iron, whose eigenvectors are too
+        poorly conditioned for single precision.  Elements advanced one
+        at a time, as with `propagator_cache`, are computed in double
+        precision and only stored in single precision.
+
+    rate_file: `str`, optional
+        The ionization and recombination rate file from which the
+        eigenvalue tables are computed.  Defaults to the rate file
+        distributed with this package.
+
     abundances: dict
 
     Examples
@@ -257,13 +521,14 @@ class NEI:
     The initial results are stored in the `initial` attribute.
 
     >>> sim.initial.ionic_fractions['H']
+    array([0.9, 0.1])
 
     The final results can be access with the `final` attribute.
 
     >>> sim.final.ionic_fractions['H']
-    array([0.87323978, 0.12676022])
+    array([3.55083512e-04, 9.99644916e-01])
     >>> sim.final.ionic_fractions['He']
-    array([0.89964062, 0.09936038, 0.00099899])
+    array([0.75375149, 0.24533614, 0.00091237])
     >>> sim.final.T_e
     <Quantity 50000. K>
 
@@ -293,6 +558,14 @@ class NEI:
             adapt_dt: bool = None,
             safety_factor: Union[int, float] = 1,
             verbose: bool = False,
+            propagator_cache: Union[bool, int] = False,
+            segment_steps: bool = False,
+            output_file: Optional[str] = None,
+            output_block_size: int = 4096,
+            output_times: u.Quantity = None,
+            save_every: Optional[int] = None,
+            dtype=np.float64,
+            rate_file: Optional[str] = None,
     ):
 
         try:
@@ -308,6 +581,12 @@ class NEI:
             self.adapt_dt = adapt_dt
             self.safety_factor = safety_factor
             self.verbose = verbose
+            self.segment_steps = segment_steps
+            self.output_file = output_file
+            self._output_block_size = output_block_size
+            self.output_times = output_times
+            self.save_every = save_every
+            self.dtype = dtype
 
             T_e_init = self.electron_temperature(self.time_start)
             n_init = self.hydrogen_number_density(self.time_start)
@@ -329,8 +608,18 @@ class NEI:
             self.abundances = self.initial.abundances
 
             self._EigenDataDict = {
-                element: EigenData2(element) for element in self.elements
+                element: get_eigendata(element, rate_file=rate_file)
+                for element in self.elements
             }
+            self.propagator_cache = propagator_cache
+
+            try:
+                self._packed_tables = PackedEigenTables(
+                    self._EigenDataDict, dtype=self.dtype)
+            except ValueError:
+                # Tables on different temperature grids are advanced
+                # one element at a time
+                self._packed_tables = None
 
             if self.T_e_input is not None and not isinstance(inputs, dict):
                 for element in self.initial.elements:
@@ -549,6 +838,73 @@ class NEI:
         else:
             raise NEIError("Invalid safety factor.")
 
+    @property
+    def segment_steps(self):
+        return self._segment_steps
+
+    @segment_steps.setter
+    def segment_steps(self, choice):
+        if choice is True or choice is False:
+            self._segment_steps = choice
+        else:
+            raise TypeError("Invalid value for segment_steps.")
+
+    @property
+    def output_times(self) -> Optional[u.Quantity]:
+        """The times at which results are stored, or `None`."""
+        return self._output_times
+
+    @output_times.setter
+    def output_times(self, times: Optional[u.Quantity]):
+        if times is None:
+            self._output_times = None
+            return
+        try:
+            times = np.atleast_1d(times.to(u.s))
+        except (AttributeError, u.UnitConversionError):
+            raise TypeError("output_times must have units of time.") from None
+        if times.ndim != 1 or not np.all(times[1:] > times[:-1]):
+            raise ValueError("output_times must monotonically increase.")
+        self._output_times = times
+
+    @property
+    def save_every(self) -> int:
+        """The number of steps between stored states."""
+        return self._save_every
+
+    @save_every.setter
+    def save_every(self, n: Optional[int]):
+        if n is None:
+            n = 1 if self.output_times is None else self.max_steps + 1
+        if not isinstance(n, (int, np.integer)) or n < 1:
+            raise TypeError("save_every must be a positive integer.")
+        self._save_every = int(n)
+
+    @property
+    def dtype(self) -> np.dtype:
+        """The floating point type of the stored ionic fractions and of
+        the stepping kernel."""
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, dtype):
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            raise TypeError(f"Unsupported dtype: {dtype}.")
+        self._dtype = dtype
+
+    @property
+    def output_file(self) -> Optional[str]:
+        """The HDF5 file to which the history is written, or `None`."""
+        return self._output_file
+
+    @output_file.setter
+    def output_file(self, filename):
+        if filename is None or isinstance(filename, (str, os.PathLike)):
+            self._output_file = filename
+        else:
+            raise TypeError("Invalid output_file.")
+
     @property
     def verbose(self):
         return self._verbose
@@ -600,6 +956,8 @@ class NEI:
             if T_e.isscalar:
                 self._T_e_input = T_e
                 self._electron_temperature = lambda time: T_e
+                T_e_value = T_e.value
+                self._electron_temperature_value = lambda time: T_e_value
             else:
                 if self._time_input is None:
                     raise TypeError(
@@ -609,6 +967,9 @@ class NEI:
                     raise ValueError("len(T_e) not equal to len(time_input).")
                 f = interpolate.interp1d(time_input.value, T_e.value)
                 self._electron_temperature = lambda time: f(time.value) * u.K
+                times, values = time_input.value, T_e.value
+                self._electron_temperature_value = \
+                    lambda time: np.interp(time, times, values)
                 self._T_e_input = T_e
         elif callable(T_e):
             if self.time_start is not None:
@@ -619,8 +980,11 @@ class NEI:
                     raise ValueError("Invalid electron temperature function.")
             self._T_e_input = T_e
             self._electron_temperature = T_e
+            self._electron_temperature_value = \
+                lambda time: T_e(time * u.s).to_value(u.K)
         elif T_e is None:
             self._electron_temperature = lambda: None
+            self._electron_temperature_value = None
         else:
             raise TypeError("Invalid T_e")
 
@@ -655,6 +1019,8 @@ class NEI:
             if n.isscalar:
                 self._n_input = n
                 self.hydrogen_number_density = lambda time: n
+                n_value = n.value
+                self._hydrogen_number_density_value = lambda time: n_value
             else:
                 if self._time_input is None:
                     raise TypeError(
@@ -665,6 +1031,9 @@ class NEI:
                 f = interpolate.interp1d(time_input.value, n.value)
                 self._hydrogen_number_density = \
                     lambda time: f(time.value) * u.cm ** -3
+                times, values = time_input.value, n.value
+                self._hydrogen_number_density_value = \
+                    lambda time: np.interp(time, times, values)
                 self._n_input = n
         elif callable(n):
             if self.time_start is not None:
@@ -675,8 +1044,11 @@ class NEI:
                     raise ValueError("Invalid number density function.")
             self._n_input = n
             self._hydrogen_number_density = n
+            self._hydrogen_number_density_value = \
+                lambda time: n(time * u.s).to_value(u.cm ** -3)
         elif n is None:
             self._hydrogen_number_density = lambda: None
+            self._hydrogen_number_density_value = None
         else:
             raise TypeError("Invalid n.")
 
@@ -687,10 +1059,62 @@ class NEI:
             raise NEIError("Invalid time in hydrogen_density")
         return self._hydrogen_number_density(time)
 
+    def _electron_temperature_kelvin(self, time):
+        """
+        Return the electron temperature in kelvin as a `float` at a
+        `float` time in seconds, for use in the unit-free stepping loop.
+        """
+        T_e = float(self._electron_temperature_value(time))
+        if not 0 <= T_e < np.inf:
+            raise NEIError(f"T_e = {T_e} K at time = {time} s.")
+        return T_e
+
+    def _hydrogen_number_density_cgs(self, time):
+        """
+        Return the hydrogen number density in cm**-3 as a `float` at a
+        `float` time in seconds, for use in the unit-free stepping loop.
+        """
+        n = float(self._hydrogen_number_density_value(time))
+        if not 0 <= n < np.inf:
+            raise NEIError(f"n = {n} cm**-3 at time = {time} s.")
+        return n
+
     @property
     def EigenDataDict(self):
         return self._EigenDataDict
 
+    @property
+    def rate_file(self) -> str:
+        """The rate file from which the eigenvalue tables are computed."""
+        return self._EigenDataDict['H'].rate_file
+
+    @property
+    def propagator_cache(self) -> Optional[Dict[str, PropagatorCache]]:
+        """
+        The `~nei.classes.propagator.PropagatorCache` of each element,
+        or `None` if propagators are not cached.  Propagators for a
+        known ``n_e * dt`` may be computed ahead of the simulation with
+        their ``precompute`` method.
+        """
+        return self._propagator_cache
+
+    @propagator_cache.setter
+    def propagator_cache(self, choice: Union[bool, int]):
+        if choice is False or choice is None:
+            self._propagator_cache = None
+        elif choice is True:
+            self._propagator_cache = {
+                elem: PropagatorCache(self.EigenDataDict[elem])
+                for elem in self.elements
+            }
+        elif isinstance(choice, (int, np.integer)) and choice > 0:
+            self._propagator_cache = {
+                elem: PropagatorCache(self.EigenDataDict[elem], max_entries=choice)
+                for elem in self.elements
+            }
+        else:
+            raise TypeError("Invalid value for propagator_cache.")
+
     @property
     def initial(self):
         """
@@ -732,15 +1156,128 @@ class NEI:
 
     def _initialize_simulation(self):
 
+        # The output times within the simulation, as floats in seconds
+        time_start = self.time_start.to_value(u.s)
+        time_max = self.time_max.to_value(u.s)
+        if self.output_times is not None:
+            outputs = self.output_times.to_value(u.s)
+            outputs = outputs[(outputs > time_start) & (outputs <= time_max)]
+        else:
+            outputs = np.empty(0)
+        self._output_times_value = outputs
+        self._next_output = 0
+
+        # Store the initial state, the selected states, and the final state
+        if outputs.size == 0 and self.save_every == 1:
+            rows = self.max_steps
+        else:
+            rows = self.max_steps // self.save_every + outputs.size + 1
+
+        if self.output_file is not None:
+            writer = HDF5HistoryWriter(
+                self.output_file,
+                {elem: pl.atomic.atomic_number(elem) + 1 for elem in self.elements},
+                block_size=self._output_block_size,
+                dtype=self.dtype,
+            )
+        else:
+            writer = None
+
         self._results = Simulation(
             initial=self.initial,
             n_init=self.hydrogen_number_density(self.time_start),
             T_e_init=self.electron_temperature(self.time_start),
-            max_steps=self.max_steps,
+            max_steps=rows,
             time_start=self.time_start,
+            writer=writer,
+            dtype=self.dtype,
         )
-        self._old_time = self.time_start.to(u.s)
-        self._new_time = self.time_start.to(u.s)
+
+        # The stepping loop works with floats in seconds, kelvin, and
+        # cm**-3.  Units are only reattached to the results.
+        self._time_max_value = self.time_max.to_value(u.s)
+        self._dt_input_value = self.dt_input.to_value(u.s) \
+            if self.dt_input is not None else None
+        self._old_time = time_start
+        self._new_time = self._old_time
+        self._dt_next = None
+
+        # The state at the end of the latest step, which is only stored
+        # in the results at the output times.
+        self._steps_taken = 0
+        self._current_time = time_start
+        self._current_T_e = self._electron_temperature_kelvin(time_start)
+        self._current_n_H = self._hydrogen_number_density_cgs(time_start)
+        self._recorded = True
+
+        # Advance all elements at once unless propagators are cached
+        if self._packed_tables is not None and self._propagator_cache is None:
+            if self.dtype == np.float32:
+                _check_rounding_error(self._packed_tables)
+            self._packed_state = \
+                self._packed_tables.pack(self.initial.ionic_fractions)
+            self._charge_weights = \
+                self._packed_tables.charge_weights(self.abundances)
+        else:
+            self._packed_state = None
+            self._element_state = {
+                elem: np.array(self.initial.ionic_fractions[elem], dtype=np.float64)
+                for elem in self.elements
+            }
+
+    def _current_state(self):
+        """Return the packed or per-element ionic fractions at the end
+        of the latest step."""
+        if self._packed_state is not None:
+            return self._packed_state
+        return self._element_state
+
+    def _output_due(self, steps_taken, time) -> bool:
+        """
+        Return whether the state after ``steps_taken`` steps, at
+        ``time`` in seconds, is stored, and move past the output times
+        that it reaches.
+        """
+        due = steps_taken % self.save_every == 0
+        outputs = self._output_times_value
+        while self._next_output < outputs.size \
+                and outputs[self._next_output] <= time:
+            self._next_output += 1
+            due = True
+        return due
+
+    def _record(self):
+        """Store the state at the end of the latest step in the results."""
+        state = self._current_state()
+        if self._packed_state is not None:
+            # The packed charge states of the elements, without the
+            # padding, are the columns of the history.
+            state = state[self._packed_tables.mask]
+        self.results._assign(
+            new_time=self._current_time,
+            new_ionfracs=state,
+            new_n=self._current_n_H,
+            new_T_e=self._current_T_e,
+        )
+        self._recorded = True
+
+    def _output_mask(self, times) -> np.ndarray:
+        """
+        Return whether the state at each of ``times[1:]``, the ends of
+        consecutive steps, is stored.  The final state is always stored.
+        """
+        steps_taken = self._steps_taken + np.arange(1, len(times))
+        keep = steps_taken % self.save_every == 0
+        keep |= np.isin(times[1:], self._output_times_value)
+        if keep.size:
+            keep[-1] = True
+        return keep
+
+    def _with_output_times(self, times) -> np.ndarray:
+        """Return the increasing step boundaries ``times`` with the output
+        times between the first and the last of them inserted."""
+        outputs = self._output_times_value
+        return np.union1d(times, outputs[(outputs > times[0]) & (outputs < times[-1])])
 
     def simulate(self):
         """
@@ -749,31 +1286,224 @@ class NEI:
 
         self._initialize_simulation()
 
-        for step in range(self.max_steps):
+        try:
+            self._advance_simulation()
+        except BaseException:
+            self._results._close_output()
+            raise
+
+        self._finalize_simulation()
 
+    def _advance_simulation(self):
+        """Take the steps of the simulation with the chosen method."""
+        if self.segment_steps:
             try:
-                self.set_timestep()
-                self.time_advance()
-            except StopIteration:
-                break
+                self._run_steps(self._segment_times(), midpoints=True)
+            except Exception as exc:
+                raise NEIError(f"Unable to complete simulation.") from exc
+        elif self._packed_state is not None and not self.adapt_dt:
+            try:
+                self._simulate_schedule()
             except Exception as exc:
                 raise NEIError(f"Unable to complete simulation.") from exc
+        else:
+            for step in range(self.max_steps):
 
-        self._finalize_simulation()
+                try:
+                    self.set_timestep()
+                    self.time_advance()
+                except StopIteration:
+                    break
+                except Exception as exc:
+                    raise NEIError(f"Unable to complete simulation.") from exc
+
+    def _input_values(self, value_function, input_, times):
+        """
+        Evaluate a float-valued input function at an array of times in
+        seconds.  Functions given by the user are called once per time.
+        """
+        if isinstance(input_, u.Quantity):
+            values = np.asarray(value_function(times), dtype=np.float64)
+            values = np.broadcast_to(values, times.shape)
+        else:
+            values = np.array([value_function(time) for time in times])
+        if not np.all((0 <= values) & (values < np.inf)):
+            raise NEIError("Invalid temperature or density in simulation.")
+        return values
+
+    def _simulate_schedule(self, chunk_size=65536):
+        """
+        Run the simulation with a fixed time step from start to finish.
+        The steps are the same as those of `set_timestep` and
+        `time_advance`.
+        """
+        dt = self._dt_input_value
+
+        # As in set_timestep, stop at time_max or after max_steps steps
+        times = np.cumsum(np.concatenate(
+            ([self._old_time], np.full(self.max_steps, dt))))
+        beyond = np.flatnonzero(times >= self._time_max_value)
+        if beyond.size:
+            times = times[:beyond[0] + 1]
+            times[-1] = min(times[-1], self._time_max_value)
+
+        # Steps that would pass an output time end on it instead
+        times = self._with_output_times(times)[:self.max_steps + 1]
+
+        self._run_steps(times, chunk_size=chunk_size)
+
+    def _segment_times(self) -> np.ndarray:
+        """
+        Return the times in seconds that bound the steps of a simulation
+        with `segment_steps`: the start and end of the simulation, the
+        nodes of `time_input` in between, and the times at which the
+        temperature crosses the midpoint between two neighboring
+        temperatures of the grid of any element, with steps longer than
+        `dt_input` split evenly.  At most `max_steps` steps are taken.
+        """
+        for input_ in (self.T_e_input, self.n_input):
+            if not isinstance(input_, u.Quantity):
+                raise NEIError(
+                    "segment_steps requires T_e and n to be constants or "
+                    "arrays.")
+
+        start, stop = self._old_time, self._time_max_value
+        times = [start, stop]
+        if self.time_input is not None:
+            time_input = self.time_input.to_value(u.s)
+            times.extend(time_input[(time_input > start) & (time_input < stop)])
+        times = self._with_output_times(np.unique(times))
+
+        boundaries = _temperature_boundaries(
+            self.EigenDataDict[elem] for elem in self.elements)
+        T_e = self._input_values(
+            self._electron_temperature_value, self.T_e_input, times)
+        crossings = [
+            _grid_crossings(t0, t1, T0, T1, boundaries)
+            for t0, t1, T0, T1 in zip(times[:-1], times[1:], T_e[:-1], T_e[1:])
+        ]
+        times = np.unique(np.concatenate([times] + crossings))
+
+        if self._dt_input_value is not None:
+            pieces = np.ceil(np.diff(times) / self._dt_input_value).astype(int)
+            times = np.concatenate([
+                np.linspace(t0, t1, max(k, 1), endpoint=False)
+                for t0, t1, k in zip(times[:-1], times[1:], pieces)
+            ] + [times[-1:]])
+
+        return times[:self.max_steps + 1]
+
+    def _run_steps(self, times, midpoints=False, chunk_size=65536):
+        """
+        Advance the ionic fractions from each of ``times`` in seconds to
+        the next and store the results at the output times.
+
+        The temperature and density of each step are taken at its start,
+        or at its midpoint if ``midpoints`` is `True`.  Packed states are
+        advanced with `~nei.time_advance.run_schedule`, which uses the
+        compiled stepping kernel if it is available, and other states
+        one element at a time.  With an output file, the chunks of steps
+        given to the kernel are no longer than the blocks written to the
+        file, so that the history of a chunk stays small.
+        """
+        steps = np.diff(times)
+        T_e = self._input_values(
+            self._electron_temperature_value, self.T_e_input, times)
+        n_H = self._input_values(
+            self._hydrogen_number_density_value, self.n_input, times)
+
+        if midpoints:
+            step_times = times[:-1] + steps / 2
+            T_e_step = self._input_values(
+                self._electron_temperature_value, self.T_e_input, step_times)
+            n_H_step = self._input_values(
+                self._hydrogen_number_density_value, self.n_input, step_times)
+        else:
+            T_e_step, n_H_step = T_e[:-1], n_H[:-1]
+
+        keep = self._output_mask(times)
+
+        if self._packed_state is not None:
+            packed = self._packed_tables
+            if self.output_file is not None:
+                chunk_size = min(chunk_size, self._output_block_size)
+            # The element and charge state of each column of the history
+            elem_index, state_index = np.nonzero(packed.mask)
+            for start in range(0, len(steps), chunk_size):
+                stop = min(start + chunk_size, len(steps))
+                T_e_indices, table_index = np.unique(
+                    packed.temperature_index(T_e_step[start:stop]),
+                    return_inverse=True)
+                history = run_schedule(
+                    packed.stack(T_e_indices),
+                    table_index,
+                    n_H_step[start:stop],
+                    steps[start:stop],
+                    self._charge_weights,
+                    self._packed_state,
+                    nstates=packed.nstates,
+                )
+                if self.verbose:
+                    n_e = n_H[start:stop] * np.sum(
+                        self._charge_weights * history[:-1], axis=(1, 2))
+                    for step in range(start, stop):
+                        print(f"step={self._steps_taken + step + 1}  "
+                              f"T_e={T_e_step[step]}  n_e={n_e[step - start]}  "
+                              f"dt={steps[step]}")
+
+                rows = np.flatnonzero(keep[start:stop])
+                ends = slice(start + 1, stop + 1)
+                self.results._assign_history(
+                    new_times=times[ends][rows],
+                    new_ionfracs=history[(rows + 1)[:, np.newaxis],
+                                         elem_index, state_index],
+                    new_n=n_H[ends][rows],
+                    new_T_e=T_e[ends][rows],
+                )
+                self._packed_state = history[-1]
+        else:
+            state = self._element_state
+            for step, dt in enumerate(steps):
+                if self.verbose:
+                    print(f"step={self._steps_taken + step + 1}  "
+                          f"T_e={T_e_step[step]}  "
+                          f"n_e={self._electron_density(state, n_H[step])}  "
+                          f"dt={dt}")
+                n_e = self._electron_density(state, n_H_step[step])
+                state = self._advance_state(state, T_e_step[step], n_e * dt)
+                if keep[step]:
+                    self.results._assign(
+                        new_time=times[step + 1],
+                        new_ionfracs=state,
+                        new_n=n_H[step + 1],
+                        new_T_e=T_e[step + 1],
+                    )
+            self._element_state = state
+
+        self._steps_taken += len(steps)
+        self._current_time = times[-1]
+        self._current_T_e = T_e[-1]
+        self._current_n_H = n_H[-1]
+        self._old_time = self._new_time = times[-1]
+        self._dt_value = steps[-1] if steps.size else self._dt_input_value
 
     def _finalize_simulation(self):
+        if not self._recorded:
+            self._record()
         self._results._cleanup()
 
+        # The internal arrays of the results end with the final state
+        # even when the history has been written to a file.
         final_ionfracs = {
-            element: self.results.ionic_fractions[element][-1, :]
-            for element in self.elements
+            element: self.results._history[-1, offset].copy()
+            for element, offset in self.results._offsets.items()
         }
 
         self._final = IonizationStates(
             inputs=final_ionfracs,
             abundances=self.abundances,
-            n_H=np.sum(self.results.number_densities['H'][-1, :]),  # modify this later?,
-            T_e=self.results.T_e[-1],
+            n_H=self.results._n_H[-1] * u.cm ** -3,
+            T_e=self.results._T_e[-1] * u.K,
             tol=1e-6,
         )
 
@@ -785,81 +1515,230 @@ class NEI:
                 raise NEIError(f"{dt} is not a valid timestep.")
             finally:
                 self._dt = dt
+            self._dt_value = dt.value
         elif self.adapt_dt:
-            raise NotImplementedError(
-                "Adaptive time step not yet implemented; set adapt_dt "
-                "to False.")
-        elif self.dt_input is not None:
-            self._dt = self.dt_input
+            self._dt_value = self._adaptive_timestep()
+        elif self._dt_input_value is not None:
+            self._dt_value = self._dt_input_value
         else:
             raise NEIError("Unable to get set timestep.")
 
         self._old_time = self._new_time
-        self._new_time = self._old_time + self._dt
+        self._new_time = self._old_time + self._dt_value
 
-        if self._old_time >= self.time_max:
+        if self._old_time >= self._time_max_value:
             raise StopIteration
 
-        if self._new_time > self.time_max:
-            self._new_time = self.time_max
-            self._dt = self._new_time - self._old_time
+        if self._new_time > self._time_max_value:
+            self._new_time = self._time_max_value
+            self._dt_value = self._new_time - self._old_time
 
-    def time_advance(self):
+        # Land exactly on the next output time
+        outputs = self._output_times_value
+        if self._next_output < outputs.size \
+                and self._new_time > outputs[self._next_output]:
+            self._new_time = outputs[self._next_output]
+            self._dt_value = self._new_time - self._old_time
 
-        # TODO: Fully implement units into this.
+    def _adaptive_timestep(self):
+        """
+        Return the time step in seconds proposed for the next step when
+        `adapt_dt` is `True`.
+
+        The first step resolves the shortest relaxation time scale of
+        the eigenvalues at the initial temperature, unless `dt_input`
+        is given.  Later steps start from the time step proposed by the
+        error estimate of the previous step in `time_advance`.  The step
+        is then shortened until the electron temperature and hydrogen
+        number density change by less than a fraction of their values
+        over the step.  Both limits scale with `safety_factor`.
+        """
+        time = self._new_time
+        T_e = self._electron_temperature_kelvin(time)
+        n_H = self._hydrogen_number_density_cgs(time)
 
-        step = self.results._index
-        T_e = self.results.T_e[step - 1].value
-        n_e = self.results.n_e[step - 1].value
-        dt = self._dt.value
+        if self._dt_next is None:
+            if self._dt_input_value is not None:
+                dt = self._dt_input_value
+            else:
+                n_e = self._electron_density(
+                    self._current_state(), self._current_n_H)
+                rate = max(np.max(np.abs(self.EigenDataDict[elem].eigenvalues(T_e=T_e)))
+                           for elem in self.elements)
+                rate *= n_e if n_e > 0 else n_H
+                dt = self.safety_factor / rate if rate > 0 else \
+                    self._time_max_value - time
+            if not 0 < dt < np.inf:
+                raise NEIError("Unable to choose the first time step; set dt.")
+            self._dt_min = _ADAPTIVE_MIN_STEP_FRACTION * dt
+        else:
+            dt = self._dt_next
+
+        # set_timestep stops the simulation if no time remains
+        dt = min(dt, self._time_max_value - time)
+        if dt <= 0:
+            return dt
+
+        max_change = _ADAPTIVE_MAX_INPUT_CHANGE * self.safety_factor
+        for _ in range(_ADAPTIVE_MAX_INPUT_ITERATIONS):
+            change = 0.0
+            if T_e > 0:
+                change = abs(self._electron_temperature_kelvin(time + dt) - T_e) / T_e
+            if n_H > 0:
+                change = max(change, abs(
+                    self._hydrogen_number_density_cgs(time + dt) - n_H) / n_H)
+            if change <= max_change or dt <= self._dt_min:
+                break
+            dt = max(dt * max(_ADAPTIVE_MIN_STEP_CHANGE, 0.9 * max_change / change),
+                     self._dt_min)
 
-        if self.verbose:
-            print(
-                f"step={step}  T_e={T_e}  n_e={n_e}  dt={dt}"
-            )
+        return dt
 
-        new_ionic_fractions = {}
+    def _advance_state(self, state, T_e, n_e_dt):
+        """
+        Advance the ionic fractions in ``state``, either a packed array
+        or a `dict` keyed by element, over one step at the temperature
+        ``T_e`` in kelvin with the product ``n_e_dt`` of the electron
+        density in cm**-3 and the time step in seconds.
+        """
+
+        # Due to truncation errors in the solutions in the eigenvalues
+        # and eigenvectors, there is a chance that very slightly
+        # negative ionic fractions will arise.  These are not natural
+        # and will make the code grumpy.  For these reasons, the ionic
+        # fractions will be very slightly unnormalized.  We set
+        # negative ionic fractions to zero and renormalize.
+
+        if isinstance(state, np.ndarray):
+            try:
+                packed = self._packed_tables
+                ft = packed.advance(state, packed.temperature_index(T_e), n_e_dt)
+                np.clip(ft, 0.0, None, out=ft)
+                # Normalize in double precision if the tables are single
+                ft = (ft / np.sum(ft, axis=1, keepdims=True, dtype=np.float64)
+                      ).astype(packed.dtype, copy=False)
+            except Exception as exc:
+                raise NEIError("Unable to do time advance") from exc
+            return ft
 
+        new_ionic_fractions = {}
         try:
             for elem in self.elements:
-                nstates = self.results.nstates[elem]
-                f0 = self.results._ionic_fractions[elem][self.results._index - 1, :]
+                eigendata = self.EigenDataDict[elem]
+                T_e_index = eigendata._get_temperature_index(T_e)
+
+                if self._propagator_cache is not None:
+                    ft = self._propagator_cache[elem].advance(
+                        state[elem], T_e_index, n_e_dt)
+                else:
+                    ft = advance(
+                        state[elem],
+                        eigendata.eigenvalues(T_e_index=T_e_index),
+                        eigendata.eigenvectors(T_e_index=T_e_index),
+                        eigendata.eigenvector_inverses(T_e_index=T_e_index),
+                        n_e_dt,
+                    )
+
+                ft[np.where(ft < 0.0)] = 0.0
+                new_ionic_fractions[elem] = ft / np.sum(ft)
+
+        except Exception as exc:
+            raise NEIError(f"Unable to do time advance for {elem}") from exc
 
-                evals = self.EigenDataDict[elem].eigenvalues(T_e=T_e)
-                evect = self.EigenDataDict[elem].eigenvectors(T_e=T_e)
-                evect_inverse = self.EigenDataDict[elem].eigenvector_inverses(T_e=T_e)
+        return new_ionic_fractions
 
-                diagonal_evals = np.zeros((nstates, nstates), dtype=np.float64)
-                for ii in range(0, nstates):
-                    diagonal_evals[ii, ii] = np.exp(evals[ii] * dt * n_e)
+    def _electron_density(self, state, n_H):
+        """
+        Return the electron density in cm**-3 of the ionic fractions in
+        ``state`` at the hydrogen number density ``n_H`` in cm**-3.
+        """
+        if isinstance(state, np.ndarray):
+            return n_H * np.sum(self._charge_weights * state)
+        results = self.results
+        return n_H * (results._flatten(state) @ results._charge_weights)
 
-                matrix_1 = np.dot(diagonal_evals, evect)
-                matrix_2 = np.dot(evect_inverse, matrix_1)
+    def _advance_with_error_control(self, state, T_e, n_e):
+        """
+        Advance ``state`` over the current time step by step doubling.
+
+        The step is compared with two half steps, the second of which
+        uses the temperature, density, and electron density at the
+        midpoint.  While the largest difference in an ionic fraction
+        exceeds the tolerance, the step is retried with a shorter time
+        step.  The time step of the next step is proposed from the
+        difference of the accepted step, and the result of the two half
+        steps is returned.
+        """
+        tolerance = _ADAPTIVE_TOLERANCE * self.safety_factor ** 2
+
+        while True:
+            dt = self._dt_value
+            full = self._advance_state(state, T_e, n_e * dt)
+            half = self._advance_state(state, T_e, n_e * dt / 2)
+
+            midpoint = self._old_time + dt / 2
+            n_e_midpoint = self._electron_density(
+                half, self._hydrogen_number_density_cgs(midpoint))
+            double = self._advance_state(
+                half, self._electron_temperature_kelvin(midpoint),
+                n_e_midpoint * dt / 2)
+
+            if isinstance(state, np.ndarray):
+                error = np.max(np.abs(double - full))
+            else:
+                error = max(np.max(np.abs(double[elem] - full[elem]))
+                            for elem in self.elements)
 
-                ft = np.dot(f0, matrix_2)
+            if error <= tolerance or dt <= self._dt_min:
+                break
 
-                # Due to truncation errors in the solutions in the
-                # eigenvalues and eigenvectors, there is a chance that
-                # very slightly negative ionic fractions will arise.
-                # These are not natural and will make the code grumpy.
-                # For these reasons, the ionic fractions will be very
-                # slightly unnormalized.  We set negative ionic
-                # fractions to zero and renormalize.
+            factor = max(_ADAPTIVE_MIN_STEP_CHANGE, 0.9 * np.sqrt(tolerance / error))
+            self._dt_value = max(dt * factor, self._dt_min)
+            self._new_time = self._old_time + self._dt_value
 
-                ft[np.where(ft < 0.0)] = 0.0
-                new_ionic_fractions[elem] = ft / np.sum(ft)
+        if error == 0:
+            factor = _ADAPTIVE_MAX_STEP_CHANGE
+        else:
+            factor = min(_ADAPTIVE_MAX_STEP_CHANGE, 0.9 * np.sqrt(tolerance / error))
+        self._dt_next = dt * factor
 
-        except Exception as exc:
-            raise NEIError(f"Unable to do time advance for {elem}") from exc
+        return double
+
+    def time_advance(self):
+
+        # All quantities are floats in seconds, kelvin, and cm**-3.
+
+        step = self._steps_taken + 1
+        T_e = self._current_T_e
+        state = self._current_state()
+        n_e = self._electron_density(state, self._current_n_H)
+
+        if self.adapt_dt:
+            new_state = self._advance_with_error_control(state, T_e, n_e)
         else:
+            new_state = self._advance_state(state, T_e, n_e * self._dt_value)
+
+        dt = self._dt_value
 
-            new_time = self.results.time[self.results._index-1] + self._dt
-            self.results._assign(
-                new_time=new_time,
-                new_ionfracs=new_ionic_fractions,
-                new_T_e=self.electron_temperature(new_time),
-                new_n=self.hydrogen_number_density(new_time),
+        if self.verbose:
+            print(
+                f"step={step}  T_e={T_e}  n_e={n_e}  dt={dt}"
             )
 
+        if self._packed_state is not None:
+            self._packed_state = new_state
+        else:
+            self._element_state = new_state
+
+        # The end of the step is only stored at the output times
+        new_time = self._new_time
+        self._steps_taken = step
+        self._current_time = new_time
+        self._current_T_e = self._electron_temperature_kelvin(new_time)
+        self._current_n_H = self._hydrogen_number_density_cgs(new_time)
+        self._recorded = False
+        if self._output_due(step, new_time):
+            self._record()
+
     def save(self, filename="nei.h5"):
         ...
@@ -0,0 +1,240 @@
+"""
+Advance the charge states of several elements at once.
+
+The ionic fractions of all elements are stored in one contiguous array
+with one row per element, padded with zeros to the largest number of
+charge states.  The eigenvalue tables of the elements are padded in the
+same way, with zero eigenvalues and identity eigenvectors for the
+padding, so that one stacked product advances every element and the
+padding stays zero.
+"""
+
+import collections
+
+import numpy as np
+
+__all__ = ['PackedEigenTables']
+
+
+class PackedEigenTables:
+    """
+    The eigenvalue tables of several elements padded to a common
+    number of charge states.
+
+    The stacked tables at each temperature index are built the first
+    time they are needed and kept in a bounded cache.
+
+    Parameters
+    ----------
+    eigendata : `dict`
+        The `~nei.classes.eigenvaluetable.EigenData2` instance of each
+        element, in the order of the rows of the packed arrays.  All
+        tables must share the same temperature grid.
+
+    max_entries : `int`, optional
+        The maximum number of temperature indices whose stacked tables
+        are kept.  Defaults to 64.
+
+    dtype : optional
+        The floating point type of the stacked tables and of the packed
+        ionic fractions, either `numpy.float64` (the default) or
+        `numpy.float32`.  The tables are computed in double precision
+        and rounded when they are stacked.
+
+    Raises
+    ------
+    ValueError
+        If the tables do not share the same temperature grid, or if
+        ``dtype`` is not supported.
+
+    Examples
+    --------
+    >>> from nei.classes.eigenregistry import get_eigendata
+    >>> packed = PackedEigenTables(
+    ...     {elem: get_eigendata(elem) for elem in ['H', 'He', 'O']})
+    >>> f = packed.pack({'H': [1, 0], 'He': [1, 0, 0], 'O': [1] + [0] * 8})
+    >>> T_e_index = packed.temperature_index(1e6)
+    >>> f = packed.advance(f, T_e_index, n_e_dt=1e10)
+    >>> packed.unpack(f)['He'].shape
+    (3,)
+    """
+
+    def __init__(self, eigendata, max_entries=64, dtype=np.float64):
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+        self._dtype = np.dtype(dtype)
+        if self._dtype not in (np.float32, np.float64):
+            raise ValueError(f"Unsupported dtype: {self._dtype}.")
+
+        self._elements = list(eigendata)
+        self._eigendata = [eigendata[elem] for elem in self._elements]
+
+        temperature_grid = self._eigendata[0].temperature_grid
+        for elem, table in zip(self._elements, self._eigendata):
+            if not np.array_equal(table.temperature_grid, temperature_grid):
+                raise ValueError(
+                    f"The temperature grid of {elem} differs from the "
+                    f"temperature grid of {self._elements[0]}.")
+
+        self._nstates = np.array([table._nstates for table in self._eigendata])
+        self._max_nstates = int(self._nstates.max())
+        self._mask = np.arange(self._max_nstates) < self._nstates[:, np.newaxis]
+        self._max_entries = max_entries
+        self._entries = collections.OrderedDict()
+
+    @property
+    def elements(self) -> list:
+        """The elements in the order of the rows of the packed arrays."""
+        return self._elements
+
+    @property
+    def dtype(self) -> np.dtype:
+        """The floating point type of the stacked tables and of the
+        packed ionic fractions."""
+        return self._dtype
+
+    @property
+    def nstates(self) -> np.ndarray:
+        """The number of charge states of each element."""
+        return self._nstates
+
+    @property
+    def max_nstates(self) -> int:
+        """The number of columns of the packed arrays."""
+        return self._max_nstates
+
+    @property
+    def mask(self) -> np.ndarray:
+        """A boolean array that is `True` for the entries of the packed
+        arrays that are charge states rather than padding."""
+        return self._mask
+
+    def temperature_index(self, T_e):
+        """Return the index on the shared temperature grid closest to
+        ``T_e`` in kelvin."""
+        return self._eigendata[0]._get_temperature_index(T_e)
+
+    def pack(self, ionic_fractions) -> np.ndarray:
+        """
+        Return the ionic fractions given as a `dict` keyed by element
+        as a packed array with shape ``(len(elements), max_nstates)``.
+        """
+        packed = np.zeros((len(self._elements), self._max_nstates), dtype=self._dtype)
+        for row, elem in enumerate(self._elements):
+            packed[row, :self._nstates[row]] = ionic_fractions[elem]
+        return packed
+
+    def unpack(self, packed) -> dict:
+        """
+        Return views of the rows of a packed array without the padding
+        as a `dict` keyed by element.  Packed arrays with leading
+        dimensions, such as histories, are unpacked along their last
+        two axes.
+        """
+        return {
+            elem: packed[..., row, :self._nstates[row]]
+            for row, elem in enumerate(self._elements)
+        }
+
+    def charge_weights(self, abundances) -> np.ndarray:
+        """
+        Return the charge of each state times the abundance of its
+        element relative to hydrogen, as a packed array, so that the
+        electron density is ``n_H * np.sum(charge_weights * packed)``.
+        """
+        abundances = np.array([abundances[elem] for elem in self._elements])
+        charges = np.where(self._mask, np.arange(self._max_nstates), 0)
+        return charges * abundances[:, np.newaxis]
+
+    def tables(self, T_e_index):
+        """
+        Return the stacked eigenvalues, eigenvectors, and eigenvector
+        inverses at the temperature index ``T_e_index``, with shapes
+        ``(len(elements), max_nstates)`` and
+        ``(len(elements), max_nstates, max_nstates)``.
+        """
+        T_e_index = int(T_e_index)
+        entry = self._entries.get(T_e_index)
+        if entry is not None:
+            self._entries.move_to_end(T_e_index)
+            return entry
+
+        nelem = len(self._elements)
+        nmax = self._max_nstates
+        evals = np.zeros((nelem, nmax), dtype=self._dtype)
+        evect = np.zeros((nelem, nmax, nmax), dtype=self._dtype)
+        evect[:] = np.eye(nmax)
+        evect_inverse = evect.copy()
+
+        for row, table in enumerate(self._eigendata):
+            n = self._nstates[row]
+            evals[row, :n] = table.eigenvalues(T_e_index=T_e_index)
+            evect[row, :n, :n] = table.eigenvectors(T_e_index=T_e_index)
+            evect_inverse[row, :n, :n] = \
+                table.eigenvector_inverses(T_e_index=T_e_index)
+
+        entry = (evals, evect, evect_inverse)
+        for array in entry:
+            array.flags.writeable = False
+        self._entries[T_e_index] = entry
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def stack(self, T_e_indices):
+        """
+        Return the stacked eigenvalues, eigenvectors, and eigenvector
+        inverses at each of ``T_e_indices``, with shapes
+        ``(len(T_e_indices), len(elements), max_nstates)`` and
+        ``(len(T_e_indices), len(elements), max_nstates, max_nstates)``,
+        without adding them to the cache.  The result may be passed to
+        `~nei.time_advance.kernels.run_schedule`.
+        """
+        T_e_indices = np.asarray(T_e_indices, dtype=int)
+        shape = (len(T_e_indices), len(self._elements), self._max_nstates)
+        evals = np.zeros(shape, dtype=self._dtype)
+        evect = np.zeros(shape + (self._max_nstates,), dtype=self._dtype)
+        evect[:] = np.eye(self._max_nstates)
+        evect_inverse = evect.copy()
+
+        for row, table in enumerate(self._eigendata):
+            n = self._nstates[row]
+            evals[:, row, :n] = table.eigenvalues(T_e_index=T_e_indices)
+            evect[:, row, :n, :n] = table.eigenvectors(T_e_index=T_e_indices)
+            evect_inverse[:, row, :n, :n] = \
+                table.eigenvector_inverses(T_e_index=T_e_indices)
+
+        return evals, evect, evect_inverse
+
+    def rounding_error(self) -> dict:
+        """
+        Return an estimate of the largest error in the ionic fractions of
+        each element from rounding its tables to `dtype`.
+
+        The estimate is the machine epsilon of `dtype` times the largest
+        condition number of the eigenvectors over the temperature grid.
+        It bounds the first-order error of one step, which does not grow
+        with the number of steps because every step is renormalized and
+        the charge states relax toward equilibrium.  It is usually
+        pessimistic by one to two orders of magnitude.  The condition
+        numbers are computed once per table and kept with it.
+        """
+        eps = np.finfo(self._dtype).eps
+        return {
+            elem: eps * table.max_condition_number()
+            for elem, table in zip(self._elements, self._eigendata)
+        }
+
+    def advance(self, packed, T_e_index, n_e_dt) -> np.ndarray:
+        """
+        Return the packed ionic fractions advanced over one step at the
+        temperature index ``T_e_index`` with the product ``n_e_dt`` of
+        the electron density in cm**-3 and the time step in seconds.
+
+        See `~nei.classes.propagator.advance` for the single-element
+        version.  The product is computed in the precision of `dtype`.
+        """
+        evals, evect, evect_inverse = self.tables(T_e_index)
+        coefficients = np.matmul(packed[:, np.newaxis, :], evect_inverse)
+        coefficients *= np.exp(evals * n_e_dt)[:, np.newaxis, :]
+        return np.matmul(coefficients, evect)[:, 0, :]
@@ -0,0 +1,203 @@
+"""
+Cache the propagators that advance the charge states of an element over
+a time step.
+
+Over a step of length ``dt`` at electron density ``n_e``, the ionic
+fractions ``f`` of an element evolve as ``f(t + dt) = f(t) @ P``, where
+
+    P = evect_inverse @ diag(exp(evals * n_e * dt)) @ evect
+
+depends only on the temperature index and on the product ``n_e * dt``.
+When the time step is fixed and the conditions vary slowly, the same
+propagators are needed over and over again.  Otherwise, `advance`
+applies the propagator without forming it.
+"""
+
+import collections
+import math
+
+import numpy as np
+
+from .eigenvaluetable import EigenData2
+
+__all__ = ['advance', 'PropagatorCache']
+
+
+def advance(f0, evals, evect, evect_inverse, n_e_dt) -> np.ndarray:
+    """
+    Advance the ionic fractions of an element over one time step.
+
+    The ionic fractions are projected onto the eigenbasis, each
+    component is scaled by ``exp(evals * n_e_dt)``, and the result is
+    projected back.  This takes O(nstates**2) operations, whereas
+    forming the propagator takes O(nstates**3).
+
+    Parameters
+    ----------
+    f0 : `~numpy.ndarray`
+        The ionic fractions at the start of the step.
+
+    evals, evect, evect_inverse : `~numpy.ndarray`
+        The eigenvalues, eigenvectors, and eigenvector inverses at the
+        temperature of the step, as returned by
+        `~nei.classes.eigenvaluetable.EigenData2`.
+
+    n_e_dt : `float`
+        The product of the electron density in cm**-3 and the time step
+        in seconds.
+
+    Returns
+    -------
+    ft : `~numpy.ndarray`
+        The ionic fractions at the end of the step.
+    """
+    coefficients = f0 @ evect_inverse
+    coefficients *= np.exp(evals * n_e_dt)
+    return coefficients @ evect
+
+
+class PropagatorCache:
+    """
+    A bounded cache of the propagators of one element, keyed by the
+    temperature index and a quantized ``n_e * dt``.
+
+    Parameters
+    ----------
+    eigendata : `~nei.classes.eigenvaluetable.EigenData2`
+        The eigenvalue tables of the element.
+
+    max_entries : `int`, optional
+        The maximum number of propagators kept in the cache.  The least
+        recently used propagators are evicted first.  Defaults to 4096.
+
+    rtol : `float`, optional
+        The relative width of the bins in which ``n_e * dt`` is
+        quantized.  Values of ``n_e * dt`` in the same bin share the
+        propagator computed at the center of the bin, so the time step
+        is effectively perturbed by at most ``rtol / 2``.  If zero,
+        ``n_e * dt`` must match exactly.  Defaults to ``1e-6``.
+
+    Examples
+    --------
+    >>> from nei.classes.eigenregistry import get_eigendata
+    >>> cache = PropagatorCache(get_eigendata('O'))
+    >>> cache.precompute(1e9 * 10.0)
+    >>> f0 = get_eigendata('O').equilibrium_state(T_e=1e5)
+    >>> f1 = cache.advance(f0, T_e_index=200, n_e_dt=1e9 * 10.0)
+    """
+
+    def __init__(self, eigendata: EigenData2, max_entries=4096, rtol=1e-6):
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer.")
+        if rtol < 0:
+            raise ValueError("rtol must be non-negative.")
+        self._eigendata = eigendata
+        self._max_entries = max_entries
+        self._rtol = rtol
+        self._inverse_log_step = 1 / math.log1p(rtol) if rtol else None
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def eigendata(self) -> EigenData2:
+        """The eigenvalue tables of the element."""
+        return self._eigendata
+
+    @property
+    def max_entries(self):
+        """The maximum number of propagators kept in the cache."""
+        return self._max_entries
+
+    @property
+    def rtol(self):
+        """The relative width of the bins of ``n_e * dt``."""
+        return self._rtol
+
+    def _quantize(self, n_e_dt):
+        """Return the bin of ``n_e_dt`` and the value at its center."""
+        n_e_dt = float(n_e_dt)
+        if not n_e_dt >= 0 or math.isinf(n_e_dt):
+            raise ValueError(f"Invalid n_e * dt: {n_e_dt}.")
+        if self._inverse_log_step is None or n_e_dt == 0:
+            return n_e_dt, n_e_dt
+        bin_ = round(math.log(n_e_dt) * self._inverse_log_step)
+        return bin_, math.exp(bin_ / self._inverse_log_step)
+
+    def _store(self, key, propagator):
+        self._entries[key] = propagator
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def propagator(self, T_e_index, n_e_dt) -> np.ndarray:
+        """
+        Return the propagator ``P`` for the temperature index
+        ``T_e_index`` and the product ``n_e_dt`` of the electron
+        density in cm**-3 and the time step in seconds, such that the
+        ionic fractions at the end of the step are ``f0 @ P``.
+        """
+        bin_, n_e_dt = self._quantize(n_e_dt)
+        key = (int(T_e_index), bin_)
+        propagator = self._entries.get(key)
+        if propagator is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return propagator
+
+        self.misses += 1
+        eigendata = self._eigendata
+        evals = eigendata.eigenvalues(T_e_index=key[0])
+        evect = eigendata.eigenvectors(T_e_index=key[0])
+        evect_inverse = eigendata.eigenvector_inverses(T_e_index=key[0])
+        propagator = evect_inverse @ (np.exp(evals * n_e_dt)[:, np.newaxis] * evect)
+        propagator.flags.writeable = False
+        self._store(key, propagator)
+        return propagator
+
+    def advance(self, f0, T_e_index, n_e_dt) -> np.ndarray:
+        """
+        Return the ionic fractions ``f0`` advanced over one step at the
+        temperature index ``T_e_index`` with the product ``n_e_dt`` of
+        the electron density and the time step.
+        """
+        return f0 @ self.propagator(T_e_index, n_e_dt)
+
+    def precompute(self, n_e_dt):
+        """
+        Compute the propagators for every temperature of the grid for
+        one value of ``n_e_dt`` at once.
+
+        Raises
+        ------
+        ValueError
+            If the temperature grid has more points than `max_entries`.
+        """
+        eigendata = self._eigendata
+        ntemp = len(eigendata.temperature_grid)
+        if ntemp > self._max_entries:
+            raise ValueError(
+                f"Unable to precompute {ntemp} propagators in a cache "
+                f"with max_entries = {self._max_entries}.")
+
+        bin_, n_e_dt = self._quantize(n_e_dt)
+        indices = np.arange(ntemp)
+        evals = eigendata.eigenvalues(T_e_index=indices)
+        evect = eigendata.eigenvectors(T_e_index=indices)
+        evect_inverse = eigendata.eigenvector_inverses(T_e_index=indices)
+        propagators = evect_inverse @ (
+            np.exp(evals * n_e_dt)[:, :, np.newaxis] * evect)
+        propagators.flags.writeable = False
+
+        for index in range(ntemp):
+            self._store((index, bin_), propagators[index])
+
+    def clear(self):
+        """Remove all propagators from the cache and reset the hit and
+        miss counters."""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,156 @@
+"""
+Read the ionization and recombination rates used to build
+`~nei.classes.eigenvaluetable.EigenData2` tables.
+
+The rate file distributed with this package stores the rates with
+shape ``(30, 30, ntemp)``, indexed by charge state, atomic number minus
+one, and temperature.  The functions in this module read only the
+hyperslab belonging to each requested element instead of the full
+arrays.  Rate files may also be converted to an element-major layout
+where the rates of each element are stored contiguously in a single
+compressed chunk.
+"""
+
+import h5py
+import numpy as np
+from plasmapy import atomic
+from .. import __path__
+
+__all__ = [
+    'default_rate_file',
+    'read_rates',
+    'read_rates_for_elements',
+    'write_element_major_rates',
+]
+
+# Dataset names of the element-major layout.  These differ from the
+# names of the original layout so that older readers cannot silently
+# misinterpret the axes.
+_ELEMENT_MAJOR_IONIZ = 'element_ioniz_rate'
+_ELEMENT_MAJOR_RECOMB = 'element_recomb_rate'
+
+
+def default_rate_file():
+    """Return the path of the ionization and recombination rate file
+    distributed with this package."""
+    data_dir = __path__[0] + '/data/ionizrecombrates/chianti_8.07/'
+    return data_dir + 'ionrecomb_rate.h5'
+
+
+def _read_element(f, atomic_numb):
+    """
+    Read the temperature grid and the ionization and recombination rates
+    of one element from the open rate file ``f``.  The rates are returned
+    with shape ``(ntemp, nstates)``.
+    """
+    nstates = atomic_numb + 1
+    temperature_grid = f['te_gird'][:]
+    ntemp = len(temperature_grid)
+
+    c_rate = np.zeros((ntemp, nstates))
+    r_rate = np.zeros((ntemp, nstates))
+
+    if _ELEMENT_MAJOR_IONIZ in f:
+        c_rate[:, :nstates-1] = \
+            f[_ELEMENT_MAJOR_IONIZ][atomic_numb-1, :, :nstates-1]
+        r_rate[:, 1:] = f[_ELEMENT_MAJOR_RECOMB][atomic_numb-1, :, :nstates-1]
+    else:
+        c_rate[:, :nstates-1] = f['ioniz_rate'][:nstates-1, atomic_numb-1, :].T
+        r_rate[:, 1:] = f['recomb_rate'][:nstates-1, atomic_numb-1, :].T
+
+    return temperature_grid, c_rate, r_rate
+
+
+def read_rates(element, rate_file=None):
+    """
+    Read the ionization and recombination rates of a single element.
+
+    Parameters
+    ----------
+    element : `str` or `int`
+        The element symbol or atomic number.
+
+    rate_file : `str`, optional
+        The rate file in either layout.  Defaults to the rate file
+        distributed with this package.
+
+    Returns
+    -------
+    temperature_grid : `~numpy.ndarray`
+        The temperature grid in kelvin with shape ``(ntemp,)``.
+
+    ionization_rate, recombination_rate : `~numpy.ndarray`
+        The rates with shape ``(ntemp, nstates)``.  The ionization rate
+        of the highest charge state and the recombination rate of the
+        neutral state are zero.
+    """
+    if rate_file is None:
+        rate_file = default_rate_file()
+    with h5py.File(rate_file, 'r') as f:
+        return _read_element(f, atomic.atomic_number(element))
+
+
+def read_rates_for_elements(elements, rate_file=None) -> dict:
+    """
+    Read the rates of several elements while opening the rate file only
+    once.
+
+    Returns
+    -------
+    rates : `dict`
+        The ``(temperature_grid, ionization_rate, recombination_rate)``
+        tuple returned by `read_rates` for each of ``elements``.
+    """
+    if rate_file is None:
+        rate_file = default_rate_file()
+    with h5py.File(rate_file, 'r') as f:
+        return {
+            element: _read_element(f, atomic.atomic_number(element))
+            for element in elements
+        }
+
+
+def write_element_major_rates(output_file, rate_file=None,
+                              compression='gzip'):
+    """
+    Write a copy of a rate file in the element-major layout.
+
+    The ionization and recombination rates are stored with shape
+    ``(30, ntemp, 30)``, indexed by atomic number minus one, temperature,
+    and charge state, in chunks that each hold all of the rates of one
+    element.  Reading an element then touches a single chunk.  Files in
+    this layout are accepted everywhere a rate file is.
+
+    Parameters
+    ----------
+    output_file : `str`
+        The name of the new rate file.
+
+    rate_file : `str`, optional
+        The rate file to convert.  Defaults to the rate file
+        distributed with this package.
+
+    compression : `str`, optional
+        The HDF5 compression filter applied to the rates, or `None`.
+        Defaults to ``'gzip'``.
+    """
+    if rate_file is None:
+        rate_file = default_rate_file()
+
+    with h5py.File(rate_file, 'r') as f:
+        temperature_grid = f['te_gird'][:]
+        if _ELEMENT_MAJOR_IONIZ in f:
+            ioniz = f[_ELEMENT_MAJOR_IONIZ][:]
+            recomb = f[_ELEMENT_MAJOR_RECOMB][:]
+        else:
+            ioniz = f['ioniz_rate'][:].transpose(1, 2, 0)
+            recomb = f['recomb_rate'][:].transpose(1, 2, 0)
+
+    chunks = (1,) + ioniz.shape[1:]
+    with h5py.File(output_file, 'w') as f:
+        f.attrs['layout'] = 'element-major'
+        f.create_dataset('te_gird', data=temperature_grid)
+        f.create_dataset(_ELEMENT_MAJOR_IONIZ, data=ioniz, chunks=chunks,
+                         compression=compression)
+        f.create_dataset(_ELEMENT_MAJOR_RECOMB, data=recomb, chunks=chunks,
+                         compression=compression)
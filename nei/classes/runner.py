@@ -0,0 +1,267 @@
+"""
+Run many `~nei.classes.nei.NEI` simulations in parallel.
+
+The simulations are given as dictionaries of keyword arguments to
+`~nei.classes.nei.NEI`.  They are grouped into chunks of similar
+estimated cost, the chunks are submitted to a serial, thread, process,
+or MPI executor, and the results are yielded as the chunks finish.
+"""
+
+import concurrent.futures
+import heapq
+import math
+import multiprocessing
+import os
+
+import astropy.units as u
+import numpy as np
+from plasmapy import atomic
+
+from .eigenregistry import eigen_registry
+from .eigenshare import SharedEigenTables
+from .nei import NEI
+
+__all__ = ['estimate_steps', 'balance_chunks', 'run_simulations']
+
+_EXECUTORS = ('serial', 'threads', 'processes', 'mpi')
+
+
+def _elements(config) -> list:
+    """Return the element symbols of a simulation configuration."""
+    return [atomic.atomic_symbol(elem) for elem in config['inputs']]
+
+
+def estimate_steps(config) -> int:
+    """
+    Estimate the number of steps of the simulation configured by the
+    `~nei.classes.nei.NEI` keyword arguments ``config``.
+
+    A fixed time step gives the length of the simulation divided by the
+    time step, and segment stepping gives the number of input times.
+    Otherwise the number of steps is not known in advance and
+    ``max_steps`` is returned.  The estimate never exceeds ``max_steps``.
+    """
+    max_steps = config.get('max_steps', 1000)
+    time_input = config.get('time_input')
+    time_start = config.get('time_start')
+    time_max = config.get('time_max')
+    if time_start is None:
+        time_start = time_input[0] if time_input is not None else 0 * u.s
+    if time_max is None:
+        time_max = time_input[-1] if time_input is not None else np.inf * u.s
+    span = (time_max - time_start).to_value(u.s)
+
+    dt = config.get('dt')
+    adapt_dt = config.get('adapt_dt')
+    if adapt_dt is None:
+        adapt_dt = dt is None
+
+    if config.get('segment_steps', False):
+        steps = len(time_input) - 1 if time_input is not None else 1
+        if dt is not None:
+            steps = max(steps, math.ceil(span / dt.to_value(u.s)))
+    elif dt is not None and not adapt_dt and np.isfinite(span):
+        steps = math.ceil(span / dt.to_value(u.s))
+    else:
+        steps = max_steps
+
+    return max(min(steps, max_steps), 1)
+
+
+def _estimate_cost(config):
+    """The estimated number of steps times the cost of one step, which
+    grows with the square of the number of charge states."""
+    per_step = sum((atomic.atomic_number(elem) + 1) ** 2
+                   for elem in _elements(config))
+    return estimate_steps(config) * per_step
+
+
+def balance_chunks(costs, nchunks) -> list:
+    """
+    Split tasks into at most ``nchunks`` chunks of similar total cost.
+
+    Tasks are taken from the most to the least expensive and each is
+    added to the chunk with the smallest total cost so far, which is the
+    longest processing time first rule.  The most expensive chunks are
+    returned first so that they are submitted first.
+
+    Parameters
+    ----------
+    costs : `list`
+        The estimated cost of each task.
+
+    nchunks : `int`
+        The number of chunks.
+
+    Returns
+    -------
+    chunks : `list` of `list`
+        The indices of the tasks in each non-empty chunk.
+    """
+    if nchunks < 1:
+        raise ValueError("nchunks must be a positive integer.")
+    heap = [(0, chunk) for chunk in range(nchunks)]
+    chunks = [[] for _ in range(nchunks)]
+    totals = [0] * nchunks
+    for index in sorted(range(len(costs)), key=lambda i: costs[i], reverse=True):
+        total, chunk = heapq.heappop(heap)
+        chunks[chunk].append(index)
+        totals[chunk] = total + costs[index]
+        heapq.heappush(heap, (totals[chunk], chunk))
+    order = sorted(range(nchunks), key=lambda chunk: totals[chunk], reverse=True)
+    return [chunks[chunk] for chunk in order if chunks[chunk]]
+
+
+def _preload_tables(elements, rate_file=None):
+    """Build the tables of ``elements`` in the registry of a worker."""
+    eigen_registry.preload(elements, rate_file=rate_file)
+
+
+def _simulate(config):
+    """Run one simulation and return its results."""
+    sim = NEI(**config)
+    sim.simulate()
+    return sim.results
+
+
+def _simulate_chunk(chunk):
+    """Run the simulations of a chunk of ``(index, config)`` pairs."""
+    return [(index, _simulate(config)) for index, config in chunk]
+
+
+def _mpi_executor(max_workers, elements, rate_file):
+    """Return an `mpi4py.futures.MPIPoolExecutor` and its number of
+    workers."""
+    try:
+        from mpi4py import MPI
+        from mpi4py.futures import MPIPoolExecutor
+    except ImportError:
+        raise ImportError("The mpi executor requires mpi4py.") from None
+    if max_workers is None:
+        max_workers = max(MPI.COMM_WORLD.Get_size() - 1, 1)
+    executor = MPIPoolExecutor(
+        max_workers=max_workers,
+        initializer=_preload_tables,
+        initargs=(elements, rate_file),
+    )
+    return executor, max_workers
+
+
+def run_simulations(configs, executor='serial', max_workers=None,
+                    chunks_per_worker=4, rate_file=None):
+    """
+    Run many simulations and yield their results as they finish.
+
+    Parameters
+    ----------
+    configs : `list` of `dict`
+        The keyword arguments of `~nei.classes.nei.NEI` for each
+        simulation.  For the ``'processes'`` and ``'mpi'`` executors,
+        they must be picklable, so temperatures and densities should be
+        given as arrays or module-level functions rather than lambdas.
+
+    executor : `str` or `~concurrent.futures.Executor`, optional
+        ``'serial'`` (the default), ``'threads'``, ``'processes'``, or
+        ``'mpi'``, or an existing executor.
+
+    max_workers : `int`, optional
+        The number of workers.  Defaults to the number of CPUs, or to
+        the number of MPI ranks minus one for ``'mpi'``.
+
+    chunks_per_worker : `int`, optional
+        The number of chunks per worker.  More chunks balance the load
+        better when the cost estimates are poor.  Defaults to 4.
+
+    rate_file : `str`, optional
+        The rate file from which the shared tables are computed, which
+        is used by every simulation whose configuration does not give
+        its own ``rate_file``.
+
+    Yields
+    ------
+    index : `int`
+        The index of the simulation in ``configs``.
+
+    results : `~nei.classes.nei.Simulation`
+        The results of the simulation.
+
+    Notes
+    -----
+    The tables of all elements are built once before the simulations
+    start.  Threads use the process-wide registry.  Worker processes
+    attach to one block of shared memory through
+    `~nei.classes.eigenshare.SharedEigenTables`.  MPI workers, which
+    may run on other nodes, build the tables once each when they start.
+    An existing executor is used as is.  Threads run in parallel only
+    while the compiled stepping kernel releases the global interpreter
+    lock.
+
+    Examples
+    --------
+    >>> configs = [
+    ...     dict(inputs=['H', 'He'], abundances={'H': 1, 'He': 0.1},
+    ...          T_e=T_e * u.K, n=1e9 * u.cm ** -3, time_max=1e3 * u.s,
+    ...          dt=10 * u.s, adapt_dt=False)
+    ...     for T_e in np.geomspace(1e5, 1e7, 32)
+    ... ]
+    >>> for index, results in run_simulations(
+    ...         configs, executor='processes'):  # doctest: +SKIP
+    ...     print(index, results.ionic_fractions['He'][-1])
+    """
+    configs = list(configs)
+    if rate_file is not None:
+        configs = [{'rate_file': rate_file, **config} for config in configs]
+    elements = sorted({elem for config in configs for elem in _elements(config)},
+                      key=atomic.atomic_number)
+
+    if executor == 'serial':
+        _preload_tables(elements, rate_file)
+        for index, config in enumerate(configs):
+            yield index, _simulate(config)
+        return
+
+    shared = None
+    owned = True
+    if isinstance(executor, concurrent.futures.Executor):
+        pool, owned = executor, False
+        max_workers = max_workers or os.cpu_count() or 1
+    elif executor == 'threads':
+        _preload_tables(elements, rate_file)
+        max_workers = max_workers or os.cpu_count() or 1
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+    elif executor == 'processes':
+        shared = SharedEigenTables(elements, rate_file=rate_file)
+        max_workers = max_workers or os.cpu_count() or 1
+        # Forked workers would share the resource tracker of this
+        # process, which would then lose track of the shared memory.
+        pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=SharedEigenTables.attach,
+            initargs=(shared.descriptor,),
+        )
+    elif executor == 'mpi':
+        pool, max_workers = _mpi_executor(max_workers, elements, rate_file)
+    else:
+        raise ValueError(
+            f"executor must be one of {_EXECUTORS} or an Executor instance.")
+
+    chunks = balance_chunks(
+        [_estimate_cost(config) for config in configs],
+        max_workers * chunks_per_worker)
+
+    futures = []
+    try:
+        futures = [
+            pool.submit(_simulate_chunk, [(index, configs[index]) for index in chunk])
+            for chunk in chunks
+        ]
+        for future in concurrent.futures.as_completed(futures):
+            yield from future.result()
+    finally:
+        for future in futures:
+            future.cancel()
+        if owned:
+            pool.shutdown(wait=True)
+        if shared is not None:
+            shared.unlink()
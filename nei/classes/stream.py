@@ -0,0 +1,275 @@
+"""
+Advance the charge states of a plasma as its temperature and density
+arrive one sample at a time.
+
+Histories extracted on the fly from large simulations do not have to be
+stored in full.  Only the latest sample and the current ionic fractions
+are kept, so memory use does not grow with the length of the history.
+"""
+
+from typing import Dict, Union
+
+import astropy.units as u
+import numpy as np
+from plasmapy import atomic
+
+from .eigenregistry import get_eigendata
+from .nei import (NEIError, _check_rounding_error, _grid_crossings,
+                  _temperature_boundaries)
+from .packed import PackedEigenTables
+
+__all__ = ['NEIStream']
+
+
+def _value(quantity, unit):
+    """Return a `float` in ``unit`` from a quantity or a number that is
+    already in ``unit``."""
+    if isinstance(quantity, u.Quantity):
+        return float(quantity.to_value(unit))
+    return float(quantity)
+
+
+class NEIStream:
+    """
+    Advance ionic fractions through a stream of ``(time, T_e, n)``
+    samples.
+
+    Between two samples, the electron temperature and hydrogen number
+    density change linearly in time.  The interval is split wherever the
+    temperature crosses from one point of the temperature grid to the
+    next, and into steps no longer than ``dt`` if it is given.  Each step
+    uses the temperature and density at its midpoint, as with the
+    ``segment_steps`` option of `~nei.classes.nei.NEI`.
+
+    Parameters
+    ----------
+    inputs : `list` or `dict`
+        The elements, in which case the plasma starts in ionization
+        equilibrium at the temperature of the first sample, or a `dict`
+        with the initial ionic fractions of each element.
+
+    abundances : `dict`
+        The abundance of each element relative to hydrogen.
+
+    dt : `~astropy.units.Quantity`, optional
+        The longest time step.  Defaults to one step per interval between
+        samples and grid temperature crossings.
+
+    rate_file : `str`, optional
+        The rate file from which the eigenvalue tables are computed.
+        Defaults to the rate file distributed with this package.
+
+    dtype : optional
+        The floating point type of the ionic fractions and of the
+        eigenvalue tables, either `numpy.float64` (the default) or
+        `numpy.float32`.  The electron density and the renormalization
+        of every step are computed in double precision.  See the
+        ``dtype`` option of `~nei.classes.nei.NEI` for the accuracy of
+        single precision.
+
+    Raises
+    ------
+    NEIError
+        If the inputs are invalid or the tables of the elements do not
+        share a temperature grid.
+
+    Examples
+    --------
+    >>> stream = NEIStream(['H', 'He', 'O'], {'H': 1, 'He': 0.1, 'O': 1e-3})
+    >>> samples = ((t * u.s, (1e5 + 1e3 * t) * u.K, 1e9 * u.cm ** -3)
+    ...            for t in range(1000))
+    >>> for time, ionic_fractions in stream.run(samples):
+    ...     pass
+    >>> stream.ionic_fractions['O'].shape
+    (9,)
+
+    Samples may also come from an asynchronous iterator:
+
+    >>> async def consume(samples):
+    ...     async for time, ionic_fractions in stream.run_async(samples):
+    ...         pass
+
+    Notes
+    -----
+    Times, temperatures, and densities given without units are taken to
+    be in seconds, kelvin, and cm**-3.
+    """
+
+    def __init__(self, inputs: Union[list, Dict], abundances: Dict,
+                 dt: u.Quantity = None, rate_file: str = None,
+                 dtype=np.float64):
+        elements = [atomic.atomic_symbol(elem) for elem in inputs]
+        if 'H' not in elements:
+            raise NEIError("Must have H in elements")
+        self._abundances = {
+            atomic.atomic_symbol(elem): abundance
+            for elem, abundance in abundances.items()
+        }
+        missing = set(elements) - set(self._abundances)
+        if missing:
+            raise NEIError(f"Missing abundances for {sorted(missing)}.")
+
+        try:
+            self._dt = dt.to_value(u.s) if dt is not None else None
+        except (AttributeError, u.UnitConversionError):
+            raise NEIError("Invalid dt.") from None
+        if self._dt is not None and not self._dt > 0:
+            raise NEIError("dt must be positive.")
+
+        self._eigendata = eigendata = {
+            elem: get_eigendata(elem, rate_file=rate_file) for elem in elements}
+        try:
+            self._packed_tables = PackedEigenTables(eigendata, dtype=dtype)
+        except ValueError as exc:
+            raise NEIError("Unable to pack the eigenvalue tables.") from exc
+        if self._packed_tables.dtype == np.float32:
+            _check_rounding_error(self._packed_tables)
+        self._boundaries = _temperature_boundaries(eigendata.values())
+        self._charge_weights = self._packed_tables.charge_weights(self._abundances)
+
+        self._inputs = {atomic.atomic_symbol(elem): value
+                        for elem, value in inputs.items()} \
+            if isinstance(inputs, dict) else None
+        self._state = None
+        self._sample = None
+        self.nsteps = 0
+
+    @property
+    def elements(self) -> list:
+        """The elements of the simulation."""
+        return self._packed_tables.elements
+
+    @property
+    def abundances(self) -> dict:
+        """The abundance of each element relative to hydrogen."""
+        return self._abundances
+
+    def _latest(self):
+        if self._sample is None:
+            raise NEIError("No samples have been received.")
+        return self._sample
+
+    @property
+    def time(self) -> u.Quantity:
+        """The time of the latest sample."""
+        return self._latest()[0] * u.s
+
+    @property
+    def T_e(self) -> u.Quantity:
+        """The electron temperature of the latest sample."""
+        return self._latest()[1] * u.K
+
+    @property
+    def n(self) -> u.Quantity:
+        """The hydrogen number density of the latest sample."""
+        return self._latest()[2] * u.cm ** -3
+
+    @property
+    def n_e(self) -> u.Quantity:
+        """The electron density at the time of the latest sample."""
+        n_H = self._latest()[2]
+        return n_H * np.sum(self._charge_weights * self._state) * u.cm ** -3
+
+    @property
+    def ionic_fractions(self) -> dict:
+        """The ionic fractions of each element at the time of the latest
+        sample."""
+        self._latest()
+        return self._packed_tables.unpack(self._state)
+
+    def _initial_state(self, T_e):
+        """Return the packed initial ionic fractions."""
+        if self._inputs is None:
+            return self._packed_tables.pack({
+                elem: self._eigendata[elem].equilibrium_state(T_e=T_e)
+                for elem in self.elements
+            })
+        try:
+            return self._packed_tables.pack(self._inputs)
+        except (KeyError, ValueError):
+            raise NEIError("Invalid initial ionic fractions.") from None
+
+    def push(self, time, T_e, n) -> dict:
+        """
+        Advance the ionic fractions to the time of a new sample.
+
+        Parameters
+        ----------
+        time, T_e, n
+            The time, electron temperature, and hydrogen number density
+            of the sample, as quantities or as numbers in seconds,
+            kelvin, and cm**-3.
+
+        Returns
+        -------
+        ionic_fractions : `dict`
+            The ionic fractions of each element at ``time``.
+
+        Raises
+        ------
+        NEIError
+            If the time does not increase or the temperature or density
+            is invalid.
+        """
+        sample = (_value(time, u.s), _value(T_e, u.K), _value(n, u.cm ** -3))
+        if not (0 <= sample[1] < np.inf and 0 <= sample[2] < np.inf):
+            raise NEIError(f"Invalid temperature or density at time = {sample[0]} s.")
+
+        if self._sample is None:
+            self._state = self._initial_state(sample[1])
+            self._sample = sample
+            return self.ionic_fractions
+
+        (t0, T0, n0), (t1, T1, n1) = self._sample, sample
+        if not t1 > t0:
+            raise NEIError(f"Sample times must increase: {t1} s after {t0} s.")
+
+        times = np.concatenate(
+            ([t0], _grid_crossings(t0, t1, T0, T1, self._boundaries), [t1]))
+        if self._dt is not None:
+            pieces = np.ceil(np.diff(times) / self._dt).astype(int)
+            times = np.concatenate([
+                np.linspace(start, stop, max(k, 1), endpoint=False)
+                for start, stop, k in zip(times[:-1], times[1:], pieces)
+            ] + [[t1]])
+
+        packed = self._packed_tables
+        state = self._state
+        for start, stop in zip(times[:-1], times[1:]):
+            weight = ((start + stop) / 2 - t0) / (t1 - t0)
+            T_e_step = T0 + (T1 - T0) * weight
+            n_H_step = n0 + (n1 - n0) * weight
+            n_e = n_H_step * np.sum(self._charge_weights * state, dtype=np.float64)
+
+            # Set the slightly negative ionic fractions left by
+            # truncation errors to zero and renormalize in double
+            # precision.
+            state = packed.advance(
+                state, packed.temperature_index(T_e_step), n_e * (stop - start))
+            np.clip(state, 0.0, None, out=state)
+            state = (state / np.sum(state, axis=1, keepdims=True, dtype=np.float64)
+                     ).astype(packed.dtype, copy=False)
+
+        self.nsteps += len(times) - 1
+        self._state = state
+        self._sample = sample
+        return self.ionic_fractions
+
+    def run(self, samples):
+        """
+        Advance through an iterable of ``(time, T_e, n)`` samples and
+        yield the time in seconds and the ionic fractions after each.
+        """
+        for time, T_e, n in samples:
+            ionic_fractions = self.push(time, T_e, n)
+            yield self._sample[0], ionic_fractions
+
+    async def run_async(self, samples):
+        """
+        Advance through an asynchronous iterable of ``(time, T_e, n)``
+        samples and yield the time in seconds and the ionic fractions
+        after each.
+        """
+        async for time, T_e, n in samples:
+            ionic_fractions = self.push(time, T_e, n)
+            yield self._sample[0], ionic_fractions
@@ -0,0 +1,99 @@
+import os
+
+import numpy as np
+import pytest
+from scipy.io import FortranFile
+
+from ..eigenclass import EigenData, eigen_dat_filename, read_eigen_dat
+from ..eigenregistry import EigenDataRegistry
+from ..eigenvaluetable import EigenData2
+
+
+def _read_with_fortranfile(filename):
+    """Read a table the way `EigenData` originally did."""
+    with FortranFile(filename, 'r') as f:
+        ntemp, atomic_numb = f.read_ints(np.int32)
+        nstates = atomic_numb + 1
+        return {
+            'temperature_grid': f.read_reals(np.float64),
+            'equilibrium_states':
+                f.read_reals(np.float64).reshape((ntemp, nstates)),
+            'eigenvalues': f.read_reals(np.float64).reshape((ntemp, nstates)),
+            'eigenvectors':
+                f.read_reals(np.float64).reshape((ntemp, nstates, nstates)),
+            'eigenvector_inverses':
+                f.read_reals(np.float64).reshape((ntemp, nstates, nstates)),
+            'ionization_rate':
+                f.read_reals(np.float64).reshape((ntemp, nstates)),
+            'recombination_rate':
+                f.read_reals(np.float64).reshape((ntemp, nstates)),
+        }
+
+
+@pytest.mark.parametrize('element', ['H', 'He', 'O', 'Cl'])
+@pytest.mark.parametrize('mmap', [True, False])
+def test_read_eigen_dat(element, mmap):
+    filename = eigen_dat_filename(element)
+    tables = read_eigen_dat(filename, mmap=mmap)
+    assert isinstance(tables['eigenvectors'], np.memmap) == mmap
+    for name, expected in _read_with_fortranfile(filename).items():
+        assert np.array_equal(tables[name], expected), name
+
+
+def test_eigen_dat_filename():
+    assert os.path.basename(eigen_dat_filename('Cl')) == 'Cieigen.dat'
+    assert os.path.basename(eigen_dat_filename(8)) == 'oeigen.dat'
+    assert read_eigen_dat(eigen_dat_filename('Cl'))['atomic_numb'] == 17
+
+
+def test_read_eigen_dat_truncated(tmp_path):
+    with open(eigen_dat_filename('He'), 'rb') as f:
+        data = f.read()
+    filename = str(tmp_path / 'heeigen.dat')
+    with open(filename, 'wb') as f:
+        f.write(data[:-3])
+    with pytest.raises(ValueError):
+        read_eigen_dat(filename)
+
+
+def test_eigendata():
+    eigendata = EigenData('O', temperature=1e6)
+    assert eigendata.eigenvector_inverses.shape == (9, 9)
+    assert np.isclose(eigendata.equilibrium_state.sum(), 1)
+
+
+@pytest.mark.parametrize('element', ['He', 'C', 'O'])
+def test_from_eigen_dat(element):
+    """The precomputed tables propagate like tables computed from the
+    same rates."""
+    table = EigenData2.from_eigen_dat(element)
+    dat = read_eigen_dat(eigen_dat_filename(element))
+    computed = EigenData2(element, rates=(
+        dat['temperature_grid'],
+        np.array(dat['ionization_rate']),
+        np.array(dat['recombination_rate'])))
+
+    nstates = table._nstates
+    f0 = np.zeros(nstates)
+    f0[0] = 1
+    for index in [1, 100, 200, 300]:
+        propagated = []
+        for eigen in (table, computed):
+            evals = eigen.eigenvalues(T_e_index=index)
+            evect = eigen.eigenvectors(T_e_index=index)
+            evect_inverse = eigen.eigenvector_inverses(T_e_index=index)
+            propagated.append(
+                ((f0 @ evect_inverse) * np.exp(evals * 1e10)) @ evect)
+        assert np.allclose(*propagated, atol=1e-8)
+        assert np.allclose(table.equilibrium_state(T_e_index=index),
+                           computed.equilibrium_state(T_e_index=index),
+                           atol=1e-8)
+
+
+def test_registry_preload_eigen_dat():
+    registry = EigenDataRegistry()
+    registry.preload_eigen_dat(['H', 'O'])
+    assert 'O' in registry
+    table = registry.get('O')
+    assert table.rate_file == eigen_dat_filename('O')
+    assert isinstance(table._eigenvalues, np.memmap)
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from ..eigenregistry import EigenDataRegistry, eigen_registry, get_eigendata
+from ..eigenvaluetable import EigenData2
+
+
+def test_shared_instances():
+    registry = EigenDataRegistry()
+    table = registry.get('He')
+    assert isinstance(table, EigenData2)
+    assert registry.get(2) is table
+    assert 'He' in registry
+    assert len(registry) == 1
+
+
+def test_read_only():
+    table = EigenDataRegistry().get('He')
+    with pytest.raises(ValueError):
+        table._eigenvalues[0, 0] = 0.0
+
+
+def test_lru_eviction():
+    budget = EigenData2('H').nbytes + EigenData2('Li').nbytes
+    registry = EigenDataRegistry(max_bytes=budget)
+    registry.preload(['H', 'He'])
+    registry.get('H')
+    registry.get('Li')
+    assert 'He' not in registry
+    assert 'H' in registry and 'Li' in registry
+    assert registry.nbytes <= registry.max_bytes
+
+
+def test_table_larger_than_budget_is_kept():
+    registry = EigenDataRegistry(max_bytes=0)
+    table = registry.get('O')
+    assert 'O' in registry
+    registry.get('H')
+    assert 'O' not in registry and 'H' in registry
+    assert registry.get('O') is not table
+
+
+def test_added_tables_are_pinned():
+    """Tables backed by memory maps are not evicted, and do not count
+    toward the budget."""
+    registry = EigenDataRegistry(max_bytes=0)
+    table = EigenData2.from_eigen_dat('O')
+    registry.add(table)
+    assert registry.nbytes == 0
+    registry.get('H')
+    registry.get('He')
+    assert registry.get('O', rate_file=table.rate_file) is table
+    assert 'H' not in registry and 'He' in registry
+
+    carbon = EigenData2.from_eigen_dat('C')
+    registry.add(carbon, pinned=False)
+    assert registry.nbytes == carbon.nbytes
+    registry.get('H')
+    assert registry._key('C', carbon.rate_file) not in registry._tables
+
+
+def test_clear():
+    registry = EigenDataRegistry()
+    registry.preload(['H', 'He'])
+    registry.clear()
+    assert len(registry) == 0
+    assert registry.nbytes == 0
+
+
+def test_module_registry():
+    assert get_eigendata('H') is eigen_registry.get('H')
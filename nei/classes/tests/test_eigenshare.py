@@ -0,0 +1,54 @@
+import multiprocessing
+
+import numpy as np
+
+from ..eigenregistry import eigen_registry
+from ..eigenshare import (SharedEigenTables, export_eigen_tables,
+                          open_exported_tables)
+
+elements = ['H', 'He', 'O']
+
+
+def _assert_same_tables(table, expected):
+    for name, array in expected._tables().items():
+        assert np.array_equal(table._tables()[name], array), name
+
+
+def test_export_and_memory_map(tmp_path):
+    directory = str(tmp_path / 'tables')
+    export_eigen_tables(directory, elements)
+    tables = open_exported_tables(directory, register=False)
+    assert list(tables) == elements
+    for symbol, table in tables.items():
+        assert isinstance(table._eigenvectors, np.memmap)
+        assert not table._eigenvectors.flags.writeable
+        _assert_same_tables(table, eigen_registry.get(symbol))
+
+
+def test_shared_memory_attach():
+    with SharedEigenTables(elements) as shared:
+        tables = SharedEigenTables.attach(shared.descriptor, register=False)
+        for symbol, table in tables.items():
+            assert not table._eigenvector_inverses.flags.writeable
+            _assert_same_tables(table, eigen_registry.get(symbol))
+            assert np.allclose(table.equilibrium_state(T_e=1e6),
+                               eigen_registry.get(symbol).equilibrium_state(T_e=1e6))
+        del tables, table
+
+
+def _checksum(symbol):
+    table = eigen_registry.get(symbol)
+    return symbol, float(np.sum(table._eigenvalues)), \
+        hasattr(table, '_shared_memory')
+
+
+def test_shared_memory_pool():
+    expected = {symbol: float(np.sum(eigen_registry.get(symbol)._eigenvalues))
+                for symbol in elements}
+    with SharedEigenTables(elements) as shared:
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(2, initializer=SharedEigenTables.attach,
+                      initargs=(shared.descriptor,)) as pool:
+            for symbol, checksum, is_shared in pool.map(_checksum, elements):
+                assert checksum == expected[symbol]
+                assert is_shared
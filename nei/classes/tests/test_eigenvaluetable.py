@@ -161,3 +161,215 @@ def test_element_range():
         element_symbol = atomic.atomic_symbol(int(i))
         eigen = nei.EigenData2(element=element_symbol)
         print(f'Element: ', element_symbol)
+
+def test_eigen_cache(tmp_path):
+    """
+    Test that tables loaded from the on-disk cache are identical to the
+    computed tables, and that corrupted cache files are recomputed.
+    """
+    cache_dir = str(tmp_path)
+    cold = nei.EigenData2(element='O', cache=True, cache_dir=cache_dir)
+    cache_files = list(tmp_path.glob('eigen_v*_Z08_*.npz'))
+    assert len(cache_files) == 1
+
+    warm = nei.EigenData2(element='O', cache=True, cache_dir=cache_dir)
+    for name, array in cold._tables().items():
+        assert np.array_equal(array, warm._tables()[name]), name
+
+    cache_files[0].write_bytes(b'not a cache file')
+    recomputed = nei.EigenData2(element='O', cache=True, cache_dir=cache_dir)
+    assert np.array_equal(recomputed.eigenvalues(T_e_index=100),
+                          cold.eigenvalues(T_e_index=100))
+
+    assert nei.clear_eigen_cache(cache_dir) == 1
+
+
+def test_eigen_cache_solvers(tmp_path):
+    """Tables computed by different solvers are cached separately."""
+    cache_dir = str(tmp_path)
+    computed = {
+        solver: nei.EigenData2(element='He', solver=solver)
+        for solver in ('eig', 'tridiagonal')
+    }
+    for solver in computed:
+        nei.EigenData2(element='He', cache=True, cache_dir=cache_dir, solver=solver)
+    assert len(list(tmp_path.glob('eigen_v*_Z02_*.npz'))) == 2
+
+    for solver, expected in computed.items():
+        warm = nei.EigenData2(element='He', cache=True, cache_dir=cache_dir,
+                              solver=solver)
+        for name, array in expected._tables().items():
+            assert np.array_equal(array, warm._tables()[name]), (solver, name)
+
+    # The solvers give different round-off, so a mix-up would be seen
+    assert not np.array_equal(computed['eig'].eigenvectors(T_e_index=100),
+                              computed['tridiagonal'].eigenvectors(T_e_index=100))
+
+    assert nei.clear_eigen_cache(cache_dir) == 2
+
+@pytest.mark.parametrize('element', ['H', 'He', 'C', 'O'])
+def test_batched_eigen_decomposition(element):
+    """
+    Test that the batched eigen decomposition reproduces the rate
+    matrices at every temperature and that the rate matrices conserve
+    the total number of particles.
+    """
+    table = nei.EigenData2(element=element)
+    A = nei.classes.eigenvaluetable._rate_matrices(
+        table._ionization_rate, table._recombination_rate)
+    assert A.shape == (table._ntemp, table._nstates, table._nstates)
+    assert np.allclose(A.sum(axis=1), 0.0, atol=1e-20)
+
+    # A = V @ diag(la) @ V^-1 with V stored transposed
+    v = table._eigenvectors.transpose(0, 2, 1)
+    v_inverse = table._eigenvector_inverses.transpose(0, 2, 1)
+    reconstructed = np.einsum('tij,tj,tjk->tik', v, table._eigenvalues, v_inverse)
+    scale = np.abs(A).max(axis=(1, 2), keepdims=True)
+    assert np.allclose(reconstructed / scale, A / scale, atol=1e-8)
+
+def test_lazy_decomposition():
+    """
+    Test that lazily computed eigensystems match the eagerly computed
+    ones and that only the accessed temperatures are computed.
+    """
+    eager = nei.EigenData2(element='O')
+    lazy = nei.EigenData2(element='O', lazy=True)
+    assert not lazy._computed.any()
+
+    for index in [3, 250, 400]:
+        assert np.array_equal(lazy.eigenvalues(T_e_index=index),
+                              eager.eigenvalues(T_e_index=index))
+        assert np.array_equal(lazy.eigenvectors(T_e_index=index),
+                              eager.eigenvectors(T_e_index=index))
+        assert np.array_equal(lazy.eigenvector_inverses(T_e_index=index),
+                              eager.eigenvector_inverses(T_e_index=index))
+    assert np.count_nonzero(lazy._computed) == 3
+
+    for name, array in lazy._tables().items():
+        assert np.array_equal(array, eager._tables()[name]), name
+    assert lazy._computed is None
+
+
+def test_temperature_window():
+    """
+    Test that a temperature window restricts the table to the grid
+    temperatures spanning the window.
+    """
+    full = nei.EigenData2(element='O')
+    window = nei.EigenData2(element='O', temperature_window=(1e5, 1e6),
+                            lazy=True)
+    grid = window.temperature_grid
+    assert grid[0] <= 1e5 < grid[1] and grid[-2] < 1e6 <= grid[-1]
+    assert window.nbytes < full.nbytes / 4
+
+    T_e = 3e5
+    assert np.array_equal(window.eigenvalues(T_e=T_e), full.eigenvalues(T_e=T_e))
+    assert np.array_equal(window.equilibrium_state(T_e=T_e),
+                          full.equilibrium_state(T_e=T_e))
+
+    with pytest.raises(ValueError):
+        nei.EigenData2(element='O', temperature_window=(1e6, 1e5))
+
+@pytest.mark.parametrize('element', ['H', 'He', 'O'])
+def test_tridiagonal_solver(element):
+    """
+    Test that the symmetric tridiagonal solver and the general solver
+    give the same eigenvalues and time advance.
+    """
+    general = nei.EigenData2(element=element, solver='eig')
+    tridiagonal = nei.EigenData2(element=element, solver='tridiagonal')
+    for index in range(1, general._ntemp, 50):
+        la_g = general.eigenvalues(T_e_index=index)
+        la_t = tridiagonal.eigenvalues(T_e_index=index)
+        assert np.allclose(la_t, la_g, rtol=1e-10, atol=1e-12 * np.abs(la_g).max())
+
+        f0 = np.full(general._nstates, 1 / general._nstates)
+        ne_dt = 10 / np.abs(la_g).max()
+        results = []
+        for table in (general, tridiagonal):
+            evals = table.eigenvalues(T_e_index=index)
+            evect = table.eigenvectors(T_e_index=index)
+            evect_inverse = table.eigenvector_inverses(T_e_index=index)
+            results.append(((f0 @ evect_inverse) * np.exp(evals * ne_dt)) @ evect)
+        assert np.allclose(results[0], results[1], atol=1e-12)
+
+
+def test_invalid_solver():
+    with pytest.raises(ValueError):
+        nei.EigenData2(element='H', solver='qr')
+
+@pytest.mark.parametrize('element', ['H', 'He', 'O', 'Fe'])
+def test_equilibrium_charge_states(element):
+    """
+    Test that the vectorized equilibrium solver satisfies detailed
+    balance and is normalized over the whole temperature grid.
+    """
+    table = nei.EigenData2(element=element)
+    c_rate = table._ionization_rate
+    r_rate = table._recombination_rate
+    eqi = nei.equilibrium_charge_states(c_rate, r_rate)
+    assert eqi.shape == c_rate.shape
+    assert np.all(np.isfinite(eqi)) and np.all(eqi >= 0)
+    assert np.allclose(eqi.sum(axis=1), 1.0)
+    assert np.allclose(c_rate[:, :-1] * eqi[:, :-1], r_rate[:, 1:] * eqi[:, 1:],
+                       rtol=1e-10, atol=1e-300)
+    assert np.array_equal(table.equilibrium_state(T_e_index=250), eqi[250])
+
+
+def test_equilibrium_charge_states_extreme_rates():
+    """Test rates whose ratios overflow or vanish."""
+    c_rate = np.array([[1e300, 1e300, 1e300, 0.0],
+                       [0.0, 1.0, 1.0, 0.0]])
+    r_rate = np.array([[0.0, 1e-300, 1e-300, 1e-300],
+                       [0.0, 1.0, 1.0, 1.0]])
+    eqi = nei.equilibrium_charge_states(c_rate, r_rate)
+    assert np.allclose(eqi, [[0, 0, 0, 1], [1, 0, 0, 0]])
+
+
+def _linear_scan_index(temperature_grid, T_e):
+    """The original linear search for the closest temperature index."""
+    if T_e >= temperature_grid[-1]:
+        return len(temperature_grid) - 1
+    if T_e <= temperature_grid[0]:
+        return 0
+    index = np.where(temperature_grid >= T_e)[0][0]
+    if abs(T_e - temperature_grid[index - 1]) <= abs(T_e - temperature_grid[index]):
+        index -= 1
+    return index
+
+
+@pytest.mark.parametrize('log_uniform', [True, False])
+def test_temperature_index(log_uniform):
+    table = nei.EigenData2('He', lazy=True)
+    grid = table.temperature_grid
+    if not log_uniform:
+        table = nei.EigenData2('He', lazy=True, rates=(
+            grid + 1e4 * np.arange(len(grid)), table._ionization_rate, table._recombination_rate))
+        grid = table.temperature_grid
+    assert (table._log_grid is not None) == log_uniform
+
+    midpoints = 0.5 * (grid[1:] + grid[:-1])
+    T_e = np.concatenate([
+        grid, midpoints, np.nextafter(midpoints, np.inf),
+        np.geomspace(grid[0], grid[-1], 997),
+    ])
+    expected = [_linear_scan_index(grid, T) for T in T_e]
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        assert np.array_equal(table._get_temperature_index(T_e), expected)
+        for T, index in zip(T_e[::37], expected[::37]):
+            assert table._get_temperature_index(T) == index
+
+    table.reset_out_of_range_counts()
+    indices = table._get_temperature_index([grid[0] / 2, 1e6, grid[-1] * 2])
+    assert list(indices[[0, 2]]) == [0, len(grid) - 1]
+    assert table.out_of_range_counts == {'below': 1, 'above': 1}
+
+
+def test_temperature_index_zero():
+    table = nei.EigenData2('He')
+    assert np.array_equal(table.eigenvalues(T_e_index=0),
+                          table._eigenvalues[0])
+    T_e = table.temperature_grid[[3, 50, 200]]
+    assert table.eigenvectors(T_e=T_e).shape == (3, 3, 3)
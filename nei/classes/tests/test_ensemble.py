@@ -0,0 +1,104 @@
+import astropy.units as u
+import numpy as np
+import pytest
+
+from ..ensemble import NEIEnsemble
+from ..nei import NEI, NEIError
+
+abundances = {'H': 1, 'He': 0.1, 'O': 1e-3}
+time = np.linspace(0, 1000, 11) * u.s
+T_e = np.geomspace([1e5, 2e5, 3e5], [1e6, 4e6, 2e6], 11, axis=1) * u.K
+n = np.array([[1e9] * 11, [5e8] * 11, np.linspace(1e9, 2e9, 11)]) * u.cm ** -3
+
+
+def test_ensemble_shapes():
+    ensemble = NEIEnsemble(['H', 'He', 'O'], abundances, time=time, T_e=T_e, n=n)
+    ionic_fractions = ensemble.simulate()
+    assert ensemble.n_parcels == 3
+    for elem, nstates in [('H', 2), ('He', 3), ('O', 9)]:
+        assert ionic_fractions[elem].shape == (3, 11, nstates)
+        assert np.allclose(ionic_fractions[elem].sum(axis=2), 1)
+    assert ensemble.n_e.shape == (3, 11)
+
+
+def test_ensemble_default_chunk_size():
+    """The default chunk gathers about 32 MiB of eigenvectors."""
+    ensemble = NEIEnsemble(['H', 'He', 'O'], abundances, time=time, T_e=T_e, n=n)
+    gathered = ensemble._chunk_size * 3 * 9 ** 2 * 8
+    assert 31 * 2 ** 20 < gathered <= 32 * 2 ** 20
+
+    single = NEIEnsemble(['H', 'He', 'O'], abundances, time=time, T_e=T_e, n=n,
+                         dtype=np.float32)
+    assert abs(single._chunk_size - 2 * ensemble._chunk_size) <= 1
+
+
+def test_ensemble_chunk_size():
+    """The results do not depend on how the parcels are chunked."""
+    results = []
+    for chunk_size in [1, 2, None]:
+        ensemble = NEIEnsemble(['H', 'He', 'O'], abundances, time=time, T_e=T_e,
+                               n=n, dt=10 * u.s, chunk_size=chunk_size)
+        results.append((ensemble.simulate(), ensemble.n_e))
+    for ionic_fractions, n_e in results[1:]:
+        for elem in ionic_fractions:
+            assert np.array_equal(ionic_fractions[elem], results[0][0][elem])
+        assert np.array_equal(n_e, results[0][1])
+
+
+def test_ensemble_matches_nei():
+    """Each parcel agrees with an NEI simulation with a short time step."""
+    ensemble = NEIEnsemble(['H', 'He', 'O'], abundances, time=time, T_e=T_e, n=n,
+                           dt=1 * u.s, chunk_size=2)
+    ionic_fractions = ensemble.simulate()
+
+    for parcel in range(3):
+        sim = NEI(inputs=['H', 'He', 'O'], abundances=abundances,
+                  time_input=time, T_e=T_e[parcel], n=n[parcel],
+                  time_max=time[-1], dt=0.1 * u.s, adapt_dt=False,
+                  max_steps=10000)
+        sim.simulate()
+        for elem in ensemble.elements:
+            assert np.allclose(ionic_fractions[elem][parcel],
+                               sim.results.ionic_fractions[elem][::1000],
+                               atol=2e-3)
+        assert np.allclose(ensemble.n_e[parcel], sim.results.n_e[::1000], rtol=1e-3)
+
+
+def test_ensemble_single_precision():
+    kwargs = dict(time=time, T_e=T_e, n=n, dt=1 * u.s)
+    expected = NEIEnsemble(['H', 'He', 'O'], abundances, **kwargs).simulate()
+    ensemble = NEIEnsemble(['H', 'He', 'O'], abundances, dtype=np.float32, **kwargs)
+    ionic_fractions = ensemble.simulate()
+    for elem in ensemble.elements:
+        assert ionic_fractions[elem].dtype == np.float32
+        assert np.allclose(ionic_fractions[elem], expected[elem], rtol=0, atol=1e-3)
+    assert ensemble.n_e.dtype == np.float64
+
+
+def test_ensemble_initial_fractions():
+    initial = {'H': [1, 0], 'He': [[1, 0, 0], [0, 1, 0], [0, 0, 1]], 'O': [1] + [0] * 8}
+    ensemble = NEIEnsemble(initial, abundances, time=time, T_e=T_e, n=n)
+    ionic_fractions = ensemble.simulate()
+    assert np.array_equal(ionic_fractions['He'][:, 0], np.eye(3))
+    assert np.array_equal(ionic_fractions['H'][:, 0], [[1, 0]] * 3)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'T_e': T_e[0]},
+    {'n': n[:2]},
+    {'time': time[::-1]},
+    {'dt': -1 * u.s},
+    {'abundances': {'H': 1, 'He': 0.1}},
+])
+def test_ensemble_invalid(kwargs):
+    arguments = dict(inputs=['H', 'He', 'O'], abundances=abundances,
+                     time=time, T_e=T_e, n=n)
+    arguments.update(kwargs)
+    with pytest.raises(NEIError):
+        NEIEnsemble(**arguments)
+
+
+def test_ensemble_not_simulated():
+    ensemble = NEIEnsemble(['H', 'He'], abundances, time=time, T_e=T_e, n=n)
+    with pytest.raises(NEIError):
+        ensemble.ionic_fractions
@@ -0,0 +1,92 @@
+import astropy.units as u
+import h5py
+import numpy as np
+import pytest
+
+from ..h5output import HDF5HistoryWriter
+from ..nei import NEI
+
+kwargs = dict(
+    inputs=['H', 'He', 'O'],
+    abundances={'H': 1, 'He': 0.1, 'O': 1e-3},
+    T_e=lambda time: 1e5 * (1 + time / (10 * u.s)) * u.K,
+    n=1e9 * u.cm ** -3,
+    time_max=100 * u.s,
+    dt=1 * u.s,
+    max_steps=200,
+)
+
+
+@pytest.mark.parametrize('options', [
+    {'adapt_dt': False},
+    {'adapt_dt': False, 'propagator_cache': True},
+    {'adapt_dt': True},
+    {'adapt_dt': False, 'dtype': np.float32},
+])
+def test_output_file(tmp_path, options):
+    """The history written to a file matches the history in memory."""
+    in_memory = NEI(**kwargs, **options)
+    in_memory.simulate()
+
+    filename = str(tmp_path / 'history.h5')
+    streamed = NEI(**kwargs, **options, output_file=filename, output_block_size=7)
+    streamed.simulate()
+    results = streamed.results
+
+    assert results.output_file == filename
+    assert len(results._time) == 1
+    assert np.array_equal(results.time, in_memory.results.time)
+    assert np.array_equal(results.T_e, in_memory.results.T_e)
+    assert np.allclose(results.n_e, in_memory.results.n_e, rtol=1e-14)
+    for elem in streamed.elements:
+        assert np.array_equal(results.ionic_fractions[elem],
+                              in_memory.results.ionic_fractions[elem])
+        assert np.allclose(results.number_densities[elem],
+                           in_memory.results.number_densities[elem], rtol=1e-14)
+        assert np.array_equal(streamed.final.ionic_fractions[elem],
+                              in_memory.final.ionic_fractions[elem])
+
+    with h5py.File(filename, 'r') as f:
+        assert f['ionic_fractions/O'].chunks == (7, 9)
+        assert f['ionic_fractions/O'].compression == 'gzip'
+        assert f['ionic_fractions/O'].dtype == streamed.dtype
+
+
+def test_writer(tmp_path):
+    filename = str(tmp_path / 'blocks.h5')
+    with HDF5HistoryWriter(filename, {'H': 2}, block_size=4) as writer:
+        for start in range(0, 10, 4):
+            rows = np.arange(start, min(start + 4, 10), dtype=float)
+            writer.write({
+                'time': rows, 'T_e': rows, 'n_e': rows, 'n_H': rows,
+                'ionic_fractions': {'H': np.column_stack([rows, rows])},
+            })
+        assert writer.nrows == 10
+
+    with h5py.File(filename, 'r') as f:
+        assert np.array_equal(f['time'][()], np.arange(10))
+        assert f['ionic_fractions/H'].shape == (10, 2)
+
+    with pytest.raises(ValueError):
+        HDF5HistoryWriter(str(tmp_path / 'small.h5'), {'H': 2}, block_size=1)
+
+
+def test_output_file_chunks(tmp_path, monkeypatch):
+    """With an output file, the stepping kernel is given no more steps
+    at once than fit in one block."""
+    from .. import nei as nei_module
+
+    lengths = []
+    run_schedule = nei_module.run_schedule
+
+    def recording_run_schedule(tables, table_index, *args, **kwargs):
+        lengths.append(len(table_index))
+        return run_schedule(tables, table_index, *args, **kwargs)
+
+    monkeypatch.setattr(nei_module, 'run_schedule', recording_run_schedule)
+    sim = NEI(**kwargs, adapt_dt=False, output_file=str(tmp_path / 'history.h5'),
+              output_block_size=16)
+    sim.simulate()
+    assert sum(lengths) == 100
+    assert max(lengths) <= 16
+    assert len(sim.results.time) == 101
@@ -1,6 +1,6 @@
 import astropy.units as u
 from ..ionization_states import IonizationStates, particle_symbol
-from ..nei import NEI
+from ..nei import NEI, NEIError
 from ..eigenvaluetable import EigenData2
 import numpy as np
 import pytest
@@ -267,3 +267,255 @@ class TestNEI:
         assert initial.abundances == results.abundances
         for elem in initial.elements:
             assert np.allclose(results.ionic_fractions[elem][0, :], initial.ionic_fractions[elem])
+
+
+def test_simulation_results_units():
+    """The unit-free stepping loop returns results with units."""
+    sim = NEI(**tests['n function'])
+    sim.simulate()
+    results = sim.results
+
+    assert results.time.unit == u.s
+    assert results.T_e.unit == u.K
+    assert results.n_e.unit == u.cm ** -3
+    assert np.allclose(results.time.value, np.arange(0, 900, 100))
+
+    n_H = 1e9 * (1 + results.time.value)
+    assert np.allclose(results.n_elem['H'].to_value(u.cm ** -3), n_H)
+    n_e = sum(
+        results.number_densities[elem].value @ np.arange(results.nstates[elem])
+        for elem in results.elements
+    )
+    assert np.allclose(results.n_e.value, n_e)
+
+
+def test_adaptive_timestep():
+    """An adaptive run agrees with a run with a short fixed time step."""
+    kwargs = dict(
+        inputs={'H': [0.5, 0.5], 'He': [0.4, 0.3, 0.3], 'O': [1 / 9] * 9},
+        abundances={'H': 1, 'He': 0.1, 'O': 1e-3},
+        T_e=lambda time: 1e5 * (1 + time / (100 * u.s)) * u.K,
+        n=1e9 * u.cm ** -3,
+        time_max=1000 * u.s,
+        max_steps=20000,
+    )
+    reference = NEI(adapt_dt=False, dt=0.1 * u.s, **kwargs)
+    reference.simulate()
+
+    errors = []
+    for safety_factor in [1, 0.1]:
+        adaptive = NEI(adapt_dt=True, safety_factor=safety_factor, **kwargs)
+        adaptive.simulate()
+        assert np.isclose(adaptive.results.time[-1].value, 1000)
+        assert len(adaptive.results.time) < len(reference.results.time) / 10
+        errors.append(max(
+            np.max(np.abs(adaptive.final.ionic_fractions[elem] -
+                          reference.final.ionic_fractions[elem]))
+            for elem in adaptive.elements
+        ))
+
+    assert errors[0] < 1e-3
+    assert errors[1] < errors[0]
+
+    per_element = NEI(adapt_dt=True, **kwargs)
+    per_element._packed_tables = None
+    per_element.simulate()
+    for elem in per_element.elements:
+        assert np.allclose(per_element.results.ionic_fractions[elem][-1],
+                           reference.results.ionic_fractions[elem][-1],
+                           atol=1e-3)
+
+
+def test_segment_steps():
+    """Segment stepping lands on the input times and agrees with a run
+    with a short fixed time step."""
+    time_input = np.array([0, 100, 200, 500, 1000]) * u.s
+    kwargs = dict(
+        inputs={'H': [0.5, 0.5], 'He': [0.4, 0.3, 0.3], 'O': [1 / 9] * 9},
+        abundances={'H': 1, 'He': 0.1, 'O': 1e-3},
+        time_input=time_input,
+        T_e=np.array([1e5, 1e6, 1e6, 3e6, 5e5]) * u.K,
+        n=np.array([1e9, 1e9, 5e8, 5e8, 1e9]) * u.cm ** -3,
+        time_max=1000 * u.s,
+        max_steps=20000,
+    )
+    reference = NEI(adapt_dt=False, dt=0.1 * u.s, **kwargs)
+    reference.simulate()
+
+    segments = NEI(segment_steps=True, **kwargs)
+    segments.simulate()
+    assert np.all(np.isin(time_input.value, segments.results.time.value))
+    assert len(segments.results.time) < len(reference.results.time) / 10
+
+    per_element = NEI(segment_steps=True, **kwargs)
+    per_element._packed_tables = None
+    per_element.simulate()
+
+    for elem in segments.elements:
+        assert np.allclose(segments.final.ionic_fractions[elem],
+                           reference.final.ionic_fractions[elem], atol=1e-4)
+        assert np.allclose(segments.results.ionic_fractions[elem],
+                           per_element.results.ionic_fractions[elem],
+                           rtol=1e-10, atol=1e-14)
+
+
+def test_segment_steps_function():
+    """Segment stepping needs the breakpoints of the inputs."""
+    sim = NEI(**tests['n function'], segment_steps=True)
+    with pytest.raises(NEIError):
+        sim.simulate()
+
+
+@pytest.mark.parametrize('options', [
+    {'adapt_dt': False},
+    {'adapt_dt': False, 'propagator_cache': True},
+    {'adapt_dt': False, 'segment_steps': True},
+])
+def test_save_every(options):
+    """Storing every tenth step keeps those rows of the full history."""
+    kwargs = dict(
+        inputs=['H', 'He', 'O'],
+        abundances={'H': 1, 'He': 0.1, 'O': 1e-3},
+        time_input=np.array([0, 100]) * u.s,
+        T_e=np.array([1e5, 1e6]) * u.K,
+        n=np.array([1e9, 2e9]) * u.cm ** -3,
+        dt=1 * u.s,
+        max_steps=500,
+        **options,
+    )
+    full = NEI(**kwargs)
+    full.simulate()
+    decimated = NEI(save_every=10, **kwargs)
+    decimated.simulate()
+
+    # The final state is stored too
+    nsteps = len(full.results.time) - 1
+    rows = list(range(0, nsteps, 10)) + [nsteps]
+    assert len(decimated.results._time) == len(rows)
+    assert np.allclose(decimated.results.time, full.results.time[rows])
+    for elem in full.elements:
+        assert np.allclose(decimated.results.ionic_fractions[elem],
+                           full.results.ionic_fractions[elem][rows],
+                           rtol=1e-12, atol=1e-15)
+
+
+@pytest.mark.parametrize('options, atol', [
+    ({'adapt_dt': False, 'dt': 0.02 * u.s}, 1e-3),
+    ({'adapt_dt': False, 'dt': 0.02 * u.s, 'propagator_cache': True}, 1e-3),
+    ({'adapt_dt': True, 'safety_factor': 0.1}, 1e-3),
+    ({'segment_steps': True}, 1e-4),
+])
+def test_output_times(options, atol):
+    """The results are stored exactly at the output times."""
+    kwargs = dict(
+        inputs=['H', 'He', 'O'],
+        abundances={'H': 1, 'He': 0.1, 'O': 1e-3},
+        time_input=np.array([0, 100]) * u.s,
+        T_e=np.array([1e5, 1e6]) * u.K,
+        n=np.array([1e9, 2e9]) * u.cm ** -3,
+    )
+    reference = NEI(segment_steps=True, dt=0.01 * u.s, max_steps=20000, **kwargs)
+    reference.simulate()
+
+    output_times = np.array([10.5, 50, 99.25, 150]) * u.s
+    sim = NEI(output_times=output_times, max_steps=10000, **kwargs, **options)
+    sim.simulate()
+
+    # The output times within the simulation, and the final time
+    times = sim.results.time.value
+    assert np.array_equal(times, [0, 10.5, 50, 99.25, 100])
+    assert np.array_equal(times[1:-1], output_times.value[:3])
+
+    # The dense reference interpolated at the same times
+    for elem in sim.elements:
+        expected = np.column_stack([
+            np.interp(times, reference.results.time.value, column)
+            for column in reference.results.ionic_fractions[elem].T
+        ])
+        assert np.allclose(sim.results.ionic_fractions[elem], expected,
+                           rtol=0, atol=atol)
+
+
+def test_derived_densities():
+    """Number densities are derived from the stored ionic fractions and
+    cached until the results change."""
+    sim = NEI(**tests['n function'])
+    sim.simulate()
+    results = sim.results
+
+    assert not hasattr(results, '_number_densities')
+    number_densities = results.number_densities
+    assert results.number_densities['He'] is number_densities['He']
+    assert results.n_elem['He'] is results.n_elem['He']
+
+    for elem in results.elements:
+        assert np.allclose(
+            number_densities[elem].value,
+            results.ionic_fractions[elem] *
+            results.n_elem[elem].value[:, np.newaxis])
+    assert np.allclose(results.n_elem['He'].value,
+                       0.1 * results.n_elem['H'].value)
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'segment_steps': True},
+    {'propagator_cache': True},
+])
+def test_single_precision(options):
+    """Single precision agrees with double precision within the
+    documented bound."""
+    kwargs = dict(
+        inputs=['H', 'He', 'C', 'O'],
+        abundances={'H': 1, 'He': 0.1, 'C': 1e-4, 'O': 1e-4},
+        T_e=np.geomspace(1e4, 1e7, 11) * u.K,
+        n=np.full(11, 1e9) * u.cm ** -3,
+        time_input=np.linspace(0, 2000, 11) * u.s,
+        dt=1 * u.s,
+        adapt_dt=False,
+        **options,
+    )
+    expected = NEI(**kwargs)
+    expected.simulate()
+    sim = NEI(dtype=np.float32, **kwargs)
+    sim.simulate()
+
+    assert sim.dtype == np.float32
+    for elem in sim.elements:
+        ionic_fractions = sim.results.ionic_fractions[elem]
+        assert ionic_fractions.dtype == np.float32
+        assert np.allclose(ionic_fractions,
+                           expected.results.ionic_fractions[elem],
+                           rtol=0, atol=1e-3)
+    assert sim.results.n_e.dtype == np.float64
+
+
+def test_single_precision_warning():
+    """Elements whose tables are too poorly conditioned for single
+    precision are reported."""
+    sim = NEI(inputs=['H', 'Fe'], abundances={'H': 1, 'Fe': 1e-5},
+              T_e=1e6 * u.K, n=1e9 * u.cm ** -3, time_max=10 * u.s,
+              dt=1 * u.s, adapt_dt=False, dtype=np.float32)
+    with pytest.warns(UserWarning, match="Fe"):
+        sim.simulate()
+
+    with pytest.raises(NEIError):
+        NEI(**tests['basic'], dtype=np.int64)
+
+
+def test_simulation_history():
+    """The ionic fractions of all elements are columns of one history
+    array, from which the electron density is computed."""
+    sim = NEI(**tests['n function'])
+    sim.simulate()
+    results = sim.results
+
+    assert results._history.flags.c_contiguous
+    assert results._history.shape == (len(results.time), 5)
+    for elem, offset in results._offsets.items():
+        assert np.array_equal(results.ionic_fractions[elem],
+                              results._history[:, offset])
+    n_e = results.n_elem['H'].value * sum(
+        results.ionic_fractions[elem] @ np.arange(results.nstates[elem]) *
+        results.abundances[elem] for elem in results.elements)
+    assert np.allclose(results.n_e.value, n_e, rtol=1e-14)
@@ -0,0 +1,107 @@
+import astropy.units as u
+import numpy as np
+import pytest
+
+from ..eigenregistry import get_eigendata
+from ..eigenvaluetable import EigenData2
+from ..nei import NEI
+from ..packed import PackedEigenTables
+from ..propagator import advance
+
+elements = ['H', 'He', 'C', 'O']
+
+
+@pytest.fixture(scope='module')
+def packed():
+    return PackedEigenTables({elem: get_eigendata(elem) for elem in elements})
+
+
+def test_pack_unpack(packed):
+    ionic_fractions = {
+        elem: np.random.dirichlet(np.ones(get_eigendata(elem)._nstates))
+        for elem in elements
+    }
+    array = packed.pack(ionic_fractions)
+    assert array.shape == (len(elements), 9)
+    assert np.all(array[~packed.mask] == 0)
+    for elem, row in packed.unpack(array).items():
+        assert np.array_equal(row, ionic_fractions[elem])
+
+
+@pytest.mark.parametrize('T_e_index', [1, 250, 450])
+def test_advance(packed, T_e_index):
+    f0 = {elem: np.full(get_eigendata(elem)._nstates,
+                        1 / get_eigendata(elem)._nstates)
+          for elem in elements}
+    ft = packed.advance(packed.pack(f0), T_e_index, 1e10)
+    assert np.all(ft[~packed.mask] == 0)
+    for elem, row in packed.unpack(ft).items():
+        eigendata = get_eigendata(elem)
+        expected = advance(
+            f0[elem],
+            eigendata.eigenvalues(T_e_index=T_e_index),
+            eigendata.eigenvectors(T_e_index=T_e_index),
+            eigendata.eigenvector_inverses(T_e_index=T_e_index),
+            1e10,
+        )
+        assert np.allclose(row, expected, rtol=1e-10, atol=1e-15)
+
+
+def test_tables_cache():
+    packed = PackedEigenTables(
+        {elem: get_eigendata(elem) for elem in elements}, max_entries=2)
+    first = packed.tables(10)
+    assert packed.tables(10) is first
+    packed.tables(11)
+    packed.tables(12)
+    assert packed.tables(10) is not first
+
+
+def test_different_grids():
+    eigendata = {
+        'H': get_eigendata('H'),
+        'He': EigenData2('He', temperature_window=(1e5, 1e7)),
+    }
+    with pytest.raises(ValueError):
+        PackedEigenTables(eigendata)
+
+
+def test_single_precision():
+    eigendata = {elem: get_eigendata(elem) for elem in ['H', 'O', 'Fe']}
+    packed = PackedEigenTables(eigendata, dtype=np.float32)
+    assert packed.pack({'H': [0, 1], 'O': [1] + [0] * 8,
+                        'Fe': [1] + [0] * 26}).dtype == np.float32
+    assert all(table.dtype == np.float32 for table in packed.tables(100))
+
+    errors = packed.rounding_error()
+    assert errors['H'] < errors['O'] < 0.1 < errors['Fe']
+    assert eigendata['O']._condition_number is not None
+    assert PackedEigenTables(eigendata).rounding_error()['O'] < 1e-10
+
+    with pytest.raises(ValueError):
+        PackedEigenTables(eigendata, dtype=np.int32)
+
+
+def test_nei_packed():
+    kwargs = dict(
+        inputs=elements,
+        abundances={'H': 1, 'He': 0.1, 'C': 1e-4, 'O': 1e-4},
+        T_e=lambda time: 1e5 * (1 + time / (100 * u.s)) * u.K,
+        n=1e9 * u.cm ** -3,
+        time_max=400 * u.s,
+        dt=10 * u.s,
+        adapt_dt=False,
+        max_steps=40,
+    )
+    packed = NEI(**kwargs)
+    packed.simulate()
+    assert packed._packed_state is not None
+
+    per_element = NEI(**kwargs)
+    per_element._packed_tables = None
+    per_element.simulate()
+
+    for elem in elements:
+        assert np.allclose(packed.results.ionic_fractions[elem],
+                           per_element.results.ionic_fractions[elem],
+                           rtol=1e-10, atol=1e-15)
@@ -0,0 +1,97 @@
+import astropy.units as u
+import numpy as np
+import pytest
+from scipy.linalg import expm
+
+from ..eigenregistry import get_eigendata
+from ..nei import NEI
+from ..propagator import PropagatorCache, advance
+
+
+def _rate_matrix(eigendata, index):
+    c = eigendata._ionization_rate[index]
+    r = eigendata._recombination_rate[index]
+    return np.diag(c[:-1], 1) + np.diag(r[1:], -1) - np.diag(c + r)
+
+
+@pytest.mark.parametrize('element', ['He', 'O'])
+def test_propagator(element):
+    eigendata = get_eigendata(element)
+    cache = PropagatorCache(eigendata, rtol=0)
+    for index in [1, 150, 300]:
+        propagator = cache.propagator(index, 1e10)
+        expected = expm(_rate_matrix(eigendata, index) * 1e10)
+        assert np.allclose(propagator, expected, atol=1e-8)
+        assert cache.propagator(index, 1e10) is propagator
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+def test_quantized_n_e_dt():
+    cache = PropagatorCache(get_eigendata('O'), rtol=1e-6)
+    propagator = cache.propagator(100, 1e10)
+    assert cache.propagator(100, 1e10 * (1 + 1e-8)) is propagator
+    assert cache.propagator(100, 1e10 * (1 + 1e-5)) is not propagator
+    with pytest.raises(ValueError):
+        cache.propagator(100, -1.0)
+
+
+def test_eviction():
+    cache = PropagatorCache(get_eigendata('He'), max_entries=3)
+    for index in range(5):
+        cache.propagator(index, 1e9)
+    assert len(cache) == 3
+    cache.propagator(4, 1e9)
+    assert cache.hits == 1
+    cache.propagator(0, 1e9)
+    assert cache.misses == 6
+
+
+def test_precompute():
+    eigendata = get_eigendata('O')
+    cache = PropagatorCache(eigendata)
+    cache.precompute(1e10)
+    assert len(cache) == len(eigendata.temperature_grid)
+    single = PropagatorCache(eigendata).propagator(250, 1e10)
+    assert np.allclose(cache.propagator(250, 1e10), single, rtol=1e-12, atol=0)
+    assert cache.misses == 0
+
+    with pytest.raises(ValueError):
+        PropagatorCache(eigendata, max_entries=10).precompute(1e10)
+
+
+def test_nei_propagator_cache():
+    kwargs = dict(
+        inputs=['H', 'He', 'O'],
+        abundances={'H': 1, 'He': 0.1, 'O': 1e-4},
+        T_e=lambda time: 1e5 * (1 + time / (100 * u.s)) * u.K,
+        n=1e9 * u.cm ** -3,
+        time_max=400 * u.s,
+        dt=10 * u.s,
+        adapt_dt=False,
+        max_steps=40,
+    )
+    expected = NEI(**kwargs)
+    expected.simulate()
+    cached = NEI(propagator_cache=True, **kwargs)
+    cached.simulate()
+    for element in expected.elements:
+        assert np.allclose(cached.final.ionic_fractions[element],
+                           expected.final.ionic_fractions[element], atol=1e-10)
+    assert cached.propagator_cache['O'].misses > 0
+
+    with pytest.raises(Exception):
+        NEI(propagator_cache='yes', **kwargs)
+
+
+@pytest.mark.parametrize('element', ['H', 'C', 'O'])
+def test_advance(element):
+    eigendata = get_eigendata(element)
+    nstates = eigendata._nstates
+    f0 = np.full(nstates, 1 / nstates)
+    for index in [1, 200, 400]:
+        evals = eigendata.eigenvalues(T_e_index=index)
+        evect = eigendata.eigenvectors(T_e_index=index)
+        evect_inverse = eigendata.eigenvector_inverses(T_e_index=index)
+        expected = f0 @ (evect_inverse @ np.diag(np.exp(evals * 1e10)) @ evect)
+        assert np.allclose(advance(f0, evals, evect, evect_inverse, 1e10),
+                           expected, rtol=1e-10, atol=1e-15)
@@ -0,0 +1,48 @@
+import h5py
+import numpy as np
+import pytest
+
+from ..eigenvaluetable import EigenData2
+from ..ratedata import (default_rate_file, read_rates, read_rates_for_elements,
+                        write_element_major_rates)
+
+elements = ['H', 'He', 'O', 'Fe']
+
+
+@pytest.mark.parametrize('element, atomic_numb', [('H', 1), ('O', 8), ('Fe', 26)])
+def test_read_rates_hyperslab(element, atomic_numb):
+    """Compare the hyperslab read with the full arrays."""
+    with h5py.File(default_rate_file(), 'r') as f:
+        temperature_grid = f['te_gird'][:]
+        c_ori = f['ioniz_rate'][:]
+        r_ori = f['recomb_rate'][:]
+
+    grid, c_rate, r_rate = read_rates(element)
+    nstates = atomic_numb + 1
+    assert np.array_equal(grid, temperature_grid)
+    assert c_rate.shape == r_rate.shape == (len(grid), nstates)
+    for i in range(nstates - 1):
+        assert np.array_equal(c_rate[:, i], c_ori[i, atomic_numb - 1, :])
+        assert np.array_equal(r_rate[:, i + 1], r_ori[i, atomic_numb - 1, :])
+    assert np.all(c_rate[:, -1] == 0) and np.all(r_rate[:, 0] == 0)
+
+
+def test_read_rates_for_elements():
+    rates = read_rates_for_elements(elements)
+    for element in elements:
+        for expected, actual in zip(read_rates(element), rates[element]):
+            assert np.array_equal(expected, actual)
+
+
+def test_element_major_layout(tmp_path):
+    filename = str(tmp_path / 'element_major.h5')
+    write_element_major_rates(filename)
+    for element in elements:
+        for expected, actual in zip(read_rates(element),
+                                    read_rates(element, filename)):
+            assert np.array_equal(expected, actual)
+
+    original = EigenData2('O')
+    converted = EigenData2('O', rate_file=filename)
+    assert np.array_equal(original.eigenvalues(T_e_index=200),
+                          converted.eigenvalues(T_e_index=200))
@@ -0,0 +1,88 @@
+import shutil
+
+import astropy.units as u
+import h5py
+import numpy as np
+import pytest
+
+from ..nei import NEI
+from ..ratedata import default_rate_file
+from ..runner import balance_chunks, estimate_steps, run_simulations
+
+configs = [
+    dict(inputs=['H', 'He', 'O'], abundances={'H': 1, 'He': 0.1, 'O': 1e-3},
+         T_e=T_e * u.K, n=1e9 * u.cm ** -3, time_max=100 * u.s,
+         dt=dt * u.s, adapt_dt=False, max_steps=100)
+    for T_e, dt in zip(np.geomspace(1e5, 1e7, 6), [1, 2, 5, 1, 10, 4])
+]
+
+
+def test_estimate_steps():
+    assert estimate_steps(configs[0]) == 100
+    assert estimate_steps(configs[4]) == 10
+    assert estimate_steps(dict(configs[0], adapt_dt=True, max_steps=50)) == 50
+    time_input = np.linspace(0, 100, 5) * u.s
+    segments = dict(inputs=['H'], time_input=time_input, segment_steps=True)
+    assert estimate_steps(segments) == 4
+
+
+def test_balance_chunks():
+    costs = [7, 5, 4, 3, 3, 2]
+    chunks = balance_chunks(costs, 3)
+    assert sorted(index for chunk in chunks for index in chunk) == list(range(6))
+    totals = [sum(costs[index] for index in chunk) for chunk in chunks]
+    assert totals == sorted(totals, reverse=True)
+    assert max(totals) - min(totals) <= 2
+    assert len(balance_chunks(costs, 10)) == 6
+
+
+@pytest.mark.parametrize('executor', ['serial', 'threads', 'processes'])
+def test_run_simulations(executor):
+    expected = []
+    for config in configs:
+        sim = NEI(**config)
+        sim.simulate()
+        expected.append(sim.results)
+
+    indices = []
+    for index, results in run_simulations(configs, executor=executor, max_workers=2):
+        indices.append(index)
+        for elem in results.elements:
+            assert np.allclose(results.ionic_fractions[elem],
+                               expected[index].ionic_fractions[elem],
+                               rtol=1e-12, atol=1e-15)
+    assert sorted(indices) == list(range(len(configs)))
+
+
+def test_run_simulations_invalid_executor():
+    with pytest.raises(ValueError):
+        list(run_simulations(configs, executor='cluster'))
+
+
+@pytest.fixture(scope='module')
+def scaled_rate_file(tmp_path_factory):
+    """A rate file with ten times the ionization rates of the default."""
+    filename = str(tmp_path_factory.mktemp('rates') / 'scaled_rates.h5')
+    shutil.copy(default_rate_file(), filename)
+    with h5py.File(filename, 'r+') as f:
+        f['ioniz_rate'][...] = 10 * f['ioniz_rate'][()]
+    return filename
+
+
+@pytest.mark.parametrize('executor', ['serial', 'processes'])
+def test_run_simulations_rate_file(executor, scaled_rate_file):
+    """The simulations use the tables of the given rate file."""
+    default = NEI(**configs[0])
+    default.simulate()
+    scaled = NEI(**configs[0], rate_file=scaled_rate_file)
+    scaled.simulate()
+    assert scaled.rate_file == scaled_rate_file
+    assert not np.allclose(scaled.results.ionic_fractions['O'],
+                           default.results.ionic_fractions['O'], atol=1e-3)
+
+    results = dict(run_simulations(configs[:1], executor=executor, max_workers=2,
+                                   rate_file=scaled_rate_file))
+    for elem in scaled.elements:
+        assert np.allclose(results[0].ionic_fractions[elem],
+                           scaled.results.ionic_fractions[elem],
+                           rtol=1e-12, atol=1e-15)
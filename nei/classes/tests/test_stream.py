@@ -0,0 +1,72 @@
+import asyncio
+
+import astropy.units as u
+import numpy as np
+import pytest
+
+from ..nei import NEI, NEIError
+from ..stream import NEIStream
+
+abundances = {'H': 1, 'He': 0.1, 'O': 1e-3}
+time = np.linspace(0, 1000, 21) * u.s
+T_e = np.geomspace(1e5, 3e6, 21) * u.K
+n = np.linspace(1e9, 5e8, 21) * u.cm ** -3
+
+
+def test_stream_matches_segment_steps():
+    """Streaming the samples gives the same steps as segment stepping."""
+    sim = NEI(inputs=['H', 'He', 'O'], abundances=abundances, time_input=time,
+              T_e=T_e, n=n, segment_steps=True, max_steps=10000)
+    sim.simulate()
+
+    stream = NEIStream(['H', 'He', 'O'], abundances)
+    times = []
+    for sample_time, ionic_fractions in stream.run(zip(time, T_e, n)):
+        times.append(sample_time)
+
+    assert np.allclose(times, time.value)
+    assert stream.nsteps == len(sim.results.time) - 1
+    for elem in stream.elements:
+        assert np.allclose(stream.ionic_fractions[elem],
+                           sim.final.ionic_fractions[elem],
+                           rtol=1e-10, atol=1e-14)
+    assert np.isclose(stream.n_e.value, sim.results.n_e[-1].value)
+
+
+def test_stream_single_precision():
+    expected = NEIStream(['H', 'He', 'O'], abundances, dt=1 * u.s)
+    stream = NEIStream(['H', 'He', 'O'], abundances, dt=1 * u.s, dtype=np.float32)
+    for sample in zip(time, T_e, n):
+        expected.push(*sample)
+        ionic_fractions = stream.push(*sample)
+        for elem in stream.elements:
+            assert ionic_fractions[elem].dtype == np.float32
+            assert np.allclose(ionic_fractions[elem], expected.ionic_fractions[elem],
+                               rtol=0, atol=1e-3)
+
+
+def test_stream_async():
+    async def samples():
+        for sample in zip(time.value, T_e.value, n.value):
+            yield sample
+
+    async def consume(stream):
+        return [sample_time async for sample_time, _ in stream.run_async(samples())]
+
+    stream = NEIStream({'H': [1, 0], 'He': [1, 0, 0], 'O': [1] + [0] * 8},
+                       abundances, dt=10 * u.s)
+    times = asyncio.run(consume(stream))
+    assert np.allclose(times, time.value)
+    assert stream.nsteps >= 100
+    assert stream.time == time[-1]
+
+
+def test_stream_errors():
+    stream = NEIStream(['H', 'He'], abundances)
+    with pytest.raises(NEIError):
+        stream.ionic_fractions
+    stream.push(10 * u.s, 1e5 * u.K, 1e9 * u.cm ** -3)
+    with pytest.raises(NEIError):
+        stream.push(5 * u.s, 1e5 * u.K, 1e9 * u.cm ** -3)
+    with pytest.raises(NEIError):
+        stream.push(20 * u.s, -1 * u.K, 1e9 * u.cm ** -3)
@@ -1,5 +1,10 @@
 """
-This is the docstring for the examplesubpkg package.  Normally you would
-have whatever.py files in this directory implementing some modules, but this
-is just an example sub-package, so it doesn't actually do anything.
+Kernels that run the stepping loop of non-equilibrium ionization
+simulations outside of the Python interpreter.
+
+The compiled kernel is built from ``_kernels.pyx`` when the package is
+installed with Cython available.  Otherwise a pure NumPy version of the
+same kernel is used.
 """
+
+from .kernels import *
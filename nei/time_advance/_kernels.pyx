@@ -0,0 +1,88 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+"""
+The compiled version of `nei.time_advance.kernels.run_schedule`.  The
+arguments are validated by the Python wrapper.
+
+The tables and the history are either all double or all single
+precision.  The electron density, the projections, and the
+normalization are accumulated in double precision in both cases, and
+only the stored ionic fractions are rounded.
+"""
+
+import numpy as np
+
+from cython cimport floating
+from libc.math cimport exp
+
+
+def run_schedule(const floating[:, :, ::1] evals,
+                 const floating[:, :, :, ::1] evect,
+                 const floating[:, :, :, ::1] evect_inverse,
+                 const Py_ssize_t[::1] table_index,
+                 const double[::1] n_H,
+                 const double[::1] dt,
+                 const double[:, ::1] charge_weights,
+                 const Py_ssize_t[::1] nstates,
+                 f0):
+
+    cdef Py_ssize_t nsteps = table_index.shape[0]
+    cdef Py_ssize_t nelem = charge_weights.shape[0]
+    cdef Py_ssize_t nmax = charge_weights.shape[1]
+
+    if floating is float:
+        dtype = np.float32
+    else:
+        dtype = np.float64
+
+    history_array = np.zeros((nsteps + 1, nelem, nmax), dtype=dtype)
+    history_array[0] = f0
+    cdef floating[:, :, ::1] history = history_array
+    cdef double[::1] coefficients = np.empty(nmax)
+    cdef double[::1] ft = np.empty(nmax)
+
+    cdef Py_ssize_t step, elem, i, j, n, t
+    cdef double n_e, n_e_dt, f, total
+
+    with nogil:
+        for step in range(nsteps):
+            t = table_index[step]
+
+            # The electron density is set by the current charge states
+            n_e = 0.0
+            for elem in range(nelem):
+                for i in range(nstates[elem]):
+                    n_e = n_e + charge_weights[elem, i] * history[step, elem, i]
+            n_e_dt = n_e * n_H[step] * dt[step]
+
+            for elem in range(nelem):
+                n = nstates[elem]
+
+                # Project onto the eigenbasis and scale
+                for j in range(n):
+                    coefficients[j] = 0.0
+                for i in range(n):
+                    f = history[step, elem, i]
+                    if f != 0.0:
+                        for j in range(n):
+                            coefficients[j] += f * evect_inverse[t, elem, i, j]
+                for j in range(n):
+                    coefficients[j] *= exp(evals[t, elem, j] * n_e_dt)
+
+                # Project back
+                for j in range(n):
+                    ft[j] = 0.0
+                for i in range(n):
+                    f = coefficients[i]
+                    for j in range(n):
+                        ft[j] += f * evect[t, elem, i, j]
+
+                # Clip negative fractions and renormalize
+                total = 0.0
+                for j in range(n):
+                    if ft[j] < 0.0:
+                        ft[j] = 0.0
+                    total = total + ft[j]
+                for j in range(n):
+                    history[step + 1, elem, j] = <floating> (ft[j] / total)
+
+    return history_array
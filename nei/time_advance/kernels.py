@@ -0,0 +1,174 @@
+"""
+Run the whole stepping loop of a simulation on packed eigenvalue tables.
+
+The tables and the ionic fractions may be stored in single precision to
+halve the memory and bandwidth they use.  The electron density and the
+renormalization of each step are then still computed in double
+precision, so that the charge states stay normalized to double
+precision and the rounding errors of successive steps do not drift.
+"""
+
+import numpy as np
+
+try:
+    from . import _kernels
+except ImportError:
+    _kernels = None
+
+__all__ = ['run_schedule', 'compiled_kernel_available']
+
+
+def compiled_kernel_available() -> bool:
+    """Return `True` if the compiled stepping kernel was built."""
+    return _kernels is not None
+
+
+def _run_schedule_numpy(evals, evect, evect_inverse, table_index, n_H, dt,
+                        charge_weights, nstates, f0):
+    """
+    The pure NumPy version of the stepping kernel.  The products are
+    computed in the precision of the tables, and the electron density
+    and the renormalization in double precision.
+    """
+    history = np.empty((len(table_index) + 1,) + f0.shape, dtype=evals.dtype)
+    history[0] = f0
+
+    for step, t in enumerate(table_index):
+        f = history[step]
+        n_e_dt = np.sum(charge_weights * f, dtype=np.float64) * n_H[step] * dt[step]
+        coefficients = np.matmul(f[:, np.newaxis, :], evect_inverse[t])
+        coefficients *= np.exp(evals[t] * n_e_dt)[:, np.newaxis, :]
+        ft = np.matmul(coefficients, evect[t])[:, 0, :]
+        np.clip(ft, 0.0, None, out=ft)
+        history[step + 1] = ft / np.sum(ft, axis=1, keepdims=True, dtype=np.float64)
+
+    return history
+
+
+def run_schedule(tables, table_index, n_H, dt, charge_weights, f0,
+                 nstates=None, compiled=None, dtype=None) -> np.ndarray:
+    """
+    Advance the packed ionic fractions of several elements over a
+    schedule of time steps.
+
+    At each step, the electron density is computed from the current
+    ionic fractions, the fractions are advanced with the eigenvalue
+    tables of the step, and negative fractions are set to zero before
+    each element is renormalized.
+
+    Parameters
+    ----------
+    tables : `tuple`
+        The stacked ``(evals, evect, evect_inverse)`` with shapes
+        ``(ntables, nelem, nmax)`` and ``(ntables, nelem, nmax, nmax)``,
+        padded as by `~nei.classes.packed.PackedEigenTables.stack`.
+
+    table_index : `~numpy.ndarray`
+        The index into ``tables`` of each of the ``nsteps`` steps.
+
+    n_H : `~numpy.ndarray`
+        The hydrogen number density in cm**-3 at the start of each step.
+
+    dt : `~numpy.ndarray`
+        The length of each step in seconds.
+
+    charge_weights : `~numpy.ndarray`
+        The abundance relative to hydrogen of each element times the
+        charge of each state, with shape ``(nelem, nmax)``, so that the
+        electron density is ``n_H * sum(charge_weights * f)``.
+
+    f0 : `~numpy.ndarray`
+        The initial packed ionic fractions with shape ``(nelem, nmax)``.
+
+    nstates : `~numpy.ndarray`, optional
+        The number of charge states of each element.  The padding
+        beyond ``nstates`` is skipped by the compiled kernel.  Defaults
+        to ``nmax`` for every element.
+
+    compiled : `bool`, optional
+        Whether to use the compiled kernel.  Defaults to using it when
+        it is available.
+
+    dtype : optional
+        The floating point type of the tables and of the history, either
+        `numpy.float64` or `numpy.float32`.  Defaults to `numpy.float32`
+        if the eigenvalues are single precision, and to `numpy.float64`
+        otherwise.
+
+    Returns
+    -------
+    history : `~numpy.ndarray`
+        The packed ionic fractions at the start of the first step and at
+        the end of every step, with shape ``(nsteps + 1, nelem, nmax)``
+        and type ``dtype``.
+
+    Raises
+    ------
+    ValueError
+        If the shapes of the arguments do not agree, ``table_index`` is
+        out of range, or ``dtype`` is not supported.
+
+    ImportError
+        If ``compiled`` is `True` and the compiled kernel is not
+        available.
+
+    Notes
+    -----
+    In single precision, each step rounds the ionic fractions and the
+    products with the rounded eigenvectors, which gives an error of
+    about the estimate of
+    `~nei.classes.packed.PackedEigenTables.rounding_error`.  Because
+    every step is renormalized in double precision and the charge
+    states relax toward equilibrium, the errors of successive steps
+    decay instead of accumulating once the steps span more than a
+    relaxation time.  For the elements up to neon, the differences from
+    double precision stay below ``1e-3``.  The eigenvectors of heavier
+    elements such as iron are too poorly conditioned for single
+    precision.
+    """
+    if dtype is None:
+        dtype = np.float32 \
+            if np.asarray(tables[0]).dtype == np.float32 else np.float64
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float64):
+        raise ValueError(f"Unsupported dtype: {dtype}.")
+
+    evals, evect, evect_inverse = (
+        np.ascontiguousarray(array, dtype=dtype) for array in tables)
+    table_index = np.ascontiguousarray(table_index, dtype=np.intp)
+    n_H = np.ascontiguousarray(
+        np.broadcast_to(n_H, table_index.shape), dtype=np.float64)
+    dt = np.ascontiguousarray(
+        np.broadcast_to(dt, table_index.shape), dtype=np.float64)
+    charge_weights = np.ascontiguousarray(charge_weights, dtype=np.float64)
+    f0 = np.ascontiguousarray(f0, dtype=dtype)
+
+    ntables, nelem, nmax = evals.shape
+    if evect.shape != (ntables, nelem, nmax, nmax) \
+            or evect_inverse.shape != evect.shape:
+        raise ValueError("The shapes of the eigenvalue tables do not agree.")
+    if f0.shape != (nelem, nmax) or charge_weights.shape != (nelem, nmax):
+        raise ValueError(
+            f"f0 and charge_weights must have shape {(nelem, nmax)}.")
+    if table_index.ndim != 1:
+        raise ValueError("table_index must be one-dimensional.")
+    if table_index.size and not \
+            0 <= table_index.min() <= table_index.max() < ntables:
+        raise ValueError("table_index is out of range.")
+
+    if nstates is None:
+        nstates = np.full(nelem, nmax, dtype=np.intp)
+    else:
+        nstates = np.ascontiguousarray(nstates, dtype=np.intp)
+        if nstates.shape != (nelem,) or np.any(nstates < 1) \
+                or np.any(nstates > nmax):
+            raise ValueError("Invalid nstates.")
+
+    if compiled is None:
+        compiled = _kernels is not None
+    elif compiled and _kernels is None:
+        raise ImportError("The compiled stepping kernel is not available.")
+
+    run = _kernels.run_schedule if compiled else _run_schedule_numpy
+    return run(evals, evect, evect_inverse, table_index, n_H, dt,
+               charge_weights, nstates, f0)
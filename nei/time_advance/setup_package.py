@@ -1,6 +1,20 @@
 # Licensed under a 3-clause BSD style license - see LICENSE.rst
 from __future__ import absolute_import
 
+import os
+
+from distutils.extension import Extension
+
+ROOT = os.path.relpath(os.path.dirname(__file__))
+
+
+def get_extensions():
+    sources = [os.path.join(ROOT, '_kernels.pyx')]
+    # 'numpy' is replaced by the NumPy include directory by astropy_helpers
+    include_dirs = ['numpy']
+    return [Extension('nei.time_advance._kernels', sources=sources,
+                      include_dirs=include_dirs)]
+
 
 def get_package_data():
-    return {'packagename.example_subpkg': ['data/*']}
+    return {'nei.time_advance': ['data/*']}
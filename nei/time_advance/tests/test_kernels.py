@@ -0,0 +1,123 @@
+import astropy.units as u
+import numpy as np
+import pytest
+
+from ...classes.eigenregistry import get_eigendata
+from ...classes.nei import NEI
+from ...classes.packed import PackedEigenTables
+from ..kernels import compiled_kernel_available, run_schedule
+
+elements = ['H', 'He', 'C', 'O']
+abundances = {'H': 1, 'He': 0.1, 'C': 1e-4, 'O': 1e-4}
+
+kernels = [False, pytest.param(True, marks=pytest.mark.skipif(
+    not compiled_kernel_available(),
+    reason="The compiled kernel is not available."))]
+
+
+@pytest.fixture(scope='module')
+def packed():
+    return PackedEigenTables({elem: get_eigendata(elem) for elem in elements})
+
+
+def _schedule(packed, nsteps=50):
+    T_e = np.geomspace(1e4, 1e7, nsteps)
+    T_e_indices, table_index = np.unique(
+        packed.temperature_index(T_e), return_inverse=True)
+    n_H = np.linspace(1e9, 1e8, nsteps)
+    dt = np.full(nsteps, 5.0)
+    f0 = packed.pack({elem: np.full(n, 1 / n) for elem, n in
+                      zip(elements, packed.nstates)})
+    return T_e_indices, table_index, n_H, dt, f0
+
+
+@pytest.mark.parametrize('compiled', kernels)
+def test_run_schedule(packed, compiled):
+    T_e_indices, table_index, n_H, dt, f0 = _schedule(packed)
+    charge_weights = packed.charge_weights(abundances)
+    history = run_schedule(packed.stack(T_e_indices), table_index, n_H, dt,
+                           charge_weights, f0, nstates=packed.nstates,
+                           compiled=compiled)
+    assert history.shape == (len(dt) + 1,) + f0.shape
+
+    f = f0
+    for step, t in enumerate(T_e_indices[table_index]):
+        n_e = n_H[step] * np.sum(charge_weights * f)
+        f = packed.advance(f, t, n_e * dt[step])
+        np.clip(f, 0, None, out=f)
+        f /= f.sum(axis=1, keepdims=True)
+        assert np.allclose(history[step + 1], f, rtol=1e-10, atol=1e-14)
+    assert np.all(history[:, ~packed.mask] == 0)
+
+
+@pytest.mark.skipif(not compiled_kernel_available(),
+                    reason="The compiled kernel is not available.")
+def test_compiled_matches_numpy(packed):
+    T_e_indices, table_index, n_H, dt, f0 = _schedule(packed, nsteps=500)
+    args = (packed.stack(T_e_indices), table_index, n_H, dt,
+            packed.charge_weights(abundances), f0)
+    assert np.allclose(run_schedule(*args, compiled=True),
+                       run_schedule(*args, compiled=False),
+                       rtol=1e-10, atol=1e-14)
+
+
+@pytest.mark.parametrize('compiled', kernels)
+def test_run_schedule_single_precision(packed, compiled):
+    """Single precision agrees with double precision within the
+    documented bound over many steps."""
+    packed32 = PackedEigenTables(
+        {elem: get_eigendata(elem) for elem in elements}, dtype=np.float32)
+    T_e_indices, table_index, n_H, dt, f0 = _schedule(packed, nsteps=2000)
+    charge_weights = packed.charge_weights(abundances)
+    expected = run_schedule(packed.stack(T_e_indices), table_index, n_H, dt,
+                            charge_weights, f0, compiled=compiled)
+    history = run_schedule(packed32.stack(T_e_indices), table_index, n_H, dt,
+                           charge_weights, f0, compiled=compiled)
+    assert history.dtype == np.float32
+    assert np.allclose(history, expected, rtol=0, atol=1e-3)
+    assert np.allclose(history.sum(axis=2, dtype=np.float64), 1, rtol=0, atol=1e-6)
+
+
+def test_run_schedule_invalid(packed):
+    T_e_indices, table_index, n_H, dt, f0 = _schedule(packed)
+    tables = packed.stack(T_e_indices)
+    charge_weights = packed.charge_weights(abundances)
+    with pytest.raises(ValueError):
+        run_schedule(tables, table_index + len(T_e_indices), n_H, dt,
+                     charge_weights, f0)
+    with pytest.raises(ValueError):
+        run_schedule(tables, table_index, n_H, dt, charge_weights, f0[1:])
+    with pytest.raises(ValueError):
+        run_schedule(tables, table_index, n_H, dt, charge_weights, f0,
+                     nstates=[2, 3, 7, 10])
+    with pytest.raises(ValueError):
+        run_schedule(tables, table_index, n_H, dt, charge_weights, f0,
+                     dtype=np.float16)
+
+
+def test_nei_schedule():
+    kwargs = dict(
+        inputs=elements,
+        abundances=abundances,
+        T_e=np.array([1e4, 1e6, 3e6]) * u.K,
+        n=np.array([1e10, 1e9, 1e9]) * u.cm ** -3,
+        time_input=np.array([0, 100, 1000]) * u.s,
+        time_max=995 * u.s,
+        dt=10 * u.s,
+        adapt_dt=False,
+        max_steps=200,
+    )
+    schedule = NEI(**kwargs)
+    schedule.simulate()
+
+    stepped = NEI(**kwargs)
+    stepped._packed_tables = None
+    stepped.simulate()
+
+    assert np.array_equal(schedule.results.time, stepped.results.time)
+    assert schedule.results.time[-1] == 995 * u.s
+    assert np.allclose(schedule.results.n_e, stepped.results.n_e, rtol=1e-10)
+    for elem in elements:
+        assert np.allclose(schedule.results.ionic_fractions[elem],
+                           stepped.results.ionic_fractions[elem],
+                           rtol=1e-8, atol=1e-14)